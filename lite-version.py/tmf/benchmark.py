@@ -0,0 +1,243 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+CORPORA_KINDS = ["random", "low-entropy", "periodic", "text", "zeros"]
+
+DEFAULT_CORPUS_SIZE = 1 << 15
+
+# names and widths
+TABLE_COLUMNS = [("stage", 12), ("finder", 6), ("corpus", 12), ("size", 9),
+                 ("min", 3), ("max", 3), ("seconds", 8), ("pos/s", 10),
+                 ("MB/s", 7), ("RSS MB", 7), ("matches", 9), ("bytes", 10)]
+
+
+def generate_corpus(kind: str, size: int, seed: int = 0) -> bytes:
+    generator = random.Random(seed)
+    if kind == "random":
+        return bytes(generator.getrandbits(8) for _ in range(size))
+    elif kind == "low-entropy":
+        return bytes(generator.choices(b"abcd", weights=[8, 4, 2, 1], k=size))
+    elif kind == "periodic":
+        period = bytes(generator.getrandbits(8)
+                       for _ in range(generator.randint(1, 64)))
+        data = bytearray((period * (size // len(period) + 1))[:size])
+        # rare mutations break up otherwise trivially long matches
+        for _ in range(size // 1000):
+            data[generator.randrange(size)] = generator.getrandbits(8)
+        return bytes(data)
+    elif kind == "text":
+        words = ["".join(generator.choice("etaoinshrdlucmfwyp")
+                         for _ in range(generator.randint(1, 9)))
+                 for _ in range(1000)]
+        weights = [1 / (rank + 1) for rank in range(len(words))]
+        text = []
+        text_size = 0
+        while text_size < size:
+            sentence = " ".join(generator.choices(
+                words, weights=weights, k=generator.randint(3, 15)))
+            text.append(sentence.capitalize() + ".\n")
+            text_size += len(text[-1])
+        return "".join(text).encode("ascii")[:size]
+    elif kind == "zeros":
+        return bytes(size)
+    else:
+        raise ValueError("Unknown corpus kind: " + kind)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def measure_stage(stage: str, finder_name: str, min_match: int,
+                  max_match: int, input_file_name: str,
+                  output_file_name: str, essential_file_name: str) -> \
+        Tuple[float, Optional[int]]:
+    # runs in fresh process, so peak RSS covers only this stage
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        if stage == "find-matches":
+            from tmf.match_finder import find_all_essential_matches
+            with open(input_file_name, "rb") as input_file, \
+                    open(output_file_name, "w+b") as essential_matches_file:
+                find_all_essential_matches(finder_name, min_match, max_match,
+                                           input_file, essential_matches_file,
+                                           None)
+        elif stage == "interpolate":
+            from tmf.interpolator import interpolate
+            with open(essential_file_name, "rb") as essential_matches_file, \
+                    open(output_file_name, "w+b") as \
+                    interpolated_matches_file:
+                interpolate(essential_matches_file, interpolated_matches_file,
+                            None)
+        elif stage == "verify":
+            from tmf.verifier import verify
+            with open(input_file_name, "rb") as input_file, \
+                    open(essential_file_name, "rb") as \
+                    interpolated_matches_file:
+                verify(finder_name, input_file, interpolated_matches_file,
+                       None)
+        else:
+            raise ValueError("Unknown stage: " + stage)
+        seconds = time.perf_counter() - start_time
+    return seconds, peak_rss_bytes()
+
+
+def run_stage(stage: str, finder_name: str, corpus_name: str,
+              min_match: int, max_match: int, input_file_name: str,
+              output_file_name: str, essential_file_name: str) -> \
+        Dict[str, Any]:
+    from tmf.header import Header
+    from tmf.match_codec import count_matches
+    input_size = os.path.getsize(input_file_name)
+    result: Dict[str, Any] = {
+        "stage": stage, "finder": finder_name, "corpus": corpus_name,
+        "input_size": input_size, "min_match": min_match,
+        "max_match": max_match, "seconds": None,
+        "positions_per_second": None, "megabytes_per_second": None,
+        "peak_rss_bytes": None, "matches": None, "output_bytes": None,
+        "error": None}
+    try:
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            seconds, peak_rss = pool.apply(measure_stage, (
+                stage, finder_name, min_match, max_match, input_file_name,
+                output_file_name, essential_file_name))
+    except Exception as e:
+        result["error"] = repr(e)
+        return result
+    result["seconds"] = seconds
+    result["peak_rss_bytes"] = peak_rss
+    if seconds > 0:
+        result["positions_per_second"] = input_size / seconds
+        result["megabytes_per_second"] = input_size / seconds / 1e6
+    if stage != "verify":
+        with open(output_file_name, "rb") as matches_file:
+            header = Header.from_file(matches_file)
+            result["matches"] = count_matches(matches_file, header)
+        result["output_bytes"] = os.path.getsize(output_file_name)
+    return result
+
+
+def run_benchmark(finder_names: List[str],
+                  corpora: List[Tuple[str, str]],
+                  match_settings: List[Tuple[int, int]],
+                  verifier_name: str, work_directory: str) -> \
+        List[Dict[str, Any]]:
+    # corpora are pairs of name and input file name
+    results = []
+    essential_file_name = os.path.join(work_directory, "essential")
+    interpolated_file_name = os.path.join(work_directory, "interpolated")
+    for corpus_name, input_file_name in corpora:
+        for min_match, max_match in match_settings:
+            reference_output = None
+            reference_finder_name = None
+            for finder_name in finder_names:
+                output_file_name = os.path.join(work_directory,
+                                                "essential-" + finder_name)
+                result = run_stage("find-matches", finder_name, corpus_name,
+                                   min_match, max_match, input_file_name,
+                                   output_file_name, "")
+                print_result(result)
+                results.append(result)
+                if result["error"] is not None:
+                    continue
+                with open(output_file_name, "rb") as output_file:
+                    output = output_file.read()
+                if reference_output is None:
+                    reference_output = output
+                    reference_finder_name = finder_name
+                    os.replace(output_file_name, essential_file_name)
+                else:
+                    os.remove(output_file_name)
+                    if output != reference_output:
+                        result["error"] = \
+                            "output differs from " + reference_finder_name
+                        print("Warning: " + finder_name + " " +
+                              result["error"])
+            if reference_output is None:
+                continue
+            for stage, finder_name, output_file_name, matches_file_name in [
+                    ("interpolate", "", interpolated_file_name,
+                     essential_file_name),
+                    ("verify", verifier_name, "", interpolated_file_name)]:
+                result = run_stage(stage, finder_name, corpus_name,
+                                   min_match, max_match, input_file_name,
+                                   output_file_name, matches_file_name)
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def print_header() -> None:
+    print(" ".join(name.rjust(width) for name, width in TABLE_COLUMNS))
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    def show(value: Any, scale: float = 1, digits: int = 0) -> str:
+        return "-" if value is None else f"{value / scale:.{digits}f}"
+
+    cells = [result["stage"], result["finder"], result["corpus"],
+             str(result["input_size"]), str(result["min_match"]),
+             str(result["max_match"]), show(result["seconds"], digits=3),
+             show(result["positions_per_second"]),
+             show(result["megabytes_per_second"], digits=3),
+             show(result["peak_rss_bytes"], 1 << 20, 1),
+             show(result["matches"]), show(result["output_bytes"])]
+    print(" ".join(cell.rjust(width)
+                   for cell, (_, width) in zip(cells, TABLE_COLUMNS)) +
+          ("" if result["error"] is None else "  " + result["error"]))
+
+
+def benchmark(finder_names: List[str], input_file_names: List[str],
+              corpora_kinds: List[str], corpus_size: int,
+              match_settings: List[Tuple[int, int]], verifier_name: str,
+              json_file_name: Optional[str]) -> None:
+    with tempfile.TemporaryDirectory() as work_directory:
+        corpora = []
+        for kind in corpora_kinds:
+            corpus_file_name = os.path.join(work_directory, "corpus-" + kind)
+            with open(corpus_file_name, "wb") as corpus_file:
+                corpus_file.write(generate_corpus(kind, corpus_size))
+            corpora.append((kind, corpus_file_name))
+        for input_file_name in input_file_names:
+            corpora.append((os.path.basename(input_file_name),
+                            input_file_name))
+        print_header()
+        results = run_benchmark(finder_names, corpora, match_settings,
+                                verifier_name, work_directory)
+    if json_file_name is not None:
+        with open(json_file_name, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+            json_file.write("\n")
+    print("Done")
@@ -0,0 +1,161 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import struct
+from array import array
+from typing import BinaryIO, List, Optional, Tuple
+
+from tmf import number_codec
+from tmf.header import Header
+from tmf.match_codec import WORD_TYPECODE
+
+DEFAULT_CHECKPOINT_INTERVAL = 1 << 16
+
+
+class InterpolationCheckpoints:
+    # interpolation state saved before every interval-th position, so
+    # interpolation can start at any checkpoint instead of at position 0
+    HEADER_SIZE_ON_DISK: int = 8 + 4 + 4 + 2 + 2 + 4 + 8
+    HEADER_STRUCT = struct.Struct(">QIIHHIQ")
+
+    MAGIC_NUMBER = 2346246323452357351
+
+    def __init__(self, input_size: int, interval: int, min_match: int,
+                 max_match: int, max_offset: Optional[int] = None):
+        self.input_size = input_size
+        self.interval = interval
+        self.min_match = min_match
+        self.max_match = max_match
+        self.max_offset = max_offset
+        # total number of essential match records, known after last position
+        self.records_count: Optional[int] = None
+        # for every checkpoint: index of the first essential match record
+        # with position not lower than checkpoint position, inherited max
+        # match and inherited offsets for lengths from 1 to max match
+        self.record_indices = array("Q")
+        self.inherited_max_matches = array(WORD_TYPECODE)
+        self.inherited_offsets = array(WORD_TYPECODE)
+
+    def entry_struct(self) -> struct.Struct:
+        return struct.Struct(">QI" + str(self.max_match) + "I")
+
+    def validate(self) -> None:
+        assert 0 <= self.input_size < (1 << 31)
+        assert 1 <= self.interval < (1 << 31)
+        assert 1 <= self.min_match <= self.max_match <= 120
+        assert self.max_offset is None or 1 <= self.max_offset < (1 << 31)
+        assert self.records_count is not None
+        checkpoints_count = self.checkpoints_count()
+        assert len(self.record_indices) == checkpoints_count
+        assert len(self.inherited_max_matches) == checkpoints_count
+        assert len(self.inherited_offsets) == \
+            checkpoints_count * self.max_match
+        for checkpoint in range(checkpoints_count):
+            position = checkpoint * self.interval
+            inherited_max_match = self.inherited_max_matches[checkpoint]
+            assert inherited_max_match < self.max_match
+            assert checkpoint == 0 or self.record_indices[checkpoint - 1] <= \
+                self.record_indices[checkpoint]
+            assert self.record_indices[checkpoint] <= self.records_count
+            offsets_start = checkpoint * self.max_match - 1
+            for match_length in range(self.min_match,
+                                      inherited_max_match + 1):
+                assert 1 <= self.inherited_offsets[
+                    offsets_start + match_length] < position
+
+    def checkpoints_count(self) -> int:
+        return (self.input_size + self.interval - 1) // self.interval
+
+    def check_header(self, header: Header, records_count: int) -> None:
+        assert header.is_for_essential_matches()
+        assert header.input_size == self.input_size and \
+            header.min_match == self.min_match and \
+            header.max_match == self.max_match and \
+            header.max_offset == self.max_offset and \
+            records_count == self.records_count, \
+            "checkpoints must be made for the same essential matches file"
+
+    def on_position(self, position: int, records_count: int,
+                    inherited_offsets: List[int],
+                    inherited_max_match: int) -> None:
+        # must be called before interpolating matches for each position
+        if position % self.interval == 0:
+            assert len(self.record_indices) == position // self.interval
+            self.record_indices.append(records_count)
+            # it's -1 after position without matches, which means the same
+            self.inherited_max_matches.append(max(inherited_max_match, 0))
+            self.inherited_offsets.extend(
+                inherited_offsets[1:self.max_match + 1])
+
+    def finish(self, records_count: int) -> None:
+        assert len(self.record_indices) == self.checkpoints_count()
+        self.records_count = records_count
+
+    def nearest(self, position: int) -> Tuple[int, int, List[int], int]:
+        # (checkpoint position, record index, inherited offsets, inherited
+        # max match) of the last checkpoint not after given position
+        assert 0 <= position < self.input_size
+        checkpoint = position // self.interval
+        offsets_start = checkpoint * self.max_match
+        return (checkpoint * self.interval, self.record_indices[checkpoint],
+                [0] + self.inherited_offsets[
+                    offsets_start:offsets_start + self.max_match].tolist(),
+                self.inherited_max_matches[checkpoint])
+
+    @staticmethod
+    def checkpoints_file_name(matches_file_name: str) -> str:
+        return matches_file_name + ".ckp"
+
+    @staticmethod
+    def from_file(checkpoints_file: BinaryIO):
+        magic_number, input_size, interval, min_match, max_match, \
+            max_offset, records_count = \
+            InterpolationCheckpoints.HEADER_STRUCT.unpack(
+                number_codec.read_exactly(
+                    checkpoints_file,
+                    InterpolationCheckpoints.HEADER_SIZE_ON_DISK))
+        assert magic_number == InterpolationCheckpoints.MAGIC_NUMBER
+        # 0 stands for unbounded offsets of non-windowed matches
+        result = InterpolationCheckpoints(input_size, interval, min_match,
+                                          max_match, max_offset or None)
+        result.records_count = records_count
+        entry_struct = result.entry_struct()
+        for _ in range(result.checkpoints_count()):
+            record_index, inherited_max_match, *inherited_offsets = \
+                entry_struct.unpack(number_codec.read_exactly(
+                    checkpoints_file, entry_struct.size))
+            result.record_indices.append(record_index)
+            result.inherited_max_matches.append(inherited_max_match)
+            result.inherited_offsets.extend(inherited_offsets)
+        result.validate()
+        return result
+
+    def to_file(self, output_file: BinaryIO) -> None:
+        self.validate()
+        output_file.write(InterpolationCheckpoints.HEADER_STRUCT.pack(
+            InterpolationCheckpoints.MAGIC_NUMBER, self.input_size,
+            self.interval, self.min_match, self.max_match,
+            self.max_offset or 0, self.records_count))
+        entry_struct = self.entry_struct()
+        for checkpoint in range(self.checkpoints_count()):
+            offsets_start = checkpoint * self.max_match
+            output_file.write(entry_struct.pack(
+                self.record_indices[checkpoint],
+                self.inherited_max_matches[checkpoint],
+                *self.inherited_offsets[
+                    offsets_start:offsets_start + self.max_match]))
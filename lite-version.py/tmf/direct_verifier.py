@@ -0,0 +1,378 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import contextlib
+import mmap
+import os
+import random
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import numpy
+
+from tmf import suffix_array
+from tmf.header import Header
+from tmf.match_codec import open_matches_reader
+from tmf.match_file import MatchFile
+
+# number of match records checked at once
+CHUNK_SIZE = 1 << 18
+
+InputBytes = Union[bytes, mmap.mmap]
+MatchesArrays = Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+# (start position, end position, matches for positions in that range)
+PositionsRangeMatches = Tuple[int, int, MatchesArrays]
+
+
+def verify_directly(input_file: BinaryIO,
+                    interpolated_matches_file: BinaryIO,
+                    sample_period: Optional[int] = None,
+                    seed: int = 0) -> None:
+    # checks interpolated matches against input without running a match
+    # finder: every match is compared with input, then optimality and
+    # completeness is checked either for all positions using suffix array
+    # or for one randomly chosen position out of every sample_period ones,
+    # matches are checked in chunks covering consecutive positions, so
+    # memory use doesn't grow with size of interpolated matches file
+    assert sample_period is None or sample_period >= 1
+    input_file_size = os.path.getsize(input_file.name)
+    # read and validate interpolated matches file header
+    interpolated_matches_file.seek(0)
+    header = Header.from_file(interpolated_matches_file)
+    header.validate()
+    assert header.is_for_interpolated_matches()
+    assert input_file_size == header.input_size
+    matches_count = 0
+    compared_matches = 0
+    compared_bytes = 0
+    checked_positions = 0
+    with map_input(input_file) as input_bytes:
+        input_data = numpy.frombuffer(input_bytes, dtype=numpy.uint8)
+        expected_matches = find_longest_optimal_matches(input_data, header) \
+            if sample_period is None else None
+        samples = sample_positions(header.input_size, sample_period, seed) \
+            if sample_period is not None else iter([])
+        next_sample = next(samples, None)
+        for start_position, end_position, (positions, lengths, offsets) in \
+                split_by_positions(
+                    read_matches_blocks(interpolated_matches_file),
+                    header.input_size):
+            check_layout(header, start_position, end_position, positions,
+                         lengths, offsets)
+            longest = find_longest(positions, offsets)
+            chunk_compared_bytes = check_genuineness(
+                input_data, positions[longest], lengths[longest],
+                offsets[longest])
+            matches_count += len(positions)
+            compared_matches += int(longest.sum())
+            compared_bytes += chunk_compared_bytes
+            if expected_matches is not None:
+                check_with_suffix_array(
+                    header, start_position, end_position,
+                    (positions, lengths, offsets), longest, expected_matches)
+                checked_positions = end_position
+            while next_sample is not None and next_sample < end_position:
+                check_sample(input_bytes, header, positions, offsets,
+                             next_sample)
+                checked_positions += 1
+                next_sample = next(samples, None)
+        del input_data
+    # coverage statistics
+    print("Matches: " + f"{matches_count:,}".replace(",", " ") +
+          ", compared with input: " +
+          f"{compared_matches:,}".replace(",", " ") + " (" +
+          f"{compared_bytes:,}".replace(",", " ") + " bytes)")
+    print("Positions checked for optimality and completeness: " +
+          f"{checked_positions:,}".replace(",", " ") + " of " +
+          f"{input_file_size:,}".replace(",", " ") +
+          (f" ({100 * checked_positions / input_file_size:.2f}%)"
+           if input_file_size > 0 else ""))
+    print("Verification OK")
+
+
+@contextlib.contextmanager
+def map_input(input_file: BinaryIO) -> Iterator[InputBytes]:
+    if os.fstat(input_file.fileno()).st_size == 0:
+        # empty file can't be memory mapped
+        yield b""
+        return
+    input_map = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield input_map
+    finally:
+        try:
+            input_map.close()
+        except BufferError:
+            # arrays viewing input still use the mapping, it will be
+            # released together with them
+            pass
+
+
+def read_matches_blocks(matches_file: BinaryIO) -> Iterator[MatchesArrays]:
+    # fixed size match records are read through memory map
+    matches_file.seek(0)
+    header, matches_reader = open_matches_reader(matches_file)
+    if header.is_compact():
+        while True:
+            columns = matches_reader.read_columns()
+            if len(columns[0]) == 0:
+                break
+            yield tuple(numpy.frombuffer(column, dtype=numpy.uint32)
+                        .astype(numpy.int64) for column in columns)
+        assert matches_file.read(1) == b"", \
+            "no further data expected in matches file"
+        return
+    with MatchFile(matches_file) as match_file:
+        for start_index in range(0, len(match_file), CHUNK_SIZE):
+            records = match_file[start_index:start_index + CHUNK_SIZE]
+            assert not records["padding"].any(), "padding must be zero"
+            yield (records["position"].astype(numpy.int64),
+                   records["length"].astype(numpy.int64),
+                   records["offset"].astype(numpy.int64))
+            del records
+            match_file.release(start_index, start_index + CHUNK_SIZE)
+
+
+def concatenate_columns(parts: List[MatchesArrays]) -> MatchesArrays:
+    if not parts:
+        return tuple(numpy.zeros(0, dtype=numpy.int64) for _ in range(3))
+    return tuple(numpy.concatenate(column_parts)
+                 for column_parts in zip(*parts))
+
+
+def split_by_positions(blocks: Iterator[MatchesArrays],
+                       input_size: int) -> Iterator[PositionsRangeMatches]:
+    # regroups blocks of matches into chunks covering consecutive ranges of
+    # positions, matches with the same position are never split between
+    # chunks and last chunk ends at input end
+    start_position = 0
+    pending_parts = []
+    pending_count = 0
+    for block in blocks:
+        pending_parts.append(block)
+        pending_count += len(block[0])
+        if pending_count < CHUNK_SIZE:
+            continue
+        positions, lengths, offsets = concatenate_columns(pending_parts)
+        # matches at last position can continue in next block
+        last_position = int(positions[-1])
+        earlier = numpy.nonzero(positions != last_position)[0]
+        if len(earlier) == 0:
+            pending_parts = [(positions, lengths, offsets)]
+            continue
+        split = int(earlier[-1]) + 1
+        end_position = max(last_position, start_position)
+        yield start_position, end_position, \
+            (positions[:split], lengths[:split], offsets[:split])
+        pending_parts = [(positions[split:], lengths[split:], offsets[split:])]
+        pending_count = len(positions) - split
+        start_position = end_position
+    yield start_position, max(input_size, start_position), \
+        concatenate_columns(pending_parts)
+
+
+def check_layout(header: Header, start_position: int, end_position: int,
+                 positions: numpy.ndarray, lengths: numpy.ndarray,
+                 offsets: numpy.ndarray) -> None:
+    # every position has matches of all lengths from min match up to some
+    # max match, sorted by length, offsets grow with length
+    if len(positions) == 0:
+        return
+    assert positions[-1] < header.input_size, \
+        "match position must be within input"
+    assert ((header.min_match <= lengths) &
+            (lengths <= header.max_match)).all(), \
+        "match length must be within limits"
+    assert ((1 <= offsets) & (offsets <= positions)).all(), \
+        "match source must be within input"
+    assert header.max_offset is None or \
+        (offsets <= header.max_offset).all(), "match must be within window"
+    assert start_position <= positions[0] and \
+        positions[-1] < end_position and \
+        (positions[1:] >= positions[:-1]).all(), \
+        "matches must be sorted by position"
+    same_position = positions[1:] == positions[:-1]
+    assert (lengths[0] == header.min_match) and \
+        (lengths[1:][~same_position] == header.min_match).all(), \
+        "matches at every position must start at min match"
+    assert (lengths[1:][same_position] ==
+            lengths[:-1][same_position] + 1).all(), \
+        "matches at every position must have consecutive lengths"
+    assert (offsets[1:][same_position] >=
+            offsets[:-1][same_position]).all(), \
+        "offsets must not decrease with match length"
+
+
+def find_longest(positions: numpy.ndarray,
+                 offsets: numpy.ndarray) -> numpy.ndarray:
+    # marks the longest match with given offset at every position, shorter
+    # ones are its prefixes
+    longest = numpy.ones(len(positions), dtype=bool)
+    longest[:-1] = (positions[1:] != positions[:-1]) | \
+        (offsets[1:] != offsets[:-1])
+    return longest
+
+
+def check_genuineness(input_data: numpy.ndarray, targets: numpy.ndarray,
+                      remaining_lengths: numpy.ndarray,
+                      offsets: numpy.ndarray) -> int:
+    # returns number of compared bytes
+    assert (targets + remaining_lengths <= len(input_data)).all(), \
+        "match must end within input"
+    sources = targets - offsets
+    compared_bytes = 0
+    byte_index = 0
+    while len(targets) > 0:
+        assert (input_data[sources + byte_index] ==
+                input_data[targets + byte_index]).all(), \
+            "match must be present in input"
+        compared_bytes += len(targets)
+        byte_index += 1
+        longer = remaining_lengths > byte_index
+        targets = targets[longer]
+        sources = sources[longer]
+        remaining_lengths = remaining_lengths[longer]
+    return compared_bytes
+
+
+def find_longest_optimal_matches(input_data: numpy.ndarray,
+                                 header: Header) -> MatchesArrays:
+    # optimal offsets for every match length are derived from suffix array,
+    # only the longest match with given offset at every position is kept,
+    # it implies all shorter ones, so their number is much lower than
+    # number of interpolated matches
+    input_size = len(input_data)
+    suffixes, prefix_ranks = suffix_array.build_suffix_array(
+        input_data, header.max_match)
+    lcp_array = suffix_array.build_lcp_array(suffixes, prefix_ranks,
+                                             header.max_match)
+    del prefix_ranks
+    positions_parts = []
+    lengths_parts = []
+    offsets_parts = []
+    longer_offsets = numpy.zeros(input_size, dtype=numpy.int32)
+    for match_length in range(header.max_match, header.min_match - 1, -1):
+        offsets = suffix_array.find_optimal_offsets(suffixes, lcp_array,
+                                                    match_length)
+        if header.max_offset is not None:
+            offsets[offsets > header.max_offset] = 0
+        longest_positions = numpy.nonzero(
+            (offsets > 0) & (offsets != longer_offsets))[0] \
+            .astype(numpy.int32)
+        positions_parts.append(longest_positions)
+        lengths_parts.append(
+            numpy.full(len(longest_positions), match_length,
+                       dtype=numpy.uint8))
+        offsets_parts.append(offsets[longest_positions])
+        longer_offsets = offsets
+    del suffixes, lcp_array, longer_offsets
+    positions = numpy.concatenate(positions_parts)
+    lengths = numpy.concatenate(lengths_parts)
+    offsets = numpy.concatenate(offsets_parts)
+    del positions_parts, lengths_parts, offsets_parts
+    order = numpy.lexsort((lengths, positions))
+    return positions[order], lengths[order], offsets[order]
+
+
+def check_with_suffix_array(header: Header, start_position: int,
+                            end_position: int, matches: MatchesArrays,
+                            longest: numpy.ndarray,
+                            expected_matches: MatchesArrays) -> None:
+    # longest matches with given offsets describe all matches, so they are
+    # compared with longest optimal matches for the same positions
+    expected_positions, expected_lengths, expected_offsets = \
+        expected_matches
+    first_index, end_index = numpy.searchsorted(
+        expected_positions, [start_position, end_position])
+    expected = tuple(column[first_index:end_index]
+                     for column in expected_matches)
+    found = tuple(column[longest] for column in matches)
+    common_count = min(len(found[0]), len(expected[0]))
+    differences = numpy.zeros(common_count, dtype=bool)
+    for found_column, expected_column in zip(found, expected):
+        differences |= \
+            found_column[:common_count] != expected_column[:common_count]
+    if len(found[0]) == len(expected[0]) and not differences.any():
+        return
+    # find first difference for error message
+    index = int(numpy.argmax(differences)) if differences.any() \
+        else common_count
+    position = min(int(column[index]) for column in [found[0], expected[0]]
+                   if index < len(column))
+    positions, _, offsets = matches
+    found_offsets = offsets[positions == position].tolist()
+    expected_offsets = []
+    at_position = expected[0] == position
+    for length, offset in zip(expected[1][at_position].tolist(),
+                              expected[2][at_position].tolist()):
+        expected_offsets.extend([offset] * (
+            length - header.min_match + 1 - len(expected_offsets)))
+    raise wrong_matches_error(header, position, found_offsets,
+                              expected_offsets)
+
+
+def sample_positions(input_size: int, sample_period: int,
+                     seed: int) -> Iterator[int]:
+    # one randomly chosen position out of every sample_period ones
+    generator = random.Random(seed)
+    for period_start in range(0, input_size, sample_period):
+        yield period_start + generator.randrange(
+            min(sample_period, input_size - period_start))
+
+
+def check_sample(input_bytes: InputBytes, header: Header,
+                 positions: numpy.ndarray, offsets: numpy.ndarray,
+                 position: int) -> None:
+    # optimal matches at sampled position are recomputed by searching
+    # backwards in input
+    first_index = numpy.searchsorted(positions, position, "left")
+    end_index = numpy.searchsorted(positions, position, "right")
+    found_offsets = offsets[first_index:end_index].tolist()
+    expected_offsets = find_optimal_offsets_at(input_bytes, header, position)
+    if found_offsets != expected_offsets:
+        raise wrong_matches_error(header, position, found_offsets,
+                                  expected_offsets)
+
+
+def wrong_matches_error(header: Header, position: int,
+                        found_offsets: List[int],
+                        expected_offsets: List[int]) -> ValueError:
+    return ValueError(
+        "wrong matches at position " + str(position) +
+        ", found offsets " + str(found_offsets) +
+        " for lengths starting at " + str(header.min_match) +
+        ", optimal offsets " + str(expected_offsets))
+
+
+def find_optimal_offsets_at(input_bytes: InputBytes, header: Header,
+                            position: int) -> List[int]:
+    # offsets for consecutive match lengths starting at min match; source
+    # of longer match can't be closer than source of shorter one, so every
+    # search ends where previous one found its source
+    window_start = 0 if header.max_offset is None else \
+        max(0, position - header.max_offset)
+    max_match = min(header.max_match, header.input_size - position)
+    optimal_offsets = []
+    source_pos = position - 1
+    for match_length in range(header.min_match, max_match + 1):
+        source_pos = input_bytes.rfind(
+            input_bytes[position:position + match_length], window_start,
+            source_pos + match_length)
+        if source_pos < 0:
+            break
+        optimal_offsets.append(position - source_pos)
+    return optimal_offsets
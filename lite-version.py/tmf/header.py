@@ -16,59 +16,132 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 #
-from typing import BinaryIO
+import struct
+from typing import BinaryIO, Optional
 
 from tmf import number_codec
 
 
 class Header:
     SIZE_ON_DISK: int = 8 + 4 + 2 + 2
+    STRUCT = struct.Struct(">QIHH")
+    # windowed headers are followed by max offset and reserved bytes, so
+    # match records stay aligned
+    EXTENSION_SIZE_ON_DISK: int = 4 + 12
+    EXTENSION_STRUCT = struct.Struct(">I12x")
 
     ESSENTIAL_MATCHES_MAGIC_NUMBER = 3463562352346342432
     INTERPOLATED_MATCHES_MAGIC_NUMBER = 3765472453426534653
+    COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER = 3463562352346342434
+    COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER = 3765472453426534655
+    WINDOWED_ESSENTIAL_MATCHES_MAGIC_NUMBER = 3463562352346342436
+    WINDOWED_INTERPOLATED_MATCHES_MAGIC_NUMBER = 3765472453426534657
+    WINDOWED_COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER = 3463562352346342438
+    WINDOWED_COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER = 3765472453426534659
 
-    ALL_VALID_MAGIC_NUMBERS = {ESSENTIAL_MATCHES_MAGIC_NUMBER,
-                               INTERPOLATED_MATCHES_MAGIC_NUMBER}
+    ALL_VALID_MAGIC_NUMBERS = {
+        ESSENTIAL_MATCHES_MAGIC_NUMBER,
+        INTERPOLATED_MATCHES_MAGIC_NUMBER,
+        COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+        COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER,
+        WINDOWED_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+        WINDOWED_INTERPOLATED_MATCHES_MAGIC_NUMBER,
+        WINDOWED_COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+        WINDOWED_COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER}
 
     def __init__(self, magic_number: int, input_size: int,
-                 min_match: int, max_match: int):
+                 min_match: int, max_match: int,
+                 max_offset: Optional[int] = None):
         self.magic_number = magic_number
         self.input_size = input_size
         self.min_match = min_match
         self.max_match = max_match
+        # present only in windowed headers
+        self.max_offset = max_offset
 
     def validate(self) -> None:
         assert self.magic_number in Header.ALL_VALID_MAGIC_NUMBERS
         assert 0 <= self.input_size < (1 << 31)
         assert 1 <= self.min_match <= self.max_match <= 120
+        if self.is_windowed():
+            assert self.max_offset is not None and \
+                   1 <= self.max_offset < (1 << 31)
+        else:
+            assert self.max_offset is None
 
     def is_for_essential_matches(self) -> bool:
-        return self.magic_number == Header.ESSENTIAL_MATCHES_MAGIC_NUMBER
+        return self.magic_number in {
+            Header.ESSENTIAL_MATCHES_MAGIC_NUMBER,
+            Header.COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER}
 
     def is_for_interpolated_matches(self) -> bool:
-        return self.magic_number == Header.INTERPOLATED_MATCHES_MAGIC_NUMBER
+        return self.magic_number in {
+            Header.INTERPOLATED_MATCHES_MAGIC_NUMBER,
+            Header.COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_INTERPOLATED_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER}
+
+    def is_compact(self) -> bool:
+        return self.magic_number in {
+            Header.COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+            Header.COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER}
+
+    def is_windowed(self) -> bool:
+        return self.magic_number in {
+            Header.WINDOWED_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_INTERPOLATED_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER,
+            Header.WINDOWED_COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER}
+
+    def size_on_disk(self) -> int:
+        return Header.SIZE_ON_DISK + \
+            (Header.EXTENSION_SIZE_ON_DISK if self.is_windowed() else 0)
 
     @classmethod
     def for_essential_matches(cls, input_size: int,
-                              min_match: int, max_match: int):
-        return cls(cls.ESSENTIAL_MATCHES_MAGIC_NUMBER,
-                   input_size, min_match, max_match)
+                              min_match: int, max_match: int,
+                              compact: bool = False,
+                              max_offset: Optional[int] = None):
+        if max_offset is None:
+            magic_number = cls.COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER \
+                if compact else cls.ESSENTIAL_MATCHES_MAGIC_NUMBER
+        else:
+            magic_number = \
+                cls.WINDOWED_COMPACT_ESSENTIAL_MATCHES_MAGIC_NUMBER \
+                if compact else cls.WINDOWED_ESSENTIAL_MATCHES_MAGIC_NUMBER
+        return cls(magic_number, input_size, min_match, max_match, max_offset)
 
     @classmethod
     def for_interpolated_matches(cls, input_size: int,
-                                 min_match: int, max_match: int):
-        return cls(cls.INTERPOLATED_MATCHES_MAGIC_NUMBER,
-                   input_size, min_match, max_match)
+                                 min_match: int, max_match: int,
+                                 compact: bool = False,
+                                 max_offset: Optional[int] = None):
+        if max_offset is None:
+            magic_number = cls.COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER \
+                if compact else cls.INTERPOLATED_MATCHES_MAGIC_NUMBER
+        else:
+            magic_number = \
+                cls.WINDOWED_COMPACT_INTERPOLATED_MATCHES_MAGIC_NUMBER \
+                if compact else cls.WINDOWED_INTERPOLATED_MATCHES_MAGIC_NUMBER
+        return cls(magic_number, input_size, min_match, max_match, max_offset)
 
     @staticmethod
     def from_file(input_file: BinaryIO):
-        return Header(number_codec.read_big_endian_number(input_file, 8),
-                      number_codec.read_big_endian_number(input_file, 4),
-                      number_codec.read_big_endian_number(input_file, 2),
-                      number_codec.read_big_endian_number(input_file, 2))
+        header = Header(*Header.STRUCT.unpack(
+            number_codec.read_exactly(input_file, Header.SIZE_ON_DISK)))
+        if header.is_windowed():
+            header.max_offset, = Header.EXTENSION_STRUCT.unpack(
+                number_codec.read_exactly(input_file,
+                                          Header.EXTENSION_SIZE_ON_DISK))
+        return header
 
     def to_file(self, output_file: BinaryIO) -> None:
-        number_codec.write_big_endian_number(self.magic_number, output_file, 8)
-        number_codec.write_big_endian_number(self.input_size, output_file, 4)
-        number_codec.write_big_endian_number(self.min_match, output_file, 2)
-        number_codec.write_big_endian_number(self.max_match, output_file, 2)
+        output_file.write(Header.STRUCT.pack(
+            self.magic_number, self.input_size, self.min_match,
+            self.max_match))
+        if self.is_windowed():
+            output_file.write(Header.EXTENSION_STRUCT.pack(self.max_offset))
@@ -16,81 +16,100 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 #
-import os
-from typing import List, Optional, BinaryIO
+import itertools
+import multiprocessing
+from array import array
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, \
+    Tuple, Union
 
+from tmf import validation
+from tmf.checkpoints import InterpolationCheckpoints
 from tmf.header import Header
 from tmf.match import Match
+from tmf.match_codec import (WORD_TYPECODE, IterableMatchesReader,
+                             MatchesColumns, MatchesReader, count_matches,
+                             create_matches_writer,
+                             find_first_matches_at_positions,
+                             open_matches_reader)
+from tmf.match_collector import MatchCollector, StandardMatchCollector
+from tmf.match_finder import RANGES_PER_JOB
+from tmf.position_index import DEFAULT_INDEX_BLOCK_SIZE, PositionIndex
+from tmf.telemetry import ProgressReporter, Telemetry
 
 
-def interpolate(essential_matches_file: BinaryIO,
-                interpolated_matches_file: BinaryIO,
-                progress_period: Optional[int]) -> None:
-    # start reading essential matches file
-    essential_matches_header = Header.from_file(essential_matches_file)
-    essential_matches_header.validate()
+def open_essential_matches(essential_matches_file: BinaryIO,
+                           use_memory_map: bool = False) -> \
+        Tuple[Header, MatchesReader]:
+    if use_memory_map:
+        from tmf.match_file import MatchFile
+        essential_matches = MatchFile(essential_matches_file)
+        essential_matches_header = essential_matches.header
+        essential_matches_reader = essential_matches.reader()
+    else:
+        essential_matches_header, essential_matches_reader = \
+            open_matches_reader(essential_matches_file)
     assert essential_matches_header.is_for_essential_matches()
-    input_size = essential_matches_header.input_size
-    min_match = essential_matches_header.min_match
-    max_match = essential_matches_header.max_match
-    essential_matches_file_size = os.path.getsize(essential_matches_file.name)
-    assert essential_matches_file_size >= Header.SIZE_ON_DISK and \
-           (essential_matches_file_size - Header.SIZE_ON_DISK) \
-           % Match.SIZE_ON_DISK == 0
-    essential_matches_count = (essential_matches_file_size -
-                               Header.SIZE_ON_DISK) // Match.SIZE_ON_DISK
-    next_essential_match_index = 0
-    next_essential_match: Optional[Match] = None
-
-    def load_next_essential_match() -> None:
-        nonlocal next_essential_match_index, next_essential_match
-        if next_essential_match_index < essential_matches_count:
-            next_essential_match_index += 1
-            next_essential_match = Match.from_file(essential_matches_file)
-            next_essential_match.validate(min_match, max_match)
-        else:
-            next_essential_match = None
-
-    load_next_essential_match()
-    # start writing interpolated matches file
-    interpolated_matches_file_header = \
-        Header.for_interpolated_matches(input_size, min_match, max_match)
-    interpolated_matches_file_header.validate()
-    interpolated_matches_file_header.to_file(interpolated_matches_file)
-    # variables
-    assert progress_period is None or progress_period >= 1
-    next_progress_checkpoint = progress_period
-    current_essential_matches: List[Match] = []
-    inherited_offsets = [0] * (max_match + 1)
-    current_offsets = [0] * (max_match + 1)
-    inherited_max_match = 0
-    # process matches
-    for position in range(input_size):
+    return essential_matches_header, essential_matches_reader
+
+
+class InterpolationState:
+    # reconstructs offsets of optimal matches position by position from
+    # essential matches and offsets inherited from previous position
+    def __init__(self, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None):
+        self.min_match = min_match
+        self.max_match = max_match
+        self.max_offset = max_offset
+        self.position = -1
+        self.inherited_offsets = [0] * (max_match + 1)
+        # offsets buffer is reused for all positions
+        self.current_offsets = [0] * (max_match + 1)
+        self.inherited_max_match = 0
+
+    def restore(self, position: int, inherited_offsets: List[int],
+                inherited_max_match: int) -> None:
+        # continues interpolation at given position from state saved before
+        assert len(inherited_offsets) == self.max_match + 1
+        self.position = position - 1
+        self.inherited_offsets[:] = inherited_offsets
+        self.inherited_max_match = inherited_max_match
+
+    def next_position(self, essential_lengths: Sequence[int],
+                      essential_offsets: Sequence[int], start: int = 0,
+                      end: Optional[int] = None) -> int:
+        # essential matches for current position are given as columns in
+        # range [start, end) and must be sorted by length, returns max match
+        self.position += 1
+        position = self.position
+        min_match = self.min_match
+        inherited_offsets = self.inherited_offsets
+        current_offsets = self.current_offsets
+        inherited_max_match = self.inherited_max_match
         current_max_match = 0
-        # reading and validating essential matches for current position
-        current_essential_matches.clear()
-        while next_essential_match and \
-                next_essential_match.position == position:
-            current_essential_matches.append(next_essential_match)
-            load_next_essential_match()
-        for index in range(1, len(current_essential_matches)):
-            shorter = current_essential_matches[index - 1]
-            longer = current_essential_matches[index]
-            assert shorter.position == longer.position
-            assert shorter.length < longer.length
-            assert shorter.offset < longer.offset
-        # unrolling essential matches
+        checked = validation.checked(position)
+        max_offset = self.max_offset \
+            if self.max_offset is not None else position
+        # validating and unrolling essential matches
         next_match_length = min_match
-        for current_essential_match in current_essential_matches:
-            offset = position - current_essential_match.source
-            assert \
-                current_essential_match.length > inherited_max_match or \
-                offset < inherited_offsets[current_essential_match.length], \
-                "essential match must have smaller offset than inherited match"
-            while next_match_length <= current_essential_match.length:
+        previous_offset = 0
+        for index in range(start, len(essential_lengths)
+                           if end is None else end):
+            length = essential_lengths[index]
+            offset = essential_offsets[index]
+            if checked:
+                assert next_match_length <= length <= self.max_match
+                assert previous_offset < offset <= position
+                assert offset <= max_offset, \
+                    "essential match must be within window"
+                assert length > inherited_max_match or \
+                    offset < inherited_offsets[length], \
+                    "essential match must have smaller offset than " \
+                    "inherited match"
+            while next_match_length <= length:
                 current_offsets[next_match_length] = offset
-                current_max_match = next_match_length
                 next_match_length += 1
+            current_max_match = length
+            previous_offset = offset
         # merge inherited matches with current matches
         for match_length in range(min_match, inherited_max_match + 1):
             if match_length <= current_max_match:
@@ -101,20 +120,283 @@ def interpolate(essential_matches_file: BinaryIO,
                 current_offsets[match_length] = inherited_offsets[match_length]
                 assert match_length == max(current_max_match + 1, min_match)
                 current_max_match = match_length
-        # save current matches
-        for match_length in range(min_match, current_max_match + 1):
-            interpolated_match = Match.from_position_length_offset(
-                position, match_length, current_offsets[match_length])
-            interpolated_match.validate(min_match, max_match)
-            interpolated_match.to_file(interpolated_matches_file)
-        # inheriting matches
+        # inheriting matches, current offsets stay intact
         for inherited_match_length in range(1, current_max_match):
             inherited_offsets[inherited_match_length] = \
                 current_offsets[inherited_match_length + 1]
-        inherited_max_match = current_max_match - 1
+        self.inherited_max_match = current_max_match - 1
+        return current_max_match
+
+
+def interpolate_offsets(essential_matches: Union[MatchesReader,
+                                                 Iterable[Match]],
+                        input_size: int, min_match: int, max_match: int,
+                        max_offset: Optional[int] = None) -> \
+        Iterator[Tuple[int, List[int], int]]:
+    # yields (position, offsets, max match) for every position, offsets
+    # buffer is reused for all positions and must not be modified by consumer
+    # essential matches are read from file by reader or given as matches
+    # sorted by position and then by length
+    if isinstance(essential_matches, MatchesReader):
+        essential_matches_reader = essential_matches
+    else:
+        essential_matches_reader = IterableMatchesReader(essential_matches)
+    state = InterpolationState(min_match, max_match, max_offset)
+    # process matches
+    for position in range(input_size):
+        start, end = essential_matches_reader.read_run(position)
+        current_max_match = state.next_position(
+            essential_matches_reader.lengths,
+            essential_matches_reader.offsets, start, end)
+        yield position, state.current_offsets, current_max_match
+    assert not essential_matches_reader.has_next(), \
+        "essential matches must be sorted and within input"
+
+
+def interpolate_offsets_range(essential_matches_file: BinaryIO,
+                              checkpoints: InterpolationCheckpoints,
+                              start_position: int, end_position: int,
+                              use_memory_map: bool = False) -> \
+        Iterator[Tuple[int, List[int], int]]:
+    # same as interpolate_offsets, but only for positions in range
+    # [start_position, end_position), replays essential matches from the
+    # nearest checkpoint instead of from position 0
+    essential_matches_file.seek(0)
+    header = Header.from_file(essential_matches_file)
+    header.validate()
+    assert not header.is_compact(), \
+        "checkpoints require fixed size match records"
+    matches_count = count_matches(essential_matches_file, header)
+    checkpoints.check_header(header, matches_count)
+    assert 0 <= start_position <= end_position <= header.input_size
+    if start_position == end_position:
+        return
+    checkpoint_position, record_index, inherited_offsets, \
+        inherited_max_match = checkpoints.nearest(start_position)
+    if use_memory_map:
+        from tmf.match_file import MatchFile
+        essential_matches_reader = \
+            MatchFile(essential_matches_file).reader(record_index)
+    else:
+        essential_matches_file.seek(
+            header.size_on_disk() + record_index * Match.SIZE_ON_DISK)
+        essential_matches_reader = MatchesReader(
+            essential_matches_file, matches_count - record_index)
+    state = InterpolationState(header.min_match, header.max_match,
+                               header.max_offset)
+    state.restore(checkpoint_position, inherited_offsets,
+                  inherited_max_match)
+    for position in range(checkpoint_position, end_position):
+        start, end = essential_matches_reader.read_run(position)
+        current_max_match = state.next_position(
+            essential_matches_reader.lengths,
+            essential_matches_reader.offsets, start, end)
+        if position >= start_position:
+            yield position, state.current_offsets, current_max_match
+
+
+def write_checkpoints(essential_matches_file: BinaryIO,
+                      checkpoints_file: BinaryIO, interval: int,
+                      progress_period: Optional[int],
+                      use_memory_map: bool = False,
+                      telemetry_report: Optional[Telemetry] = None) -> None:
+    # start reading essential matches file
+    header, essential_matches_reader = \
+        open_essential_matches(essential_matches_file, use_memory_map)
+    assert not header.is_compact(), \
+        "checkpoints require fixed size match records"
+    checkpoints = InterpolationCheckpoints(header.input_size, interval,
+                                           header.min_match, header.max_match,
+                                           header.max_offset)
+    state = InterpolationState(header.min_match, header.max_match,
+                               header.max_offset)
+    reporter = ProgressReporter("checkpoint", header.input_size,
+                                progress_period, telemetry_report)
+    next_checkpoint = reporter.next_checkpoint(0)
+    matches_read = 0
+    # process matches
+    for position in range(header.input_size):
+        checkpoints.on_position(position, matches_read,
+                                state.inherited_offsets,
+                                state.inherited_max_match)
+        start, end = essential_matches_reader.read_run(position)
+        state.next_position(essential_matches_reader.lengths,
+                            essential_matches_reader.offsets, start, end)
+        matches_read += end - start
         # display progress status
-        if position + 1 == next_progress_checkpoint:
-            print("Progress status: processed " +
-                  f"{position + 1:,}".replace(",", " ") + " positions")
-            next_progress_checkpoint += progress_period
+        if position + 1 == next_checkpoint:
+            next_checkpoint = reporter.on_progress(position + 1)
+    assert not essential_matches_reader.has_next(), \
+        "essential matches must be sorted and within input"
+    reporter.finish()
+    checkpoints.finish(matches_read)
+    checkpoints.to_file(checkpoints_file)
     print("Done")
+
+
+def show_interpolated_matches(essential_matches_file: BinaryIO,
+                              checkpoints_file: BinaryIO,
+                              start_position: int, end_position: int) -> None:
+    checkpoints = InterpolationCheckpoints.from_file(checkpoints_file)
+    for position, offsets, max_match in interpolate_offsets_range(
+            essential_matches_file, checkpoints, start_position,
+            end_position):
+        for length in range(checkpoints.min_match, max_match + 1):
+            print(f"position = {position}, length = {length}, "
+                  f"offset = {offsets[length]}")
+
+
+def interpolate_offsets_from_file(essential_matches_file: BinaryIO,
+                                  use_memory_map: bool = False) -> \
+        Iterator[Tuple[int, List[int], int]]:
+    header, essential_matches_reader = \
+        open_essential_matches(essential_matches_file, use_memory_map)
+    return interpolate_offsets(essential_matches_reader,
+                               header.input_size, header.min_match,
+                               header.max_match, header.max_offset)
+
+
+def interpolate(essential_matches_file: BinaryIO,
+                interpolated_matches_file: BinaryIO,
+                progress_period: Optional[int],
+                use_memory_map: bool = False,
+                index_file: Optional[BinaryIO] = None,
+                index_block_size: int = DEFAULT_INDEX_BLOCK_SIZE,
+                compact: bool = False,
+                telemetry_report: Optional[Telemetry] = None,
+                jobs: int = 1) -> None:
+    assert jobs >= 1
+    # start reading essential matches file
+    essential_matches_header, essential_matches_reader = \
+        open_essential_matches(essential_matches_file, use_memory_map)
+    input_size = essential_matches_header.input_size
+    min_match = essential_matches_header.min_match
+    max_match = essential_matches_header.max_match
+    max_offset = essential_matches_header.max_offset
+    # start writing interpolated matches file
+    interpolated_matches_file_header = Header.for_interpolated_matches(
+        input_size, min_match, max_match, compact, max_offset)
+    interpolated_matches_file_header.validate()
+    interpolated_matches_file_header.to_file(interpolated_matches_file)
+    interpolated_matches_writer = create_matches_writer(
+        interpolated_matches_file, interpolated_matches_file_header)
+    assert index_file is None or not compact, \
+        "position index requires fixed size match records"
+    position_index = PositionIndex(input_size, index_block_size) \
+        if index_file is not None else None
+    # variables
+    reporter = ProgressReporter(
+        "interpolate", input_size, progress_period, telemetry_report,
+        lambda: {"interpolated_matches":
+                 interpolated_matches_writer.matches_written})
+    if jobs > 1:
+        interpolate_in_parallel(
+            essential_matches_file, essential_matches_header,
+            StandardMatchCollector(interpolated_matches_writer,
+                                   position_index), reporter, jobs)
+    else:
+        next_checkpoint = reporter.next_checkpoint(0)
+        # process matches
+        for position, current_offsets, current_max_match in \
+                interpolate_offsets(essential_matches_reader, input_size,
+                                    min_match, max_match, max_offset):
+            # save current matches
+            if position_index is not None:
+                position_index.on_position(
+                    position, interpolated_matches_writer.matches_written)
+            if current_max_match >= min_match:
+                interpolated_matches_writer.write_run(
+                    position, min_match,
+                    current_offsets[min_match:current_max_match + 1])
+            # display progress status
+            if position + 1 == next_checkpoint:
+                next_checkpoint = reporter.on_progress(position + 1)
+    interpolated_matches_writer.flush()
+    reporter.finish()
+    if position_index is not None:
+        position_index.finish(interpolated_matches_writer.matches_written)
+        position_index.to_file(index_file)
+    print("Done")
+
+
+# (lookback position, start position, end position, index of first match
+# at lookback position, index of first match at end position)
+InterpolationRange = Tuple[int, int, int, int, int]
+
+
+def interpolate_range(essential_matches_file_name: str, header: Header,
+                      interpolation_range: InterpolationRange,
+                      validation_period: int) -> MatchesColumns:
+    # inherited matches can't be longer than max match, so they reach at
+    # most max match positions back, state at start position is rebuilt by
+    # interpolating from empty state at lookback position
+    lookback_position, start_position, end_position, start_index, \
+        end_index = interpolation_range
+    validation.period = validation_period
+    min_match = header.min_match
+    positions = array(WORD_TYPECODE)
+    lengths = array(WORD_TYPECODE)
+    offsets = array(WORD_TYPECODE)
+    with open(essential_matches_file_name, "rb") as essential_matches_file:
+        essential_matches_file.seek(
+            header.size_on_disk() + Match.SIZE_ON_DISK * start_index)
+        essential_matches_reader = MatchesReader(essential_matches_file,
+                                                 end_index - start_index)
+        state = InterpolationState(min_match, header.max_match,
+                                   header.max_offset)
+        state.restore(lookback_position, [0] * (header.max_match + 1), 0)
+        for position in range(lookback_position, end_position):
+            start, end = essential_matches_reader.read_run(position)
+            current_max_match = state.next_position(
+                essential_matches_reader.lengths,
+                essential_matches_reader.offsets, start, end)
+            if position >= start_position and current_max_match >= min_match:
+                count = current_max_match - min_match + 1
+                positions.extend(itertools.repeat(position, count))
+                lengths.extend(range(min_match, current_max_match + 1))
+                offsets.extend(
+                    state.current_offsets[min_match:current_max_match + 1])
+        assert not essential_matches_reader.has_next(), \
+            "essential matches must be sorted and within input"
+    return positions, lengths, offsets
+
+
+def interpolate_range_star(arguments: tuple) -> MatchesColumns:
+    return interpolate_range(*arguments)
+
+
+def interpolate_in_parallel(essential_matches_file: BinaryIO, header: Header,
+                            collector: MatchCollector,
+                            reporter: ProgressReporter, jobs: int) -> None:
+    assert not header.is_compact(), \
+        "parallel interpolation requires fixed size match records"
+    matches_count = count_matches(essential_matches_file, header)
+    ranges_count = jobs * RANGES_PER_JOB
+    boundaries = sorted(set(header.input_size * index // ranges_count
+                            for index in range(ranges_count + 1)))
+    lookback_positions = [max(start_position - header.max_match, 0)
+                          for start_position in boundaries[:-1]]
+    indices = find_first_matches_at_positions(
+        essential_matches_file, header, matches_count,
+        lookback_positions + boundaries[1:])
+    ranges_count = len(boundaries) - 1
+    assert (indices[-1] if ranges_count > 0 else 0) == matches_count, \
+        "essential matches must be sorted and within input"
+    interpolation_ranges = [
+        (lookback_positions[index], boundaries[index], boundaries[index + 1],
+         indices[index], indices[ranges_count + index])
+        for index in range(ranges_count)]
+    # ranges are interpolated concurrently, but results are written in order
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.imap(
+            interpolate_range_star,
+            [(essential_matches_file.name, header, interpolation_range,
+              validation.period)
+             for interpolation_range in interpolation_ranges])
+        for (_, start_position, end_position, _, _), \
+                (positions, lengths, offsets) in \
+                zip(interpolation_ranges, results):
+            collector.on_accepted_batch(start_position, end_position,
+                                        positions, lengths, offsets)
+            # display progress status
+            reporter.on_progress(end_position)
@@ -18,46 +18,230 @@
 #
 __author__ = 'Piotr Tarsa'
 
-from typing import List, Optional
+import contextlib
+import os
+import sys
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+# options accepted by all long running commands
+TELEMETRY_OPTIONS = ["telemetry", "telemetry-interval", "profile",
+                     "trace-memory"]
+VALIDATION_OPTIONS = ["validation", "validation-period"]
 
 
 def main(args: List[str]) -> None:
     argc = len(args)
     if argc >= 2:
         command = args[1]
-        params = args[2:]
+        params, options = split_options(args[2:])
         params_count = len(params)
         if command == "help":
             print_help()
         elif command == "find-matches":
             from tmf.match_finder import find_all_essential_matches
             check_command_parameters_count(command, params_count, 5, 6)
+            check_command_options(command, options,
+                                  ["index", "compact", "jobs", "window",
+                                   "memory-budget"] + TELEMETRY_OPTIONS +
+                                  VALIDATION_OPTIONS)
+            set_validation_level(options)
             match_finder_name = params[0]
             min_match = int(params[1])
             max_match = int(params[2])
             progress_period = parse_progress_period(params, 5)
+            index_block_size = parse_index_block_size(options)
+            jobs = parse_jobs(options)
+            max_offset = parse_max_offset(options)
+            memory_budget = parse_memory_budget(options)
             with open(params[3], "rb") as input_file, \
-                    open(params[4], "w+b") as essential_matches_file:
+                    open(params[4], "w+b") as essential_matches_file, \
+                    open_index_file(params[4], options, "w+b") as index_file, \
+                    open_telemetry(options) as telemetry:
                 find_all_essential_matches(
                     match_finder_name, min_match, max_match,
-                    input_file, essential_matches_file, progress_period)
+                    input_file, essential_matches_file, progress_period,
+                    index_file, index_block_size, "compact" in options, jobs,
+                    max_offset, telemetry, memory_budget)
+        elif command == "stream-matches":
+            from tmf.segmented import DEFAULT_SEGMENT_SIZE, \
+                find_essential_matches_in_stream
+            check_command_parameters_count(command, params_count, 4, 5)
+            check_command_options(command, options,
+                                  ["segment", "compact", "window"] +
+                                  TELEMETRY_OPTIONS + VALIDATION_OPTIONS)
+            set_validation_level(options)
+            min_match = int(params[0])
+            max_match = int(params[1])
+            progress_period = parse_progress_period(params, 4)
+            max_offset = parse_max_offset(options)
+            segment_size = int(options.get("segment", "") or
+                               DEFAULT_SEGMENT_SIZE)
+            assert segment_size >= 1, "segment size must be positive"
+            with open(params[2], "rb") if params[2] != "-" else \
+                    contextlib.nullcontext(sys.stdin.buffer) as input_file, \
+                    open(params[3], "w+b") as essential_matches_file, \
+                    open_telemetry(options) as telemetry:
+                find_essential_matches_in_stream(
+                    min_match, max_match, input_file, essential_matches_file,
+                    progress_period, "compact" in options, max_offset,
+                    segment_size, telemetry)
+        elif command == "pipeline":
+            from tmf.pipeline import run_pipeline
+            check_command_parameters_count(command, params_count, 5, 6)
+            check_command_options(command, options,
+                                  ["interpolated", "verifier", "index",
+                                   "compact", "window"] + TELEMETRY_OPTIONS +
+                                  VALIDATION_OPTIONS)
+            set_validation_level(options)
+            match_finder_name = params[0]
+            min_match = int(params[1])
+            max_match = int(params[2])
+            progress_period = parse_progress_period(params, 5)
+            index_block_size = parse_index_block_size(options)
+            max_offset = parse_max_offset(options)
+            assert options.get("interpolated", None) != "", \
+                "interpolated matches file name must be specified"
+            with open(params[3], "rb") as input_file, \
+                    open(params[4], "w+b") as essential_matches_file, \
+                    open(options["interpolated"], "w+b") \
+                    if "interpolated" in options else \
+                    contextlib.nullcontext() as interpolated_matches_file, \
+                    open_index_file(params[4], options, "w+b") as index_file, \
+                    open_telemetry(options) as telemetry:
+                run_pipeline(
+                    match_finder_name, min_match, max_match, input_file,
+                    essential_matches_file, progress_period,
+                    interpolated_matches_file,
+                    options.get("verifier", "") or None, index_file,
+                    index_block_size, "compact" in options, max_offset,
+                    telemetry)
         elif command == "interpolate":
             from tmf.interpolator import interpolate
             check_command_parameters_count(command, params_count, 2, 3)
+            check_command_options(command, options,
+                                  ["mmap", "index", "compact", "jobs"] +
+                                  TELEMETRY_OPTIONS + VALIDATION_OPTIONS)
+            set_validation_level(options)
             progress_period = parse_progress_period(params, 2)
+            index_block_size = parse_index_block_size(options)
+            jobs = parse_jobs(options)
             with open(params[0], "rb") as essential_matches_file, \
-                    open(params[1], "w+b") as interpolated_matches_file:
+                    open(params[1], "w+b") as interpolated_matches_file, \
+                    open_index_file(params[1], options, "w+b") as index_file, \
+                    open_telemetry(options) as telemetry:
                 interpolate(essential_matches_file, interpolated_matches_file,
-                            progress_period)
+                            progress_period, "mmap" in options,
+                            index_file, index_block_size, "compact" in options,
+                            telemetry, jobs)
+        elif command == "reslice":
+            from tmf.reslice import reslice
+            check_command_parameters_count(command, params_count, 4, 5)
+            check_command_options(command, options,
+                                  ["mmap", "index", "compact"] +
+                                  TELEMETRY_OPTIONS + VALIDATION_OPTIONS)
+            set_validation_level(options)
+            min_match = int(params[2])
+            max_match = int(params[3])
+            progress_period = parse_progress_period(params, 4)
+            index_block_size = parse_index_block_size(options)
+            with open(params[0], "rb") as essential_matches_file, \
+                    open(params[1], "w+b") as resliced_matches_file, \
+                    open_index_file(params[1], options, "w+b") as index_file, \
+                    open_telemetry(options) as telemetry:
+                reslice(essential_matches_file, resliced_matches_file,
+                        min_match, max_match, progress_period,
+                        "mmap" in options, index_file, index_block_size,
+                        "compact" in options, telemetry)
+        elif command == "checkpoint":
+            from tmf.checkpoints import DEFAULT_CHECKPOINT_INTERVAL, \
+                InterpolationCheckpoints
+            from tmf.interpolator import write_checkpoints
+            check_command_parameters_count(command, params_count, 1, 2)
+            check_command_options(command, options,
+                                  ["interval", "mmap"] + TELEMETRY_OPTIONS +
+                                  VALIDATION_OPTIONS)
+            set_validation_level(options)
+            progress_period = parse_progress_period(params, 1)
+            interval = int(options.get("interval", "") or
+                           DEFAULT_CHECKPOINT_INTERVAL)
+            assert interval >= 1, "checkpoint interval must be positive"
+            with open(params[0], "rb") as essential_matches_file:
+                check_checkpoints_supported(essential_matches_file)
+                with open(InterpolationCheckpoints.checkpoints_file_name(
+                        params[0]), "wb") as checkpoints_file, \
+                        open_telemetry(options) as telemetry:
+                    write_checkpoints(essential_matches_file,
+                                      checkpoints_file, interval,
+                                      progress_period, "mmap" in options,
+                                      telemetry)
         elif command == "verify":
             from tmf.verifier import verify
             check_command_parameters_count(command, params_count, 3, 4)
+            check_command_options(command, options,
+                                  ["mmap", "jobs"] + TELEMETRY_OPTIONS +
+                                  VALIDATION_OPTIONS)
+            set_validation_level(options)
             match_finder_name = params[0]
             progress_period = parse_progress_period(params, 3)
+            jobs = parse_jobs(options)
             with open(params[1], "rb") as input_file, \
-                    open(params[2], "rb") as interpolated_matches_file:
+                    open(params[2], "rb") as interpolated_matches_file, \
+                    open_telemetry(options) as telemetry:
                 verify(match_finder_name, input_file, interpolated_matches_file,
-                       progress_period)
+                       progress_period, "mmap" in options, jobs, telemetry)
+        elif command == "verify-direct":
+            from tmf.direct_verifier import verify_directly
+            check_command_parameters_count(command, params_count, 2, 2)
+            check_command_options(command, options, ["sample", "seed"])
+            sample_period = int(options["sample"]) \
+                if "sample" in options else None
+            assert sample_period is None or sample_period >= 1, \
+                "sample period must be positive"
+            with open(params[0], "rb") as input_file, \
+                    open(params[1], "rb") as interpolated_matches_file:
+                verify_directly(input_file, interpolated_matches_file,
+                                sample_period,
+                                int(options.get("seed", "") or 0))
+        elif command == "benchmark":
+            from tmf.benchmark import CORPORA_KINDS, DEFAULT_CORPUS_SIZE, \
+                benchmark
+            from tmf.match_finder import MATCH_FINDER_NAMES
+            check_command_options(command, options,
+                                  ["finders", "matches", "corpora", "size",
+                                   "verifier", "json"])
+            finder_names = options["finders"].split(",") \
+                if options.get("finders", "") else \
+                [name for name in MATCH_FINDER_NAMES if name != "bfmf"]
+            match_settings = [
+                (int(setting.partition(":")[0]),
+                 int(setting.partition(":")[2]))
+                for setting in options.get("matches", "3:20,2:120").split(",")]
+            corpora_kinds = options["corpora"].split(",") \
+                if options.get("corpora", "") else \
+                [] if "corpora" in options else CORPORA_KINDS
+            corpus_size = int(options.get("size", "") or DEFAULT_CORPUS_SIZE)
+            benchmark(finder_names, params, corpora_kinds, corpus_size,
+                      match_settings, options.get("verifier", "") or "btmf",
+                      options.get("json", "") or None)
+        elif command == "show-matches":
+            from tmf.position_index import PositionIndex, show_matches
+            check_command_parameters_count(command, params_count, 3, 3)
+            check_command_options(command, options, ["interpolated"])
+            if "interpolated" in options:
+                from tmf.checkpoints import InterpolationCheckpoints
+                from tmf.interpolator import show_interpolated_matches
+                with open(params[0], "rb") as essential_matches_file, \
+                        open(InterpolationCheckpoints.checkpoints_file_name(
+                            params[0]), "rb") as checkpoints_file:
+                    show_interpolated_matches(
+                        essential_matches_file, checkpoints_file,
+                        int(params[1]), int(params[2]))
+            else:
+                with open(params[0], "rb") as matches_file, \
+                        open(PositionIndex.index_file_name(params[0]),
+                             "rb") as index_file:
+                    show_matches(matches_file, index_file,
+                                 int(params[1]), int(params[2]))
         else:
             print_help()
             raise ValueError("Unknown command: " + command)
@@ -66,6 +250,127 @@ def main(args: List[str]) -> None:
         raise ValueError("Please specify a command")
 
 
+def split_options(params: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    positional_params = []
+    options = {}
+    for param in params:
+        if param.startswith("--"):
+            name, _, value = param[2:].partition("=")
+            options[name] = value
+        else:
+            positional_params.append(param)
+    return positional_params, options
+
+
+def check_command_options(command: str, options: Dict[str, str],
+                          allowed_options: List[str]) -> None:
+    for name in options:
+        if name not in allowed_options:
+            print_help()
+            raise ValueError(
+                "Error: unknown option --" + name + " for command " +
+                command + ".")
+
+
+def parse_index_block_size(options: Dict[str, str]) -> int:
+    from tmf.position_index import DEFAULT_INDEX_BLOCK_SIZE
+    # checked before any output file is created
+    assert "index" not in options or "compact" not in options, \
+        "position index requires fixed size match records"
+    if options.get("index", ""):
+        block_size = int(options["index"])
+        assert block_size >= 1, "index block size must be positive"
+        return block_size
+    else:
+        return DEFAULT_INDEX_BLOCK_SIZE
+
+
+def parse_jobs(options: Dict[str, str]) -> int:
+    if options.get("jobs", ""):
+        jobs = int(options["jobs"])
+        assert jobs >= 1, "jobs count must be positive"
+        return jobs
+    elif "jobs" in options:
+        return os.cpu_count() or 1
+    else:
+        return 1
+
+
+def parse_max_offset(options: Dict[str, str]) -> Optional[int]:
+    if "window" in options:
+        max_offset = int(options["window"])
+        assert max_offset >= 1, "window size must be positive"
+        return max_offset
+    else:
+        return None
+
+
+def parse_memory_budget(options: Dict[str, str]) -> Optional[int]:
+    if "memory-budget" in options:
+        value = options["memory-budget"].upper()
+        multiplier = 1
+        for suffix_index, suffix in enumerate("KMG"):
+            if value.endswith(suffix):
+                multiplier = 1 << (10 * (suffix_index + 1))
+                value = value[:-1]
+        memory_budget = int(value) * multiplier
+        assert memory_budget >= 1, "memory budget must be positive"
+        return memory_budget
+    else:
+        return None
+
+
+def open_index_file(matches_file_name: str, options: Dict[str, str],
+                    mode: str):
+    if "index" in options:
+        from tmf.position_index import PositionIndex
+        return open(PositionIndex.index_file_name(matches_file_name), mode)
+    else:
+        return contextlib.nullcontext()
+
+
+def check_checkpoints_supported(essential_matches_file: BinaryIO) -> None:
+    # checked before checkpoints file is created
+    from tmf.header import Header
+    header = Header.from_file(essential_matches_file)
+    essential_matches_file.seek(0)
+    header.validate()
+    assert header.is_for_essential_matches(), \
+        "checkpoints require essential matches file"
+    assert not header.is_compact(), \
+        "checkpoints require fixed size match records"
+
+
+@contextlib.contextmanager
+def open_telemetry(options: Dict[str, str]):
+    from tmf.telemetry import DEFAULT_TELEMETRY_INTERVAL, Telemetry, profiled
+    interval = float(options.get("telemetry-interval", "") or
+                     DEFAULT_TELEMETRY_INTERVAL)
+    assert interval > 0, "telemetry interval must be positive"
+    assert options.get("profile", None) != "", \
+        "profile statistics file name must be specified"
+    with profiled(options.get("profile", None), "trace-memory" in options), \
+            open(options["telemetry"], "w") \
+            if options.get("telemetry", "") else \
+            contextlib.nullcontext(sys.stderr) as telemetry_file:
+        if "telemetry" in options:
+            telemetry = Telemetry(telemetry_file, interval)
+            try:
+                yield telemetry
+            finally:
+                telemetry.close()
+        else:
+            yield None
+
+
+def set_validation_level(options: Dict[str, str]) -> None:
+    from tmf import validation
+    validation.set_level(
+        options.get("validation", "") or "full",
+        int(options.get("validation-period", "") or
+            validation.DEFAULT_VALIDATION_PERIOD))
+
+
 def check_command_parameters_count(command: str, params_count: int,
                                    min_count: int, max_count: int) -> None:
     if params_count < min_count or params_count > max_count:
@@ -92,31 +397,195 @@ def print_help() -> None:
     print("Available commands (case sensitive):",
           "  help",
           "    displays this help",
-          "  find-matches <finder> <min> <max> <input> <essential> <progress>",
+          "  find-matches <finder> <min> <max> <input> <essential> <progress>"
+          " <options>",
           "    finds all optimal matches in input and stores the essential ones",
           "    finder: match finder, one of:",
           "      bfmf: very slow brute force match finder",
           "      hmmf: very memory hungry fat hash map match finder",
-          "      NOTE: tmf (Tarsa match finder) is not present in lite version",
+          "      rhmf: rolling hash match finder, leaner replacement of hmmf",
+          "      hcmf: hash chain match finder, fast on text-like inputs",
+          "      btmf: binary tree match finder, steady on repetitive inputs",
+          "      tmf: Tarsa match finder based on radix sort",
+          "      samf: suffix array match finder, requires NumPy",
+          "      sgmf: segmented match finder merging per segment tries",
           "    min: minimum match size, min >= 1, min <= max",
           "    max: maximum match size, max >= min, max <= 120",
           "    input: input file with original data",
           "    essential: file to store essential matches",
           "    progress: optional period in bytes",
           "      if present then show progress status periodically",
-          "  interpolate <essential> <interpolated> <progress>",
+          "    options: optional, any of:",
+          "      --index=<block>: also store position index in <essential>.idx",
+          "        block: optional number of positions per index entry",
+          "      --compact: store matches in compact format",
+          "      --jobs=<count>: find matches for position ranges in parallel",
+          "        processes, output is the same as without this option,",
+          "        supported by bfmf and hcmf",
+          "        count: optional number of processes, defaults to CPU count",
+          "      --window=<size>: find only matches with offsets up to size,",
+          "        window size is stored in header and used by interpolate",
+          "        and verify",
+          "      --memory-budget=<size>: keep match finder state within size",
+          "        in bytes (K, M or G suffix allowed) by memory mapping input",
+          "        and spilling data to temporary files, output is the same",
+          "        as without this option, supported by bfmf, hcmf, btmf and",
+          "        tmf, which requires NumPy then",
+          "      --telemetry=<file>: emit progress, timings and counters as",
+          "        JSON lines, file defaults to standard error output",
+          "      --telemetry-interval=<seconds>: time between telemetry",
+          "        records, defaults to 10",
+          "      --profile=<file>: store cProfile statistics in file",
+          "      --trace-memory: trace memory allocations with tracemalloc",
+          "      --validation=<level>: costly sanity checks done by match",
+          "        finders and interpolation, one of off, sampled, full,",
+          "        defaults to full, checks of headers and numbers of matches",
+          "        are always done",
+          "      --validation-period=<positions>: with sampled validation",
+          "        check one of every that many positions, defaults to 1024",
+          "  stream-matches <min> <max> <input> <essential> <progress>"
+          " <options>",
+          "    finds essential matches like find-matches with sgmf, reading",
+          "    input segment by segment without knowing its size up front",
+          "    and writing matches of each finished segment immediately",
+          "    min, max, essential, progress: same as for find-matches",
+          "    input: input file with original data, - for standard input",
+          "    options: optional, any of:",
+          "      --segment=<size>: number of positions per segment, defaults",
+          "        to 16384",
+          "      --compact, --window: as for find-matches",
+          "      --telemetry, --telemetry-interval, --profile, --trace-memory,",
+          "        --validation, --validation-period: as for find-matches",
+          "  pipeline <finder> <min> <max> <input> <essential> <progress>"
+          " <options>",
+          "    finds essential matches like find-matches, interpolates them",
+          "    in memory and checks the result against matches found by",
+          "    finder, in a single pass over input, at every position",
+          "    regardless of validation level",
+          "    parameters: same as for find-matches",
+          "    options: optional, any of:",
+          "      --interpolated=<file>: also store full set of optimal",
+          "        matches in file",
+          "      --verifier=<finder>: also check matches against another",
+          "        match finder run side by side",
+          "      --index, --compact, --window: as for find-matches",
+          "      --telemetry, --telemetry-interval, --profile, --trace-memory,",
+          "        --validation, --validation-period: as for find-matches",
+          "  interpolate <essential> <interpolated> <progress> <options>",
           "    reconstructs full set of optimal matches from essential ones",
           "    essential: file with essential matches",
           "    interpolated: file to store full set of optimal matches",
           "    progress: optional period in bytes",
           "      if present then show progress status periodically",
-          "  verify <finder> <input> <interpolated> <progress>",
+          "    options: optional, any of:",
+          "      --mmap: read matches file through memory map, requires NumPy",
+          "      --index=<block>: also store position index in",
+          "        <interpolated>.idx",
+          "        block: optional number of positions per index entry",
+          "      --compact: store matches in compact format",
+          "      --jobs=<count>: interpolate position ranges of essential",
+          "        matches file in parallel processes, output is the same as",
+          "        without this option, requires fixed size match records",
+          "        count: optional number of processes, defaults to CPU count",
+          "      --telemetry=<file>: emit progress, timings and counters as",
+          "        JSON lines, file defaults to standard error output",
+          "      --telemetry-interval=<seconds>: time between telemetry",
+          "        records, defaults to 10",
+          "      --profile=<file>: store cProfile statistics in file",
+          "      --trace-memory: trace memory allocations with tracemalloc",
+          "      --validation, --validation-period: as for find-matches",
+          "  reslice <essential> <resliced> <min> <max> <progress> <options>",
+          "    derives essential matches for narrower range of match lengths",
+          "    from existing ones without running a match finder, result is",
+          "    the same as from find-matches with narrower range",
+          "    essential: file with essential matches",
+          "    resliced: file to store essential matches for narrower range",
+          "    min: minimum match size, at least minimum of essential file",
+          "    max: maximum match size, at most maximum of essential file",
+          "    progress: optional period in bytes",
+          "      if present then show progress status periodically",
+          "    options: optional, any of:",
+          "      --mmap: read matches file through memory map, requires NumPy",
+          "      --index=<block>: also store position index in",
+          "        <resliced>.idx",
+          "        block: optional number of positions per index entry",
+          "      --compact: store matches in compact format",
+          "      --telemetry, --telemetry-interval, --profile, --trace-memory,",
+          "        --validation, --validation-period: as for find-matches",
+          "  checkpoint <essential> <progress> <options>",
+          "    stores interpolation state at regular positions in",
+          "    <essential>.ckp, so matches for any range of positions can be",
+          "    interpolated without replaying preceding ones",
+          "    essential: file with essential matches, not compact",
+          "    progress: optional period in bytes",
+          "      if present then show progress status periodically",
+          "    options: optional, any of:",
+          "      --interval=<positions>: positions between checkpoints,",
+          "        defaults to 65536",
+          "      --mmap: read matches file through memory map, requires NumPy",
+          "      --telemetry, --telemetry-interval, --profile, --trace-memory,",
+          "        --validation, --validation-period: as for find-matches",
+          "  verify <finder> <input> <interpolated> <progress> <options>",
           "    verifies presence of all optimal matches after interpolation",
           "    finder: match finder, one of:",
           "      bfmf: very slow brute force match finder",
           "      hmmf: very memory hungry fat hash map match finder",
+          "      rhmf: rolling hash match finder, leaner replacement of hmmf",
+          "      hcmf: hash chain match finder, fast on text-like inputs",
+          "      btmf: binary tree match finder, steady on repetitive inputs",
+          "      tmf: Tarsa match finder based on radix sort",
+          "      samf: suffix array match finder, requires NumPy",
+          "      sgmf: segmented match finder merging per segment tries",
           "    input: input file with original data",
           "    interpolated: file with full set of optimal matches",
           "    progress: optional period in bytes",
           "      if present then show progress status periodically",
+          "    options: optional, any of:",
+          "      --mmap: read matches file through memory map, requires NumPy",
+          "      --jobs=<count>: verify position ranges in parallel processes,",
+          "        supported by bfmf and hcmf",
+          "        count: optional number of processes, defaults to CPU count",
+          "      --telemetry=<file>: emit progress, timings and counters as",
+          "        JSON lines, file defaults to standard error output",
+          "      --telemetry-interval=<seconds>: time between telemetry",
+          "        records, defaults to 10",
+          "      --profile=<file>: store cProfile statistics in file",
+          "      --trace-memory: trace memory allocations with tracemalloc",
+          "      --validation, --validation-period: as for find-matches",
+          "  verify-direct <input> <interpolated> <options>",
+          "    verifies interpolated matches against input without running",
+          "    a match finder, requires NumPy",
+          "    input: input file with original data",
+          "    interpolated: file with full set of optimal matches",
+          "    options: optional, any of:",
+          "      --sample=<period>: instead of checking optimality and",
+          "        completeness of matches at all positions using suffix",
+          "        array, check one random position out of every period",
+          "      --seed=<number>: seed for choosing sampled positions",
+          "  benchmark <inputs> <options>",
+          "    measures speed and memory usage of finding, interpolating and",
+          "    verifying matches on generated corpora and input files",
+          "    inputs: optional input files",
+          "    options: optional, any of:",
+          "      --finders=<names>: comma separated match finders to measure,",
+          "        defaults to all except bfmf",
+          "      --matches=<settings>: comma separated <min>:<max> pairs,",
+          "        defaults to 3:20,2:120",
+          "      --corpora=<kinds>: comma separated kinds of generated corpora,",
+          "        any of random, low-entropy, periodic, text, zeros,",
+          "        defaults to all, empty value disables generated corpora",
+          "      --size=<bytes>: size of generated corpora, defaults to 32768",
+          "      --verifier=<finder>: match finder for verification,",
+          "        defaults to btmf",
+          "      --json=<file>: also store results as JSON in file",
+          "  show-matches <matches> <start> <end>",
+          "    shows matches with positions in range [start, end)",
+          "    matches: essential or interpolated matches file",
+          "      position index must be present in <matches>.idx",
+          "    start: first position in range",
+          "    end: position after the last one in range",
+          "    options: optional, any of:",
+          "      --interpolated: interpolate essential matches from",
+          "        checkpoints in <matches>.ckp instead of using position",
+          "        index",
           sep='\n', end='\n')
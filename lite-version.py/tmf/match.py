@@ -16,14 +16,17 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 #
+import struct
 from array import array
 from typing import BinaryIO
 
-from tmf import number_codec
+from tmf import number_codec, telemetry
 
 
 class Match:
+    __slots__ = ("position", "length", "offset", "source")
     SIZE_ON_DISK: int = 4 * 4
+    STRUCT = struct.Struct(">IIII")
 
     def __init__(self, position: int, length: int, offset: int):
         self.position = position
@@ -49,17 +52,14 @@ class Match:
 
     @staticmethod
     def from_file(input_file: BinaryIO):
-        result = Match(number_codec.read_big_endian_number(input_file, 4),
-                       number_codec.read_big_endian_number(input_file, 4),
-                       number_codec.read_big_endian_number(input_file, 4))
-        assert number_codec.read_big_endian_number(input_file, 4) == 0
-        return result
+        position, length, offset, padding = Match.STRUCT.unpack(
+            number_codec.read_exactly(input_file, Match.SIZE_ON_DISK))
+        assert padding == 0
+        return Match(position, length, offset)
 
     def to_file(self, output_file: BinaryIO) -> None:
-        number_codec.write_big_endian_number(self.position, output_file, 4)
-        number_codec.write_big_endian_number(self.length, output_file, 4)
-        number_codec.write_big_endian_number(self.offset, output_file, 4)
-        number_codec.write_big_endian_number(0, output_file, 4)
+        output_file.write(
+            Match.STRUCT.pack(self.position, self.length, self.offset, 0))
 
     @staticmethod
     def compute_match_length(input_data: array, source_pos: int,
@@ -73,4 +73,7 @@ class Match:
                 (input_data[source_pos + match_length] ==
                  input_data[target_pos + match_length]):
             match_length += 1
+        if telemetry.counters is not None:
+            telemetry.counters["byte_comparisons"] += \
+                match_length + (match_length < max_match)
         return match_length
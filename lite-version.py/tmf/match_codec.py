@@ -0,0 +1,368 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import itertools
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterable, Iterator, List, Sequence, Tuple
+
+from tmf import number_codec
+from tmf.header import Header
+from tmf.match import Match
+
+# typecode of unsigned 32-bit array items, matches are stored as four of them
+WORD_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+assert array(WORD_TYPECODE).itemsize == 4
+
+DEFAULT_BLOCK_SIZE = 1 << 12
+
+MatchesColumns = Tuple[array, array, array]
+
+
+def count_matches(matches_file: BinaryIO, header: Header) -> int:
+    header_size = header.size_on_disk()
+    file_size = os.fstat(matches_file.fileno()).st_size
+    assert file_size >= header_size and \
+           (file_size - header_size) % Match.SIZE_ON_DISK == 0
+    return (file_size - header_size) // Match.SIZE_ON_DISK
+
+
+def find_first_match_at_position(matches_view: memoryview, header_size: int,
+                                 matches_count: int, position: int) -> int:
+    # index of first record with position not lower than given one
+    low = 0
+    high = matches_count
+    while low < high:
+        middle = (low + high) // 2
+        record_start = header_size + Match.SIZE_ON_DISK * middle
+        middle_position = int.from_bytes(
+            matches_view[record_start:record_start + 4], "big")
+        if middle_position < position:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def find_first_matches_at_positions(matches_file: BinaryIO, header: Header,
+                                    matches_count: int,
+                                    positions: List[int]) -> List[int]:
+    # binary searches in memory mapped file with fixed size match records
+    if matches_count == 0:
+        return [0] * len(positions)
+    with mmap.mmap(matches_file.fileno(), 0,
+                   access=mmap.ACCESS_READ) as matches_map:
+        matches_view = memoryview(matches_map)
+        indices = [find_first_match_at_position(
+            matches_view, header.size_on_disk(), matches_count, position)
+            for position in positions]
+        matches_view.release()
+    return indices
+
+
+def encode_matches(positions: array, lengths: array, offsets: array,
+                   buffer: array) -> memoryview:
+    count = len(positions)
+    assert len(lengths) == count and len(offsets) == count
+    assert len(buffer) >= 4 * count
+    buffer[0:4 * count:4] = positions
+    buffer[1:4 * count:4] = lengths
+    buffer[2:4 * count:4] = offsets
+    buffer[3:4 * count:4] = array(WORD_TYPECODE, bytes(4 * count))
+    if sys.byteorder == "little":
+        buffer.byteswap()
+    return memoryview(buffer).cast("B")[:Match.SIZE_ON_DISK * count]
+
+
+def decode_matches(buffer: array, count: int) -> MatchesColumns:
+    assert len(buffer) >= 4 * count
+    if sys.byteorder == "little":
+        buffer.byteswap()
+    assert not any(buffer[3:4 * count:4]), "padding must be zero"
+    return (buffer[0:4 * count:4], buffer[1:4 * count:4],
+            buffer[2:4 * count:4])
+
+
+class MatchesWriter:
+    def __init__(self, output_file: BinaryIO,
+                 block_size: int = DEFAULT_BLOCK_SIZE):
+        assert block_size >= 1
+        self.output_file = output_file
+        self.block_size = block_size
+        self.positions = array(WORD_TYPECODE)
+        self.lengths = array(WORD_TYPECODE)
+        self.offsets = array(WORD_TYPECODE)
+        self.buffer = array(WORD_TYPECODE, [0]) * (4 * block_size)
+        self.matches_written = 0
+
+    def write(self, position: int, length: int, offset: int) -> None:
+        self.positions.append(position)
+        self.lengths.append(length)
+        self.offsets.append(offset)
+        self.matches_written += 1
+        if len(self.positions) == self.block_size:
+            self.flush()
+
+    def write_match(self, match: Match) -> None:
+        self.write(match.position, match.length, match.offset)
+
+    def write_run(self, position: int, min_length: int,
+                  offsets: Sequence[int]) -> None:
+        # matches with the same position and consecutive lengths
+        count = len(offsets)
+        self.positions.extend(itertools.repeat(position, count))
+        self.lengths.extend(range(min_length, min_length + count))
+        self.offsets.extend(offsets)
+        self.matches_written += count
+        if len(self.positions) >= self.block_size:
+            self.flush_full_blocks()
+
+    def write_columns(self, positions: Iterable[int], lengths: Iterable[int],
+                      offsets: Iterable[int]) -> None:
+        buffered_count = len(self.positions)
+        self.positions.extend(positions)
+        self.lengths.extend(lengths)
+        self.offsets.extend(offsets)
+        assert len(self.positions) == len(self.lengths) == len(self.offsets)
+        self.matches_written += len(self.positions) - buffered_count
+        if len(self.positions) >= self.block_size:
+            self.flush_full_blocks()
+
+    def flush_full_blocks(self) -> None:
+        # remaining matches stay buffered, so blocks are the same as when
+        # writing matches one by one
+        count = len(self.positions) - len(self.positions) % self.block_size
+        for start in range(0, count, self.block_size):
+            end = start + self.block_size
+            self.write_block(self.positions[start:end],
+                             self.lengths[start:end], self.offsets[start:end])
+        del self.positions[:count], self.lengths[:count], self.offsets[:count]
+
+    def flush(self) -> None:
+        for start in range(0, len(self.positions), self.block_size):
+            end = min(start + self.block_size, len(self.positions))
+            self.write_block(self.positions[start:end],
+                             self.lengths[start:end], self.offsets[start:end])
+        del self.positions[:], self.lengths[:], self.offsets[:]
+
+    def write_block(self, positions: array, lengths: array,
+                    offsets: array) -> None:
+        self.output_file.write(
+            encode_matches(positions, lengths, offsets, self.buffer))
+
+
+class MatchesReader:
+    def __init__(self, input_file: BinaryIO, matches_count: int,
+                 block_size: int = DEFAULT_BLOCK_SIZE):
+        assert block_size >= 1
+        self.input_file = input_file
+        self.remaining_matches = matches_count
+        self.block_size = block_size
+        self.buffer = array(WORD_TYPECODE, [0]) * (4 * block_size)
+        self.buffer_view = memoryview(self.buffer).cast("B")
+        self.positions = array(WORD_TYPECODE)
+        self.lengths = array(WORD_TYPECODE)
+        self.offsets = array(WORD_TYPECODE)
+        self.next_index = 0
+        self.exhausted = False
+
+    def read_columns(self) -> MatchesColumns:
+        count = min(self.block_size, self.remaining_matches)
+        num_bytes = Match.SIZE_ON_DISK * count
+        if self.input_file.readinto(self.buffer_view[:num_bytes]) != \
+                num_bytes:
+            raise EOFError("read() didn't return enough bytes")
+        self.remaining_matches -= count
+        return decode_matches(self.buffer, count)
+
+    def has_next(self) -> bool:
+        if self.next_index == len(self.positions):
+            self.positions, self.lengths, self.offsets = self.read_columns()
+            self.next_index = 0
+        return self.next_index < len(self.positions)
+
+    def read(self) -> Tuple[int, int, int]:
+        if not self.has_next():
+            raise EOFError("no more matches")
+        index = self.next_index
+        self.next_index += 1
+        return self.positions[index], self.lengths[index], self.offsets[index]
+
+    def read_run(self, position: int) -> Tuple[int, int]:
+        # consumes all consecutive matches with given position and returns
+        # their range of indices in current columns, matches from following
+        # blocks are appended to current columns if run reaches block end
+        start = self.next_index
+        end = start
+        while True:
+            positions = self.positions
+            while end < len(positions) and positions[end] == position:
+                end += 1
+            if end < len(positions) or self.exhausted:
+                break
+            more_positions, more_lengths, more_offsets = self.read_columns()
+            if not more_positions:
+                self.exhausted = True
+                break
+            self.positions = positions[start:] + more_positions
+            self.lengths = self.lengths[start:] + more_lengths
+            self.offsets = self.offsets[start:] + more_offsets
+            end -= start
+            start = 0
+        self.next_index = end
+        return start, end
+
+    def read_match(self) -> Match:
+        return Match.from_position_length_offset(*self.read())
+
+    def matches(self) -> Iterator[Match]:
+        while self.has_next():
+            yield self.read_match()
+
+
+class IterableMatchesReader(MatchesReader):
+    # adapts matches held in memory or generated on the fly, they are
+    # consumed block by block
+    def __init__(self, matches: Iterable[Match],
+                 block_size: int = DEFAULT_BLOCK_SIZE):
+        super().__init__(None, 0, block_size)
+        self.matches_iterator = iter(matches)
+
+    def read_columns(self) -> MatchesColumns:
+        positions = array(WORD_TYPECODE)
+        lengths = array(WORD_TYPECODE)
+        offsets = array(WORD_TYPECODE)
+        for match in itertools.islice(self.matches_iterator,
+                                      self.block_size):
+            positions.append(match.position)
+            lengths.append(match.length)
+            offsets.append(match.offset)
+        return positions, lengths, offsets
+
+
+def encode_varint(number: int, output: bytearray) -> None:
+    while number >= 0x80:
+        output.append((number & 0x7F) | 0x80)
+        number >>= 7
+    output.append(number)
+
+
+def decode_varints(data: bytes, output: array) -> None:
+    number = 0
+    shift = 0
+    for byte in data:
+        number |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            output.append(number)
+            number = 0
+            shift = 0
+        else:
+            shift += 7
+    assert shift == 0, "truncated varint"
+
+
+class CompactMatchesWriter(MatchesWriter):
+    # block: header, groups stream (position delta and number of matches per
+    # group of matches with the same position), lengths stream (one byte per
+    # match) and offsets stream (varint per match)
+    BLOCK_HEADER_STRUCT = struct.Struct(">III")
+
+    def __init__(self, output_file: BinaryIO,
+                 block_size: int = DEFAULT_BLOCK_SIZE):
+        super().__init__(output_file, block_size)
+        self.previous_position = 0
+
+    def write_block(self, positions: array, lengths: array,
+                    offsets: array) -> None:
+        count = len(positions)
+        groups_stream = bytearray()
+        index = 0
+        while index < count:
+            position = positions[index]
+            assert position >= self.previous_position, \
+                "matches must be sorted by position"
+            group_end = index + 1
+            while group_end < count and positions[group_end] == position:
+                group_end += 1
+            encode_varint(position - self.previous_position, groups_stream)
+            encode_varint(group_end - index, groups_stream)
+            self.previous_position = position
+            index = group_end
+        offsets_stream = bytearray()
+        for offset in offsets:
+            encode_varint(offset, offsets_stream)
+        self.output_file.write(CompactMatchesWriter.BLOCK_HEADER_STRUCT.pack(
+            count, len(groups_stream), len(offsets_stream)))
+        self.output_file.write(groups_stream)
+        self.output_file.write(array("B", lengths))
+        self.output_file.write(offsets_stream)
+
+
+class CompactMatchesReader(MatchesReader):
+    def __init__(self, input_file: BinaryIO):
+        super().__init__(input_file, 0, 1)
+        self.previous_position = 0
+
+    def read_columns(self) -> MatchesColumns:
+        positions = array(WORD_TYPECODE)
+        lengths = array(WORD_TYPECODE)
+        offsets = array(WORD_TYPECODE)
+        block_header = self.input_file.read(
+            CompactMatchesWriter.BLOCK_HEADER_STRUCT.size)
+        if not block_header:
+            return positions, lengths, offsets
+        if len(block_header) != CompactMatchesWriter.BLOCK_HEADER_STRUCT.size:
+            raise EOFError("read() didn't return enough bytes")
+        count, groups_stream_size, offsets_stream_size = \
+            CompactMatchesWriter.BLOCK_HEADER_STRUCT.unpack(block_header)
+        groups = array(WORD_TYPECODE)
+        decode_varints(number_codec.read_exactly(
+            self.input_file, groups_stream_size), groups)
+        assert len(groups) % 2 == 0
+        for group_index in range(0, len(groups), 2):
+            self.previous_position += groups[group_index]
+            positions.extend(
+                [self.previous_position] * groups[group_index + 1])
+        lengths.extend(number_codec.read_exactly(self.input_file, count))
+        decode_varints(number_codec.read_exactly(
+            self.input_file, offsets_stream_size), offsets)
+        assert len(positions) == len(offsets) == count
+        return positions, lengths, offsets
+
+
+def open_matches_reader(matches_file: BinaryIO) -> \
+        Tuple[Header, MatchesReader]:
+    header = Header.from_file(matches_file)
+    header.validate()
+    if header.is_compact():
+        return header, CompactMatchesReader(matches_file)
+    else:
+        return header, MatchesReader(matches_file,
+                                     count_matches(matches_file, header))
+
+
+def create_matches_writer(matches_file: BinaryIO,
+                          header: Header) -> MatchesWriter:
+    # header needs to be written separately
+    if header.is_compact():
+        return CompactMatchesWriter(matches_file)
+    else:
+        return MatchesWriter(matches_file)
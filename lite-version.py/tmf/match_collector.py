@@ -0,0 +1,173 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import bisect
+from array import array
+from typing import Optional
+
+from tmf.match_codec import WORD_TYPECODE, MatchesColumns, MatchesWriter
+from tmf.position_index import PositionIndex
+
+
+class MatchCollector:
+    # receives essential matches in order of positions, then lengths
+    def on_position(self, position: int) -> None:
+        # called before accepting matches for each position
+        pass
+
+    def on_accepted(self, position: int, length: int, offset: int) -> None:
+        # called for each essential match
+        pass
+
+    def on_accepted_batch(self, start_position: int, end_position: int,
+                          positions: array, lengths: array,
+                          offsets: array) -> None:
+        # all matches for positions in range [start_position, end_position)
+        next_index = 0
+        for position in range(start_position, end_position):
+            self.on_position(position)
+            while next_index < len(positions) and \
+                    positions[next_index] == position:
+                self.on_accepted(position, lengths[next_index],
+                                 offsets[next_index])
+                next_index += 1
+        assert next_index == len(positions)
+
+    def on_discarded(self, count: int) -> None:
+        # optimal matches which are not essential
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+class StandardMatchCollector(MatchCollector):
+    def __init__(self, matches_writer: MatchesWriter,
+                 position_index: Optional[PositionIndex] = None):
+        self.matches_writer = matches_writer
+        self.position_index = position_index
+        self.discarded_matches_count = 0
+
+    def on_position(self, position: int) -> None:
+        if self.position_index is not None:
+            self.position_index.on_position(
+                position, self.matches_writer.matches_written)
+
+    def on_accepted(self, position: int, length: int, offset: int) -> None:
+        self.matches_writer.write(position, length, offset)
+
+    def on_accepted_batch(self, start_position: int, end_position: int,
+                          positions: array, lengths: array,
+                          offsets: array) -> None:
+        if self.position_index is not None:
+            # index needs only positions at block boundaries
+            block_size = self.position_index.block_size
+            matches_written = self.matches_writer.matches_written
+            first_block_position = \
+                start_position + (-start_position) % block_size
+            for position in range(first_block_position, end_position,
+                                  block_size):
+                self.position_index.on_position(
+                    position,
+                    matches_written + bisect.bisect_left(positions, position))
+        self.matches_writer.write_columns(positions, lengths, offsets)
+
+    def on_discarded(self, count: int) -> None:
+        self.discarded_matches_count += count
+
+    def finish(self) -> None:
+        self.matches_writer.flush()
+        if self.position_index is not None:
+            self.position_index.finish(self.matches_writer.matches_written)
+
+
+class CountingMatchCollector(MatchCollector):
+    def __init__(self):
+        self.essential_matches_count = 0
+        self.discarded_matches_count = 0
+
+    def on_accepted(self, position: int, length: int, offset: int) -> None:
+        self.essential_matches_count += 1
+
+    def on_accepted_batch(self, start_position: int, end_position: int,
+                          positions: array, lengths: array,
+                          offsets: array) -> None:
+        self.essential_matches_count += len(positions)
+
+    def on_discarded(self, count: int) -> None:
+        self.discarded_matches_count += count
+
+
+class IgnoringMatchCollector(MatchCollector):
+    def on_accepted(self, position: int, length: int, offset: int) -> None:
+        pass
+
+    def on_accepted_batch(self, start_position: int, end_position: int,
+                          positions: array, lengths: array,
+                          offsets: array) -> None:
+        pass
+
+
+class ColumnarMatchCollector(MatchCollector):
+    # keeps matches in memory, one array per field
+    def __init__(self):
+        self.positions = array(WORD_TYPECODE)
+        self.lengths = array(WORD_TYPECODE)
+        self.offsets = array(WORD_TYPECODE)
+        self.discarded_matches_count = 0
+
+    def on_accepted(self, position: int, length: int, offset: int) -> None:
+        self.positions.append(position)
+        self.lengths.append(length)
+        self.offsets.append(offset)
+
+    def on_accepted_batch(self, start_position: int, end_position: int,
+                          positions: array, lengths: array,
+                          offsets: array) -> None:
+        self.positions.extend(positions)
+        self.lengths.extend(lengths)
+        self.offsets.extend(offsets)
+
+    def on_discarded(self, count: int) -> None:
+        self.discarded_matches_count += count
+
+    def columns(self) -> MatchesColumns:
+        return self.positions, self.lengths, self.offsets
+
+
+class PositionMatchCollector(MatchCollector):
+    # keeps matches for the latest position, passes all matches downstream
+    def __init__(self, downstream: MatchCollector):
+        self.downstream = downstream
+        self.current_lengths = array(WORD_TYPECODE)
+        self.current_offsets = array(WORD_TYPECODE)
+
+    def on_position(self, position: int) -> None:
+        del self.current_lengths[:], self.current_offsets[:]
+        self.downstream.on_position(position)
+
+    def on_accepted(self, position: int, length: int, offset: int) -> None:
+        self.current_lengths.append(length)
+        self.current_offsets.append(offset)
+        self.downstream.on_accepted(position, length, offset)
+
+    def on_discarded(self, count: int) -> None:
+        self.downstream.on_discarded(count)
+
+    def finish(self) -> None:
+        self.downstream.finish()
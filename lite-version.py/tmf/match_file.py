@@ -0,0 +1,132 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import bisect
+import mmap
+from array import array
+from typing import BinaryIO, Optional
+
+import numpy
+
+from tmf.header import Header
+from tmf.match import Match
+from tmf.match_codec import (DEFAULT_BLOCK_SIZE, WORD_TYPECODE, MatchesColumns,
+                             MatchesReader, count_matches)
+
+MATCH_DTYPE = numpy.dtype([("position", ">u4"), ("length", ">u4"),
+                           ("offset", ">u4"), ("padding", ">u4")])
+assert MATCH_DTYPE.itemsize == Match.SIZE_ON_DISK
+
+
+class MatchFile:
+    def __init__(self, matches_file: BinaryIO):
+        matches_file.seek(0)
+        self.header = Header.from_file(matches_file)
+        self.header.validate()
+        assert not self.header.is_compact(), \
+            "memory mapping requires fixed size match records"
+        matches_count = count_matches(matches_file, self.header)
+        self.memory_map: Optional[mmap.mmap] = None
+        if matches_count > 0:
+            self.memory_map = mmap.mmap(matches_file.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            self.matches = numpy.frombuffer(
+                self.memory_map, dtype=MATCH_DTYPE, count=matches_count,
+                offset=self.header.size_on_disk())
+        else:
+            self.matches = numpy.empty(0, dtype=MATCH_DTYPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.matches)
+
+    def __getitem__(self, index):
+        return self.matches[index]
+
+    def close(self) -> None:
+        self.matches = numpy.empty(0, dtype=MATCH_DTYPE)
+        if self.memory_map is not None:
+            try:
+                self.memory_map.close()
+            except BufferError:
+                # views handed out earlier still use the mapping, it will be
+                # released together with them
+                pass
+            self.memory_map = None
+
+    def release(self, start_index: int, end_index: int) -> None:
+        # drops mapped pages of records already processed by sequential
+        # scan, so they don't accumulate in resident memory
+        if self.memory_map is None or \
+                not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        start = self.header.size_on_disk() + Match.SIZE_ON_DISK * start_index
+        start -= start % mmap.PAGESIZE
+        end = min(self.header.size_on_disk() +
+                  Match.SIZE_ON_DISK * end_index, len(self.memory_map))
+        if start < end:
+            self.memory_map.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def find_first_at_position(self, position: int,
+                               start_index: int = 0) -> int:
+        # index of first record with position not lower than given one
+        return bisect.bisect_left(self.matches["position"], position,
+                                  lo=start_index)
+
+    def matches_for_positions(self, start_position: int,
+                              end_position: int) -> numpy.ndarray:
+        start_index = self.find_first_at_position(start_position)
+        end_index = self.find_first_at_position(end_position, start_index)
+        return self.matches[start_index:end_index]
+
+    def read_columns(self, start_index: int,
+                     end_index: int) -> MatchesColumns:
+        records = self.matches[start_index:end_index]
+        assert not records["padding"].any(), "padding must be zero"
+        return (array(WORD_TYPECODE,
+                      records["position"].astype("=u4").tobytes()),
+                array(WORD_TYPECODE,
+                      records["length"].astype("=u4").tobytes()),
+                array(WORD_TYPECODE,
+                      records["offset"].astype("=u4").tobytes()))
+
+    def reader(self, start_index: int = 0,
+               block_size: int = DEFAULT_BLOCK_SIZE) -> MatchesReader:
+        return MappedMatchesReader(self, start_index, block_size)
+
+
+class MappedMatchesReader(MatchesReader):
+    def __init__(self, match_file: MatchFile, start_index: int,
+                 block_size: int):
+        assert 0 <= start_index <= len(match_file)
+        super().__init__(None, len(match_file) - start_index, block_size)
+        self.match_file = match_file
+        self.next_record_index = start_index
+
+    def read_columns(self) -> MatchesColumns:
+        count = min(self.block_size, self.remaining_matches)
+        start_index = self.next_record_index
+        self.next_record_index += count
+        self.remaining_matches -= count
+        return self.match_file.read_columns(start_index,
+                                            self.next_record_index)
@@ -16,24 +16,87 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 #
+import contextlib
+import mmap
+import multiprocessing
 import os
+import zlib
 from array import array
-from typing import BinaryIO, Optional, List, Union
+from collections import Counter
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, List, \
+    Tuple, Type, Union
 
+from tmf import telemetry, validation
 from tmf.header import Header
 from tmf.match import Match
+from tmf.match_codec import MatchesColumns, create_matches_writer
+from tmf.match_collector import ColumnarMatchCollector, MatchCollector, \
+    StandardMatchCollector
+from tmf.position_index import DEFAULT_INDEX_BLOCK_SIZE, PositionIndex
+from tmf.spill import FILL_CHUNK_SIZE, MatchesSpill, allocate_mapped_words, \
+    allocate_words
+from tmf.telemetry import ProgressReporter, Telemetry
+
+# number of position ranges per job when match finder can start anywhere
+RANGES_PER_JOB = 8
 
 
 class ExhaustiveMatchFinder:
-    def __init__(self, input_data: array, min_match: int, max_match: int):
+    # whether skipping to a position is much cheaper than collecting matches
+    # for skipped positions, only then position ranges can be processed in
+    # parallel
+    SUPPORTS_RANDOM_START = False
+    # whether state can be kept within memory budget by spilling to disk
+    SUPPORTS_MEMORY_BUDGET = False
+
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None,
+                 memory_budget: Optional[int] = None):
+        assert max_offset is None or max_offset >= 1
+        assert memory_budget is None or memory_budget >= 1
         self.input_data = input_data
         self.input_size = len(input_data)
         self.min_match = min_match
         self.max_match = max_match
+        # sources further than max_offset are outside of sliding window
+        self.max_offset = max_offset
+        # approximate limit of memory used by match finder state in bytes
+        self.memory_budget = memory_budget
         self.position = -1
 
+    def skip_to_position(self, position: int) -> None:
+        # next collected matches will be for specified position
+        assert self.position < position <= self.input_size
+        offsets_buffer = [0] * (self.max_match + 1)
+        while self.position + 1 < position:
+            self.collect_matches_for_next_position(offsets_buffer)
+
+    def limit_to_window(self, offsets_buffer: List[int],
+                        current_max_match: int) -> int:
+        # optimal offsets don't decrease with match length, so dropping
+        # matches from outside of window shortens current max match
+        if self.max_offset is not None:
+            while current_max_match >= self.min_match and \
+                    offsets_buffer[current_max_match] > self.max_offset:
+                current_max_match -= 1
+        return current_max_match
+
+    def validate_offsets(self, offsets_buffer: List[int],
+                         current_max_match: int) -> None:
+        for match_length in range(min(self.min_match, current_max_match + 1)):
+            assert offsets_buffer[match_length] == 0
+        for match_length in range(self.min_match, current_max_match + 1):
+            assert offsets_buffer[match_length] > 0
+
 
 class BruteForceMatchFinder(ExhaustiveMatchFinder):
+    SUPPORTS_RANDOM_START = True
+    SUPPORTS_MEMORY_BUDGET = True
+
+    def skip_to_position(self, position: int) -> None:
+        assert self.position < position <= self.input_size
+        self.position = position - 1
+
     def collect_matches_for_next_position(
             self, offsets_buffer: List[int]) -> int:
         self.position += 1
@@ -41,7 +104,9 @@ class BruteForceMatchFinder(ExhaustiveMatchFinder):
         current_max_match = 0
         offsets_buffer[0] = 0
         offset = 1
-        while offset <= self.position and current_max_match < self.max_match:
+        max_offset = self.position if self.max_offset is None else \
+            min(self.position, self.max_offset)
+        while offset <= max_offset and current_max_match < self.max_match:
             match_length = Match.compute_match_length(
                 self.input_data, self.position - offset,
                 self.position, self.max_match)
@@ -50,16 +115,15 @@ class BruteForceMatchFinder(ExhaustiveMatchFinder):
                 offsets_buffer[current_max_match] = \
                     offset if current_max_match >= self.min_match else 0
             offset += 1
-        for match_length in range(min(self.min_match, current_max_match + 1)):
-            assert offsets_buffer[match_length] == 0
-        for match_length in range(self.min_match, current_max_match + 1):
-            assert offsets_buffer[match_length] > 0
+        if validation.checked(self.position):
+            self.validate_offsets(offsets_buffer, current_max_match)
         return current_max_match
 
 
 class FatHashMapMatchFinder(ExhaustiveMatchFinder):
-    def __init__(self, input_data: array, min_match: int, max_match: int):
-        super().__init__(input_data, min_match, max_match)
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset)
         hash_lengths = []
         for match_length in range(max_match + 1):
             if match_length < min_match:
@@ -77,6 +141,10 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
             [[None] * (1 << hash_lengths[match_length])
              if match_length >= min_match else None
              for match_length in range(max_match + 1)]
+        # stale positions are evicted when found during lookups, but some
+        # buckets are never visited again, so they are swept periodically
+        self.sweep_period = None if max_offset is None else max(
+            max_offset, sum(1 << hash_length for hash_length in hash_lengths))
 
     def collect_matches_for_next_position(
             self, offsets_buffer: List[int]) -> int:
@@ -105,8 +173,44 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
                 assert type(substrings_entry) is array
                 substrings_entry.append(new_substring_position)
 
+        def evict_stale_positions(substrings_by_hash: List[Union[Optional[int],
+                                                                 array]],
+                                  substring_hash: int,
+                                  substrings_entry: Union[Optional[int],
+                                                          array]) -> \
+                Union[Optional[int], array]:
+            # positions before window start are forgotten
+            if substrings_entry is None:
+                return None
+            elif type(substrings_entry) is int:
+                if substrings_entry < window_start:
+                    substrings_by_hash[substring_hash] = None
+                    return None
+                return substrings_entry
+            else:
+                assert type(substrings_entry) is array
+                if min(substrings_entry) >= window_start:
+                    return substrings_entry
+                remaining = array("Q", [
+                    source_pos for source_pos in substrings_entry
+                    if source_pos >= window_start])
+                substrings_by_hash[substring_hash] = \
+                    None if len(remaining) == 0 else \
+                    remaining[0] if len(remaining) == 1 else remaining
+                return substrings_by_hash[substring_hash]
+
         self.position += 1
+        window_start = 0 if self.max_offset is None else \
+            self.position - self.max_offset
+        if window_start > 0 and self.position % self.sweep_period == 0:
+            for substrings_by_hash in self.hash_maps_by_match_length:
+                if substrings_by_hash is not None:
+                    for substring_hash in range(len(substrings_by_hash)):
+                        evict_stale_positions(
+                            substrings_by_hash, substring_hash,
+                            substrings_by_hash[substring_hash])
         assert 0 <= self.position < self.input_size
+        checked = validation.checked(self.position)
         current_max_match = 0
         offsets_buffer[0] = 0
         max_match = min(self.max_match, self.input_size - self.position)
@@ -114,6 +218,8 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
         last_matching_length = None
         last_matching_source = None
         last_matching_hash = None
+        hash_probes = 0
+        bucket_entries = 0
         for match_length in range(1, max_match + 1):
             next_byte_index = self.position + match_length - 1
             assert 0 <= next_byte_index < self.input_size
@@ -124,7 +230,15 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
             substrings_by_hash = self.hash_maps_by_match_length[match_length]
             hash_mask = self.hash_masks_by_match_length[match_length]
             substrings_entry = substrings_by_hash[prefix_hash & hash_mask]
+            if window_start > 0 and substrings_entry is not None and \
+                    (type(substrings_entry) is not int or
+                     substrings_entry < window_start):
+                substrings_entry = evict_stale_positions(
+                    substrings_by_hash, prefix_hash & hash_mask,
+                    substrings_entry)
             substrings_for_hash = union_to_array(substrings_entry)
+            hash_probes += 1
+            bucket_entries += len(substrings_for_hash)
             if last_matching_source is not None and \
                     len(substrings_for_hash) > 1 and \
                     last_matching_source in substrings_for_hash:
@@ -177,20 +291,24 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
                     break
             if not match_found:
                 break
+        if telemetry.counters is not None:
+            telemetry.counters["hash_probes"] += hash_probes
+            telemetry.counters["bucket_entries"] += bucket_entries
         if last_matching_length is None:
             assert current_max_match == 0
             if self.input_size - self.position >= self.min_match:
-                recreated_hash = hash(())
-                for byte_index in range(self.min_match):
-                    next_byte = self.input_data[self.position + byte_index]
-                    recreated_hash = hash((recreated_hash, next_byte))
-                assert recreated_hash == prefix_hash
+                if checked:
+                    recreated_hash = hash(())
+                    for byte_index in range(self.min_match):
+                        next_byte = self.input_data[self.position + byte_index]
+                        recreated_hash = hash((recreated_hash, next_byte))
+                    assert recreated_hash == prefix_hash
                 substrings_by_hash = \
                     self.hash_maps_by_match_length[self.min_match]
                 hash_mask = self.hash_masks_by_match_length[self.min_match]
                 substrings_entry = substrings_by_hash[prefix_hash & hash_mask]
-                substrings_for_hash = union_to_array(substrings_entry)
-                assert self.position not in substrings_for_hash
+                assert not checked or \
+                    self.position not in union_to_array(substrings_entry)
                 append_position(substrings_by_hash, prefix_hash & hash_mask,
                                 substrings_entry, self.position)
         elif current_max_match < max_match:
@@ -221,9 +339,11 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
                     hash_mask = self.hash_masks_by_match_length[match_length]
                     substrings_entry = \
                         substrings_by_hash[prefix_hash & hash_mask]
-                    substrings_for_hash = union_to_array(substrings_entry)
-                    assert last_matching_source not in substrings_for_hash and \
-                           self.position not in substrings_for_hash
+                    if checked:
+                        substrings_for_hash = union_to_array(substrings_entry)
+                        assert last_matching_source not in \
+                            substrings_for_hash
+                        assert self.position not in substrings_for_hash
                     append_position(substrings_by_hash, prefix_hash & hash_mask,
                                     substrings_entry, self.position)
                 # add missing branches at level full_match_length + 1
@@ -245,7 +365,8 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
                                             top_prefix_hash & hash_mask,
                                             substrings_entry, source_pos)
                     else:
-                        assert source_pos not in substrings_for_hash
+                        assert not checked or \
+                            source_pos not in substrings_for_hash
                         append_position(substrings_by_hash,
                                         top_prefix_hash & hash_mask,
                                         substrings_entry, source_pos)
@@ -255,66 +376,1305 @@ class FatHashMapMatchFinder(ExhaustiveMatchFinder):
                 offsets_buffer[current_max_match] = \
                     self.position - last_matching_source
                 assert current_max_match == match_length
+        if checked:
+            self.validate_offsets(offsets_buffer, current_max_match)
+        return current_max_match
+
+
+class RollingHashMatchFinder(ExhaustiveMatchFinder):
+    # same algorithm as in FatHashMapMatchFinder, but prefixes are keyed by
+    # polynomial hashes and stored in flat open addressing tables, one per
+    # match length, that grow with the number of distinct prefixes, with
+    # window positions before window start count as empty slots and are
+    # dropped from tables periodically
+    HASH_BASE = 0x5BD1E995
+    HASH_MODULUS = (1 << 61) - 1
+    INITIAL_TABLE_SIZE = 1 << 4
+
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset)
+        self.input_bytes = bytes(input_data)
+        self.prefix_hashes = array("Q", [0]) * (max_match + 1)
+        # position -1 marks empty slot
+        self.table_positions: List[Optional[array]] = \
+            [array("i", [-1]) * RollingHashMatchFinder.INITIAL_TABLE_SIZE
+             if match_length >= min_match else None
+             for match_length in range(max_match + 1)]
+        self.table_hashes: List[Optional[array]] = \
+            [array("Q", [0]) * RollingHashMatchFinder.INITIAL_TABLE_SIZE
+             if match_length >= min_match else None
+             for match_length in range(max_match + 1)]
+        # number of occupied slots, including ones with stale positions
+        self.table_sizes = array("i", [0]) * (max_match + 1)
+        self.window_start = 0
+        self.sweep_period = None if max_offset is None else max(
+            max_offset, (max_match - min_match + 1) *
+            RollingHashMatchFinder.INITIAL_TABLE_SIZE)
+
+    def find_slot(self, match_length: int, prefix_hash: int, position: int,
+                  known_source: Optional[int] = None) -> int:
+        # returns slot with prefix equal to the one at specified position
+        # (its position can be stale) or empty slot where such prefix can be
+        # inserted, known_source shares
+        # all bytes of prefix except the last one with specified position
+        positions = self.table_positions[match_length]
+        hashes = self.table_hashes[match_length]
+        input_bytes = self.input_bytes
+        mask = len(positions) - 1
+        slot = prefix_hash & mask
+        collisions = 0
+        while True:
+            source_pos = positions[slot]
+            if source_pos < 0:
+                break
+            if hashes[slot] == prefix_hash:
+                if source_pos == known_source:
+                    if input_bytes[source_pos + match_length - 1] == \
+                            input_bytes[position + match_length - 1]:
+                        break
+                elif input_bytes[source_pos:source_pos + match_length] == \
+                        input_bytes[position:position + match_length]:
+                    break
+            slot = (slot + 1) & mask
+            collisions += 1
+        if telemetry.counters is not None:
+            telemetry.counters["hash_probes"] += 1
+            telemetry.counters["hash_collisions"] += collisions
+        return slot
+
+    def insert(self, match_length: int, prefix_hash: int, slot: int,
+               position: int) -> None:
+        positions = self.table_positions[match_length]
+        assert positions[slot] < self.window_start
+        if positions[slot] < 0:
+            self.table_sizes[match_length] += 1
+        positions[slot] = position
+        self.table_hashes[match_length][slot] = prefix_hash
+        if self.table_sizes[match_length] * 2 > len(positions):
+            self.rebuild_table(match_length, len(positions) * 2)
+
+    def rebuild_table(self, match_length: int, table_size: int) -> None:
+        # stale positions are not copied
+        old_positions = self.table_positions[match_length]
+        old_hashes = self.table_hashes[match_length]
+        positions = array("i", [-1]) * table_size
+        hashes = array("Q", [0]) * table_size
+        mask = table_size - 1
+        window_start = self.window_start
+        occupied_slots = 0
+        for old_slot in range(len(old_positions)):
+            position = old_positions[old_slot]
+            if position >= window_start:
+                prefix_hash = old_hashes[old_slot]
+                slot = prefix_hash & mask
+                while positions[slot] >= 0:
+                    slot = (slot + 1) & mask
+                positions[slot] = position
+                hashes[slot] = prefix_hash
+                occupied_slots += 1
+        self.table_positions[match_length] = positions
+        self.table_hashes[match_length] = hashes
+        self.table_sizes[match_length] = occupied_slots
+
+    def sweep_tables(self) -> None:
+        # some stale positions are never looked up again, so tables are
+        # rebuilt and shrunk to fit positions within window
+        window_start = self.window_start
+        for match_length in range(self.min_match, self.max_match + 1):
+            live_slots = sum(1 for position in
+                             self.table_positions[match_length]
+                             if position >= window_start)
+            table_size = RollingHashMatchFinder.INITIAL_TABLE_SIZE
+            while live_slots * 4 > table_size:
+                table_size *= 2
+            self.rebuild_table(match_length, table_size)
+
+    def collect_matches_for_next_position(
+            self, offsets_buffer: List[int]) -> int:
+        self.position += 1
+        assert 0 <= self.position < self.input_size
+        position = self.position
+        if self.max_offset is not None:
+            self.window_start = max(position - self.max_offset, 0)
+            if self.window_start > 0 and position % self.sweep_period == 0:
+                self.sweep_tables()
+        window_start = self.window_start
+        input_bytes = self.input_bytes
+        prefix_hashes = self.prefix_hashes
+        hash_base = RollingHashMatchFinder.HASH_BASE
+        hash_modulus = RollingHashMatchFinder.HASH_MODULUS
+        current_max_match = 0
+        offsets_buffer[0] = 0
+        max_match = min(self.max_match, self.input_size - position)
+        prefix_hash = 0
+        last_matching_source = None
+        # follow explicit prefixes shared with earlier positions
+        for match_length in range(1, max_match + 1):
+            prefix_hash = (prefix_hash * hash_base +
+                           input_bytes[position + match_length - 1] + 1) % \
+                hash_modulus
+            prefix_hashes[match_length] = prefix_hash
+            if match_length < self.min_match:
+                continue
+            slot = self.find_slot(match_length, prefix_hash, position,
+                                  last_matching_source)
+            positions = self.table_positions[match_length]
+            source_pos = positions[slot]
+            if source_pos < window_start:
+                break
+            assert current_max_match == match_length - 1 or \
+                   match_length == self.min_match
+            current_max_match = match_length
+            offsets_buffer[match_length] = position - source_pos
+            positions[slot] = position
+            last_matching_source = source_pos
+        if last_matching_source is None:
+            assert current_max_match == 0
+            if self.input_size - position >= self.min_match:
+                prefix_hash = prefix_hashes[self.min_match]
+                self.insert(self.min_match, prefix_hash,
+                            self.find_slot(self.min_match, prefix_hash,
+                                           position), position)
+        elif current_max_match < max_match:
+            full_match_length = Match.compute_match_length(
+                input_bytes, last_matching_source + current_max_match,
+                position + current_max_match,
+                max_match - current_max_match) + current_max_match
+            assert current_max_match <= full_match_length <= max_match
+            # no need to create missing entries for previous suffix if it
+            # shares at least max_match bytes with current one
+            if full_match_length < max_match:
+                prefix_hash = prefix_hashes[current_max_match]
+                # add intermediate levels on shared path
+                for match_length in range(current_max_match + 1,
+                                          full_match_length + 1):
+                    prefix_hash = (prefix_hash * hash_base + input_bytes[
+                        position + match_length - 1] + 1) % hash_modulus
+                    slot = self.find_slot(match_length, prefix_hash, position)
+                    self.insert(match_length, prefix_hash, slot, position)
+                # add missing branches at level full_match_length + 1
+                for source_pos in [last_matching_source, position]:
+                    top_prefix_hash = (prefix_hash * hash_base + input_bytes[
+                        source_pos + full_match_length] + 1) % hash_modulus
+                    slot = self.find_slot(full_match_length + 1,
+                                          top_prefix_hash, source_pos)
+                    existing_pos = \
+                        self.table_positions[full_match_length + 1][slot]
+                    if existing_pos < window_start:
+                        self.insert(full_match_length + 1, top_prefix_hash,
+                                    slot, source_pos)
+                    else:
+                        assert full_match_length == current_max_match and \
+                               existing_pos == source_pos == \
+                               last_matching_source
+            for match_length in range(current_max_match + 1,
+                                      full_match_length + 1):
+                offsets_buffer[match_length] = position - last_matching_source
+            current_max_match = full_match_length
+        if validation.checked(position):
+            self.validate_offsets(offsets_buffer, current_max_match)
+        return current_max_match
+
+
+class HashHeadsMatchFinder(ExhaustiveMatchFinder):
+    # head table keyed on first min_match bytes, as in zlib or LZMA
+    MAX_HEADS_BITS = 20
+    SUPPORTS_MEMORY_BUDGET = True
+
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None,
+                 memory_budget: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset,
+                         memory_budget)
+        heads_bits = min(max(self.input_size, 1).bit_length(),
+                         HashHeadsMatchFinder.MAX_HEADS_BITS)
+        self.heads_mask = (1 << heads_bits) - 1
+        # position -1 marks no position
+        self.heads = allocate_words(1 << heads_bits, -1, memory_budget)
+
+    def replace_head(self, position: int) -> int:
+        # returns previous head for first min_match bytes at position
+        head_index = zlib.crc32(self.input_data[
+            position:position + self.min_match]) & self.heads_mask
+        previous_head = self.heads[head_index]
+        self.heads[head_index] = position
+        return previous_head
+
+
+class HashChainMatchFinder(HashHeadsMatchFinder):
+    # hash chains walked from the nearest candidate to the farthest one
+    SUPPORTS_RANDOM_START = True
+
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None,
+                 memory_budget: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset,
+                         memory_budget)
+        self.previous = allocate_words(self.input_size, -1, memory_budget)
+
+    def insert_position(self, position: int) -> int:
+        # returns previous head of chain which position was inserted into
+        chain_head = self.replace_head(position)
+        self.previous[position] = chain_head
+        return chain_head
+
+    def skip_to_position(self, position: int) -> None:
+        # chains need all earlier positions, but not matches for them
+        assert self.position < position <= self.input_size
+        last_source = min(position, self.input_size - self.min_match + 1)
+        for source_pos in range(self.position + 1, last_source):
+            self.insert_position(source_pos)
+        self.position = position - 1
+
+    def collect_matches_for_next_position(
+            self, offsets_buffer: List[int]) -> int:
+        self.position += 1
+        assert 0 <= self.position < self.input_size
+        position = self.position
+        max_match = min(self.max_match, self.input_size - position)
+        if max_match < self.min_match:
+            offsets_buffer[0] = 0
+            if validation.checked(position):
+                self.validate_offsets(offsets_buffer, 0)
+            return 0
+        input_bytes = self.input_data
+        previous = self.previous
+        max_offset = position if self.max_offset is None else \
+            min(position, self.max_offset)
+        current_max_match = 0
+        # candidate needs to share more than that many bytes to be useful
+        shared_length = self.min_match - 1
+        source_pos = self.insert_position(position)
+        chain_candidates = 0
+        while source_pos >= 0 and position - source_pos <= max_offset:
+            chain_candidates += 1
+            if input_bytes[source_pos + shared_length] == \
+                    input_bytes[position + shared_length] and \
+                    input_bytes[source_pos:source_pos + shared_length] == \
+                    input_bytes[position:position + shared_length]:
+                match_length = shared_length + 1
+                while match_length < max_match and \
+                        input_bytes[source_pos + match_length] == \
+                        input_bytes[position + match_length]:
+                    match_length += 1
+                for new_match_length in range(shared_length + 1,
+                                              match_length + 1):
+                    offsets_buffer[new_match_length] = position - source_pos
+                current_max_match = match_length
+                shared_length = match_length
+                if match_length == max_match:
+                    break
+            source_pos = previous[source_pos]
+        if telemetry.counters is not None:
+            telemetry.counters["chain_walks"] += 1
+            telemetry.counters["chain_candidates"] += chain_candidates
         for match_length in range(min(self.min_match, current_max_match + 1)):
-            assert offsets_buffer[match_length] == 0
-        for match_length in range(self.min_match, current_max_match + 1):
-            assert offsets_buffer[match_length] > 0
+            offsets_buffer[match_length] = 0
+        if validation.checked(position):
+            self.validate_offsets(offsets_buffer, current_max_match)
         return current_max_match
 
 
-def find_all_essential_matches(
-        match_finder_name: str, min_match: int, max_match: int,
-        input_file: BinaryIO, essential_matches_file: BinaryIO,
-        progress_period: Optional[int]) -> None:
-    # read input file
-    input_file_size = os.path.getsize(input_file.name)
-    input_data = array("B")
-    input_data.fromfile(input_file, input_file_size)
-    assert len(input_data) == input_file_size
-    # start writing essential matches file
-    essential_matches_file_header = \
-        Header.for_essential_matches(input_file_size, min_match, max_match)
-    essential_matches_file_header.validate()
-    essential_matches_file_header.to_file(essential_matches_file)
-    # variables and match finder
-    inherited_offsets = [0] * (max_match + 1)
-    current_offsets = [0] * (max_match + 1)
-    inherited_max_match = 0
+class BinaryTreeMatchFinder(HashHeadsMatchFinder):
+    # binary trees as in LZMA's bt4, one tree per hash of first min_match
+    # bytes, ordered lexicographically by suffixes (up to max_match bytes)
+    # and heap ordered by positions, so walk from root to place of insertion
+    # visits candidates from the nearest to the farthest one, and for every
+    # match length it passes through the nearest source of that length
+
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None,
+                 memory_budget: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset,
+                         memory_budget)
+        # children of position p are at indices 2p (left) and 2p + 1 (right)
+        self.children = allocate_words(2 * self.input_size, -1,
+                                       memory_budget)
+
+    def collect_matches_for_next_position(
+            self, offsets_buffer: List[int]) -> int:
+        self.position += 1
+        assert 0 <= self.position < self.input_size
+        position = self.position
+        max_match = min(self.max_match, self.input_size - position)
+        if max_match < self.min_match:
+            offsets_buffer[0] = 0
+            if validation.checked(position):
+                self.validate_offsets(offsets_buffer, 0)
+            return 0
+        input_bytes = self.input_data
+        children = self.children
+        max_offset = position if self.max_offset is None else \
+            min(position, self.max_offset)
+        current_max_match = 0
+        # current position becomes root, old tree is split into its subtrees
+        # which are built at these indices, lengths are shared by all
+        # suffixes that can still go to particular subtree
+        smaller_index = 2 * position
+        smaller_length = 0
+        larger_index = 2 * position + 1
+        larger_length = 0
+        source_pos = self.replace_head(position)
+        tree_nodes = 0
+        while True:
+            if source_pos < 0 or position - source_pos > max_offset:
+                # older suffixes are all out of window
+                children[smaller_index] = -1
+                children[larger_index] = -1
+                break
+            tree_nodes += 1
+            match_length = min(smaller_length, larger_length)
+            while match_length < max_match and \
+                    input_bytes[source_pos + match_length] == \
+                    input_bytes[position + match_length]:
+                match_length += 1
+            if match_length > current_max_match:
+                for new_match_length in range(current_max_match + 1,
+                                              match_length + 1):
+                    offsets_buffer[new_match_length] = position - source_pos
+                current_max_match = match_length
+            if match_length == max_match:
+                # source is superseded by current position
+                children[smaller_index] = children[2 * source_pos]
+                children[larger_index] = children[2 * source_pos + 1]
+                break
+            if input_bytes[source_pos + match_length] < \
+                    input_bytes[position + match_length]:
+                children[smaller_index] = source_pos
+                smaller_index = 2 * source_pos + 1
+                smaller_length = match_length
+                source_pos = children[smaller_index]
+            else:
+                children[larger_index] = source_pos
+                larger_index = 2 * source_pos
+                larger_length = match_length
+                source_pos = children[larger_index]
+        if telemetry.counters is not None:
+            telemetry.counters["tree_walks"] += 1
+            telemetry.counters["tree_nodes"] += tree_nodes
+        for match_length in range(min(self.min_match, current_max_match + 1)):
+            offsets_buffer[match_length] = 0
+        if current_max_match < self.min_match:
+            current_max_match = 0
+        if validation.checked(position):
+            self.validate_offsets(offsets_buffer, current_max_match)
+        return current_max_match
+
+
+class TarsaMatchFinderEngine:
+    REMAPPED_ALPHABET_RADIX_SEARCH_THRESHOLD: int = 70
+    LCP_AWARE_INSERTION_SORT_THRESHOLD: int = 10
+
+    # number of bytes per input byte taken by arrays indexed by suffix
+    ARRAYS_SIZE_FACTOR: int = 4 + 4 + 1 + 1 + 4 + 4
+
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 memory_budget: Optional[int] = None):
+        self.input_data = input_data
+        self.input_view = memoryview(input_data)
+        self.size = len(input_data)
+        self.min_match = min_match
+        self.max_match = max_match
+        size = self.size
+        # arrays are kept in temporary files mapped to memory if they take
+        # more than half of memory budget
+        if memory_budget is not None and \
+                size * self.ARRAYS_SIZE_FACTOR > memory_budget // 2:
+            def allocate(typecode: str) -> Union[array, memoryview]:
+                return allocate_mapped_words(size, 0, typecode)
+            self.suffix_array = allocate("i")
+            for chunk_start in range(0, size, FILL_CHUNK_SIZE):
+                chunk_end = min(chunk_start + FILL_CHUNK_SIZE, size)
+                self.suffix_array[chunk_start:chunk_end] = \
+                    array("i", range(chunk_start, chunk_end))
+        else:
+            def allocate(typecode: str) -> Union[array, memoryview]:
+                return array(typecode, [0]) * size
+            self.suffix_array = array("i", range(size))
+        self.suffix_array_auxiliary = allocate("i")
+        self.back_column = allocate("B")
+        memoryview(self.back_column)[1:] = self.input_view[:-1]
+        self.back_column_auxiliary = allocate("B")
+        self.active_columns = allocate("I")
+        self.active_columns_auxiliary = allocate("I")
+        self.histogram = array("i", [0]) * 256
+        self.destinations = array("i", [0]) * 256
+        self.marker = 1
+        self.markers = array("q", [0]) * 256
+        self.alphabet_mapping = array("i", [0]) * 256
+        self.segments_stack = [array("i", [0]) * (256 + 1)
+                               for _ in range(max_match)]
+        self.lcp_array = \
+            array("i", [0]) * self.LCP_AWARE_INSERTION_SORT_THRESHOLD
+        # accepted matches are not ordered by position, therefore they are
+        # buffered and grouped by position after the whole search
+        self.accepted_positions = array("I")
+        self.accepted_lengths_and_offsets = array("Q")
+        self.discarded_matches_count = 0
+
+    def run(self) -> None:
+        self.radix_search(0, 0, self.size)
+
+    def on_accepted(self, source: int, target: int, length: int) -> None:
+        self.accepted_positions.append(target)
+        self.accepted_lengths_and_offsets.append(
+            (length << 32) | (target - source))
+
+    def on_discarded(self) -> None:
+        self.discarded_matches_count += 1
+
+    def radix_search(self, lcp_length: int, starting_index: int,
+                     unsafe_elements_number: int) -> None:
+        if unsafe_elements_number < \
+                self.REMAPPED_ALPHABET_RADIX_SEARCH_THRESHOLD:
+            self.radix_search_remapped(
+                lcp_length, starting_index, unsafe_elements_number)
+        elif lcp_length < self.max_match:
+            elements_number = self.output_matches_for_segment(
+                lcp_length, starting_index, unsafe_elements_number)
+            ending_index = starting_index + elements_number
+            active_columns = self.active_columns
+            histogram = self.histogram
+            for value in range(256):
+                histogram[value] = 0
+            for index in range(starting_index, ending_index):
+                histogram[active_columns[index] & 0xFF] += 1
+            destinations = self.destinations
+            destinations[0] = starting_index
+            for value in range(1, 256):
+                destinations[value] = \
+                    destinations[value - 1] + histogram[value - 1]
+            self.distribute(starting_index, ending_index,
+                            lambda column: column & 0xFF)
+            segments = self.segments_stack[lcp_length]
+            segments[0] = starting_index
+            for value in range(1, 256 + 1):
+                segments[value] = segments[value - 1] + histogram[value - 1]
+            for segment_index in range(256):
+                segment_length = \
+                    segments[segment_index + 1] - segments[segment_index]
+                if segment_length > 1:
+                    self.radix_search(lcp_length + 1, segments[segment_index],
+                                      segment_length)
+        else:
+            assert lcp_length == self.max_match
+            self.accept_all_adjacent(lcp_length, starting_index,
+                                     unsafe_elements_number)
+
+    def radix_search_remapped(self, lcp_length: int, starting_index: int,
+                              unsafe_elements_number: int) -> None:
+        if unsafe_elements_number < self.LCP_AWARE_INSERTION_SORT_THRESHOLD:
+            self.lcp_aware_insertion_sort(
+                lcp_length, starting_index, unsafe_elements_number)
+        elif lcp_length < self.max_match:
+            elements_number = self.output_matches_for_segment(
+                lcp_length, starting_index, unsafe_elements_number)
+            ending_index = starting_index + elements_number
+            active_columns = self.active_columns
+            histogram = self.histogram
+            markers = self.markers
+            marker = self.marker
+            alphabet_mapping = self.alphabet_mapping
+            alphabet_size = 0
+            for index in range(starting_index, ending_index):
+                value = active_columns[index] & 0xFF
+                if markers[value] == marker:
+                    histogram[alphabet_mapping[value]] += 1
+                else:
+                    markers[value] = marker
+                    alphabet_mapping[value] = alphabet_size
+                    histogram[alphabet_size] = 1
+                    alphabet_size += 1
+            self.marker += 1
+            destinations = self.destinations
+            destinations[0] = starting_index
+            for value in range(1, alphabet_size):
+                destinations[value] = \
+                    destinations[value - 1] + histogram[value - 1]
+            self.distribute(starting_index, ending_index,
+                            lambda column: alphabet_mapping[column & 0xFF])
+            segments = self.segments_stack[lcp_length]
+            segments[0] = starting_index
+            for value in range(1, alphabet_size + 1):
+                segments[value] = segments[value - 1] + histogram[value - 1]
+            for segment_index in range(alphabet_size):
+                segment_length = \
+                    segments[segment_index + 1] - segments[segment_index]
+                if segment_length > 1:
+                    self.radix_search_remapped(
+                        lcp_length + 1, segments[segment_index],
+                        segment_length)
+        else:
+            assert lcp_length == self.max_match
+            self.accept_all_adjacent(lcp_length, starting_index,
+                                     unsafe_elements_number)
+
+    def output_matches_for_segment(self, lcp_length: int, starting_index: int,
+                                   unsafe_elements_number: int) -> int:
+        suffix_array = self.suffix_array
+        back_column = self.back_column
+        elements_number = unsafe_elements_number
+        last_index = starting_index + unsafe_elements_number - 1
+        if suffix_array[last_index] + lcp_length == self.size:
+            if lcp_length >= self.min_match and starting_index != last_index:
+                if suffix_array[last_index - 1] > 0 and \
+                        suffix_array[last_index] > 0 and \
+                        back_column[last_index - 1] == back_column[last_index]:
+                    self.on_discarded()
+                else:
+                    self.on_accepted(suffix_array[last_index - 1],
+                                     suffix_array[last_index], lcp_length)
+            elements_number -= 1
+        self.refill_or_shift_active_columns(
+            lcp_length, starting_index, elements_number)
+        if lcp_length >= self.min_match:
+            active_columns = self.active_columns
+            for index in range(starting_index + 1,
+                               starting_index + elements_number):
+                if lcp_length < self.max_match and \
+                        (active_columns[index - 1] & 0xFF) == \
+                        (active_columns[index] & 0xFF):
+                    self.on_discarded()
+                elif suffix_array[index - 1] > 0 and suffix_array[index] > 0 \
+                        and back_column[index - 1] == back_column[index]:
+                    self.on_discarded()
+                else:
+                    self.on_accepted(suffix_array[index - 1],
+                                     suffix_array[index], lcp_length)
+        return elements_number
+
+    def accept_all_adjacent(self, lcp_length: int, starting_index: int,
+                            elements_number: int) -> None:
+        suffix_array = self.suffix_array
+        for index in range(starting_index + 1,
+                           starting_index + elements_number):
+            self.on_accepted(suffix_array[index - 1], suffix_array[index],
+                             lcp_length)
+
+    def distribute(self, starting_index: int, ending_index: int,
+                   bucket_of: Callable[[int], int]) -> None:
+        suffix_array = self.suffix_array
+        back_column = self.back_column
+        active_columns = self.active_columns
+        suffix_array_auxiliary = self.suffix_array_auxiliary
+        back_column_auxiliary = self.back_column_auxiliary
+        active_columns_auxiliary = self.active_columns_auxiliary
+        destinations = self.destinations
+        for index in range(starting_index, ending_index):
+            bucket = bucket_of(active_columns[index])
+            destination = destinations[bucket]
+            suffix_array_auxiliary[destination] = suffix_array[index]
+            back_column_auxiliary[destination] = back_column[index]
+            active_columns_auxiliary[destination] = active_columns[index]
+            destinations[bucket] += 1
+        suffix_array[starting_index:ending_index] = \
+            suffix_array_auxiliary[starting_index:ending_index]
+        back_column[starting_index:ending_index] = \
+            back_column_auxiliary[starting_index:ending_index]
+        active_columns[starting_index:ending_index] = \
+            active_columns_auxiliary[starting_index:ending_index]
+
+    def refill_or_shift_active_columns(self, lcp_length: int,
+                                       starting_index: int,
+                                       elements_number: int) -> None:
+        suffix_array = self.suffix_array
+        active_columns = self.active_columns
+        ending_index = starting_index + elements_number
+        if (lcp_length & 3) == 0:
+            input_view = self.input_view
+            for index in range(starting_index, ending_index):
+                chunk_start = suffix_array[index] + lcp_length
+                # bytes past the end of input are treated as zeros
+                active_columns[index] = int.from_bytes(
+                    input_view[chunk_start:chunk_start + 4], "little")
+        else:
+            for index in range(starting_index, ending_index):
+                active_columns[index] >>= 8
+
+    def lcp_aware_insertion_sort(self, common_lcp: int, starting_offset: int,
+                                 elements_number: int) -> None:
+        suffix_array = self.suffix_array
+        back_column = self.back_column
+        active_columns = self.active_columns
+        self.refill_or_shift_active_columns(
+            common_lcp, starting_offset, elements_number)
+        self.lcp_array[0] = common_lcp
+        sorted_elements = 1
+        while sorted_elements < elements_number:
+            insertion_point = self.insert_and_return_index(
+                sorted_elements - 1, starting_offset, common_lcp, common_lcp,
+                sorted_elements)
+            index = starting_offset + sorted_elements
+            suffix_to_insert = suffix_array[index]
+            back_symbol_of_suffix_to_insert = back_column[index]
+            active_column_of_suffix_to_insert = active_columns[index]
+            while index > starting_offset + insertion_point:
+                suffix_array[index] = suffix_array[index - 1]
+                back_column[index] = back_column[index - 1]
+                active_columns[index] = active_columns[index - 1]
+                index -= 1
+            suffix_array[index] = suffix_to_insert
+            back_column[index] = back_symbol_of_suffix_to_insert
+            active_columns[index] = active_column_of_suffix_to_insert
+            sorted_elements += 1
+            self.output_matches_for_inserted_suffix(
+                common_lcp, starting_offset, insertion_point, sorted_elements)
+
+    def insert_and_return_index(self, scanned_position: int,
+                                starting_offset: int, previous_lcp: int,
+                                common_lcp: int,
+                                inserted_suffix_index: int) -> int:
+        lcp_array = self.lcp_array
+        while True:
+            if lcp_array[scanned_position] < previous_lcp:
+                lcp_array[scanned_position + 1] = previous_lcp
+                return scanned_position + 1
+            elif lcp_array[scanned_position] > previous_lcp:
+                if scanned_position > 0:
+                    lcp_array[scanned_position + 1] = \
+                        lcp_array[scanned_position]
+                    scanned_position -= 1
+                else:
+                    lcp_array[1] = lcp_array[0]
+                    lcp_array[0] = previous_lcp
+                    return 0
+            else:
+                lcp = self.compute_lcp(starting_offset, scanned_position,
+                                       inserted_suffix_index, previous_lcp,
+                                       common_lcp)
+                ordered = self.suffixes_ordered(
+                    starting_offset, scanned_position, inserted_suffix_index,
+                    lcp, common_lcp)
+                if ordered:
+                    lcp_array[scanned_position + 1] = previous_lcp
+                    lcp_array[scanned_position] = lcp
+                    return scanned_position + 1
+                elif scanned_position == 0:
+                    lcp_array[1] = lcp_array[0]
+                    lcp_array[0] = lcp
+                    return 0
+                else:
+                    lcp_array[scanned_position + 1] = \
+                        lcp_array[scanned_position]
+                    previous_lcp = lcp
+                    scanned_position -= 1
+
+    def compute_lcp(self, starting_offset: int, earlier_suffix_index: int,
+                    later_suffix_index: int, known_lcp: int,
+                    base_lcp: int) -> int:
+        earlier_suffix_start = \
+            self.suffix_array[starting_offset + earlier_suffix_index]
+        later_suffix_start = \
+            self.suffix_array[starting_offset + later_suffix_index]
+        assert earlier_suffix_start < later_suffix_start
+        assert later_suffix_start + known_lcp <= self.size
+        lcp_limit = min(self.max_match, self.size - later_suffix_start)
+        earlier_suffix_active_columns = \
+            self.active_columns[starting_offset + earlier_suffix_index]
+        later_suffix_active_columns = \
+            self.active_columns[starting_offset + later_suffix_index]
+        if earlier_suffix_active_columns != later_suffix_active_columns:
+            difference = \
+                earlier_suffix_active_columns ^ later_suffix_active_columns
+            current_lcp = base_lcp
+            while (difference & 0xFF) == 0:
+                difference >>= 8
+                current_lcp += 1
+            assert current_lcp >= known_lcp
+            # zero padding past the end of input could extend the match
+            return min(current_lcp, lcp_limit)
+        else:
+            current_lcp = \
+                min(lcp_limit, max(known_lcp, (base_lcp | 3) + 1))
+            input_data = self.input_data
+            while current_lcp < lcp_limit and \
+                    input_data[earlier_suffix_start + current_lcp] == \
+                    input_data[later_suffix_start + current_lcp]:
+                current_lcp += 1
+            return current_lcp
+
+    def suffixes_ordered(self, starting_offset: int, first_suffix_index: int,
+                         second_suffix_index: int, lcp: int,
+                         base_lcp: int) -> bool:
+        first_suffix_start = \
+            self.suffix_array[starting_offset + first_suffix_index]
+        second_suffix_start = \
+            self.suffix_array[starting_offset + second_suffix_index]
+        assert first_suffix_start != second_suffix_start
+        assert first_suffix_start + lcp <= self.size
+        assert second_suffix_start + lcp <= self.size
+        if first_suffix_start + lcp == self.size:
+            return False
+        elif second_suffix_start + lcp == self.size:
+            return True
+        elif lcp == self.max_match:
+            return first_suffix_start < second_suffix_start
+        elif (lcp ^ base_lcp) < 4:
+            shift = (lcp - base_lcp) * 8
+            first_suffix_byte = (self.active_columns[
+                starting_offset + first_suffix_index] >> shift) & 0xFF
+            second_suffix_byte = (self.active_columns[
+                starting_offset + second_suffix_index] >> shift) & 0xFF
+            assert first_suffix_byte != second_suffix_byte
+            return first_suffix_byte < second_suffix_byte
+        else:
+            first_suffix_byte = self.input_data[first_suffix_start + lcp]
+            second_suffix_byte = self.input_data[second_suffix_start + lcp]
+            assert first_suffix_byte != second_suffix_byte
+            return first_suffix_byte < second_suffix_byte
+
+    def output_matches_for_inserted_suffix(self, common_lcp: int,
+                                           starting_offset: int,
+                                           insertion_point: int,
+                                           sorted_elements: int) -> None:
+        suffix_array = self.suffix_array
+        back_column = self.back_column
+        lcp_array = self.lcp_array
+        suffix_to_insert = suffix_array[starting_offset + insertion_point]
+        current_match_length = -1
+        if insertion_point > 0:
+            current_match_length = lcp_array[insertion_point - 1]
+        if lcp_array[insertion_point] > current_match_length:
+            current_match_length = lcp_array[insertion_point]
+        assert current_match_length >= common_lcp
+        prev_best_match_source = -1
+        lex_smaller_scan_index = insertion_point - 1
+        lex_smaller_scan_lcp = -1
+        if lex_smaller_scan_index >= 0:
+            lex_smaller_scan_lcp = lcp_array[lex_smaller_scan_index]
+        lex_greater_scan_index = insertion_point + 1
+        lex_greater_scan_lcp = -1
+        if lex_greater_scan_index < sorted_elements:
+            lex_greater_scan_lcp = lcp_array[lex_greater_scan_index - 1]
+        lcp_lower_limit = max(self.min_match, common_lcp)
+        while current_match_length >= lcp_lower_limit:
+            current_match_source = -1
+            current_match_index = -1
+            while lex_smaller_scan_lcp == current_match_length:
+                lex_smaller_scan_source = \
+                    suffix_array[starting_offset + lex_smaller_scan_index]
+                if lex_smaller_scan_source > current_match_source:
+                    current_match_source = lex_smaller_scan_source
+                    current_match_index = lex_smaller_scan_index
+                lex_smaller_scan_index -= 1
+                if lex_smaller_scan_index >= 0:
+                    lex_smaller_scan_lcp = min(
+                        lex_smaller_scan_lcp, lcp_array[lex_smaller_scan_index])
+                else:
+                    lex_smaller_scan_lcp = -1
+            while lex_greater_scan_lcp == current_match_length:
+                lex_greater_scan_source = \
+                    suffix_array[starting_offset + lex_greater_scan_index]
+                if lex_greater_scan_source > current_match_source:
+                    current_match_source = lex_greater_scan_source
+                    current_match_index = lex_greater_scan_index
+                lex_greater_scan_index += 1
+                if lex_greater_scan_index < sorted_elements:
+                    lex_greater_scan_lcp = min(
+                        lex_greater_scan_lcp,
+                        lcp_array[lex_greater_scan_index - 1])
+                else:
+                    lex_greater_scan_lcp = -1
+            if current_match_source > prev_best_match_source:
+                if current_match_length == self.max_match or \
+                        current_match_source == 0 or \
+                        back_column[starting_offset + current_match_index] != \
+                        back_column[starting_offset + insertion_point]:
+                    self.on_accepted(current_match_source, suffix_to_insert,
+                                     current_match_length)
+                else:
+                    self.on_discarded()
+                prev_best_match_source = current_match_source
+            else:
+                self.on_discarded()
+            current_match_length -= 1
+
+
+class PrecomputedMatchFinder(ExhaustiveMatchFinder):
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None,
+                 memory_budget: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset,
+                         memory_budget)
+        # subclasses fill matches grouped by position, those must contain at
+        # least all essential matches, all of them being optimal
+        self.matches_starts = array("Q")
+        self.lengths_and_offsets = array("Q")
+        self.inherited_offsets = array("i", [0]) * (max_match + 1)
+        self.inherited_max_match = 0
+
+    def precomputed_matches(self, position: int) -> List[int]:
+        # packed lengths and offsets of matches at position, sorted
+        return sorted(self.lengths_and_offsets[
+            self.matches_starts[position]:self.matches_starts[position + 1]])
+
+    def collect_matches_for_next_position(
+            self, offsets_buffer: List[int]) -> int:
+        self.position += 1
+        assert 0 <= self.position < self.input_size
+        current_max_match = 0
+        # unrolling precomputed matches
+        next_match_length = self.min_match
+        for length_and_offset in self.precomputed_matches(self.position):
+            match_length = length_and_offset >> 32
+            offset = length_and_offset & 0xFFFFFFFF
+            while next_match_length <= match_length:
+                offsets_buffer[next_match_length] = offset
+                current_max_match = next_match_length
+                next_match_length += 1
+        # merge inherited matches with current matches
+        inherited_offsets = self.inherited_offsets
+        for match_length in range(self.min_match,
+                                  self.inherited_max_match + 1):
+            if match_length <= current_max_match:
+                offsets_buffer[match_length] = min(
+                    offsets_buffer[match_length],
+                    inherited_offsets[match_length])
+            else:
+                assert match_length == max(current_max_match + 1,
+                                           self.min_match)
+                offsets_buffer[match_length] = inherited_offsets[match_length]
+                current_max_match = match_length
+        for match_length in range(min(self.min_match, current_max_match + 1)):
+            offsets_buffer[match_length] = 0
+        # inheriting matches
+        for inherited_match_length in range(1, current_max_match):
+            inherited_offsets[inherited_match_length] = \
+                offsets_buffer[inherited_match_length + 1]
+        self.inherited_max_match = current_max_match - 1
+        if validation.checked(self.position):
+            self.validate_offsets(offsets_buffer, current_max_match)
+        # precomputed matches ignore window, so it's applied afterwards
+        return self.limit_to_window(offsets_buffer, current_max_match)
+
+
+class SpillingTarsaMatchFinderEngine(TarsaMatchFinderEngine):
+    # accepted matches go to disk instead of growing arrays
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 accepted_matches: MatchesSpill, memory_budget: int):
+        super().__init__(input_data, min_match, max_match, memory_budget)
+        self.accepted_matches = accepted_matches
+
+    def on_accepted(self, source: int, target: int, length: int) -> None:
+        self.accepted_matches.add(target, (length << 32) | (target - source))
+
+
+class TarsaMatchFinder(PrecomputedMatchFinder):
+    SUPPORTS_MEMORY_BUDGET = True
+
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None,
+                 memory_budget: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset,
+                         memory_budget)
+        if memory_budget is not None:
+            # accepted matches are sorted by position using external merge
+            # sort and consumed sequentially, half of memory budget is left
+            # for engine arrays
+            accepted_matches = MatchesSpill(max(memory_budget // 2, 1))
+            engine = SpillingTarsaMatchFinderEngine(
+                input_data, min_match, max_match, accepted_matches,
+                memory_budget)
+            engine.run()
+            self.accepted_matches_count = accepted_matches.matches_count
+            self.discarded_matches_count = engine.discarded_matches_count
+            del engine
+            self.spilled_matches = accepted_matches.merged()
+            self.next_spilled_match = next(self.spilled_matches, None)
+            return
+        engine = TarsaMatchFinderEngine(input_data, min_match, max_match)
+        engine.run()
+        self.accepted_matches_count = len(engine.accepted_positions)
+        self.discarded_matches_count = engine.discarded_matches_count
+        # group accepted matches by position using counting sort
+        self.matches_starts = array("Q", [0]) * (self.input_size + 1)
+        matches_starts = self.matches_starts
+        for position in engine.accepted_positions:
+            matches_starts[position + 1] += 1
+        for position in range(self.input_size):
+            matches_starts[position + 1] += matches_starts[position]
+        self.lengths_and_offsets = \
+            array("Q", [0]) * self.accepted_matches_count
+        destinations = matches_starts[:-1]
+        for position, length_and_offset in zip(
+                engine.accepted_positions,
+                engine.accepted_lengths_and_offsets):
+            self.lengths_and_offsets[destinations[position]] = \
+                length_and_offset
+            destinations[position] += 1
+
+    def precomputed_matches(self, position: int) -> List[int]:
+        if self.memory_budget is None:
+            return super().precomputed_matches(position)
+        lengths_and_offsets = []
+        while self.next_spilled_match is not None and \
+                self.next_spilled_match[0] == position:
+            lengths_and_offsets.append(self.next_spilled_match[1])
+            self.next_spilled_match = next(self.spilled_matches, None)
+        assert self.next_spilled_match is None or \
+            self.next_spilled_match[0] > position
+        return lengths_and_offsets
+
+
+class SuffixArrayMatchFinder(PrecomputedMatchFinder):
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset)
+        import numpy
+        from tmf import suffix_array
+        positions, lengths, offsets = suffix_array.find_essential_matches(
+            numpy.frombuffer(input_data, dtype=numpy.uint8),
+            min_match, max_match)
+        matches_starts = numpy.zeros(self.input_size + 1, dtype=numpy.uint64)
+        matches_starts[1:] = numpy.cumsum(
+            numpy.bincount(positions, minlength=self.input_size))
+        self.matches_starts = array("Q", matches_starts.tobytes())
+        lengths_and_offsets = (lengths.astype(numpy.uint64) << 32) | \
+            offsets.astype(numpy.uint64)
+        self.lengths_and_offsets = array("Q", lengths_and_offsets.tobytes())
+
+
+class SegmentedMatchFinder(ExhaustiveMatchFinder):
+    # segmented streaming match finder working on input held in memory
+    def __init__(self, input_data: array, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None):
+        super().__init__(input_data, min_match, max_match, max_offset)
+        import io
+        from tmf.segmented import SegmentedMatchFinderEngine
+        engine = SegmentedMatchFinderEngine(min_match, max_match, max_offset)
+        self.engine_offsets = engine.offsets(io.BytesIO(input_data))
+
+    def collect_matches_for_next_position(
+            self, offsets_buffer: List[int]) -> int:
+        self.position += 1
+        assert 0 <= self.position < self.input_size
+        position, offsets, current_max_match = next(self.engine_offsets)
+        assert position == self.position
+        offsets_buffer[:current_max_match + 1] = \
+            offsets[:current_max_match + 1]
+        if validation.checked(position):
+            self.validate_offsets(offsets_buffer, current_max_match)
+        return current_max_match
+
+
+MATCH_FINDER_NAMES = ["bfmf", "hmmf", "rhmf", "hcmf", "btmf", "tmf", "samf",
+                      "sgmf"]
+
+
+def match_finder_class(match_finder_name: str) -> \
+        Type[ExhaustiveMatchFinder]:
     if match_finder_name == "bfmf":
-        match_finder = BruteForceMatchFinder(input_data, min_match, max_match)
+        return BruteForceMatchFinder
     elif match_finder_name == "hmmf":
-        match_finder = FatHashMapMatchFinder(input_data, min_match, max_match)
+        return FatHashMapMatchFinder
+    elif match_finder_name == "rhmf":
+        return RollingHashMatchFinder
+    elif match_finder_name == "hcmf":
+        return HashChainMatchFinder
+    elif match_finder_name == "btmf":
+        return BinaryTreeMatchFinder
+    elif match_finder_name == "tmf":
+        return TarsaMatchFinder
+    elif match_finder_name == "samf":
+        return SuffixArrayMatchFinder
+    elif match_finder_name == "sgmf":
+        return SegmentedMatchFinder
     else:
         raise ValueError("Unknown match finder: " + match_finder_name)
-    assert progress_period is None or progress_period >= 1
-    next_progress_checkpoint = progress_period
+
+
+def create_match_finder(match_finder_name: str, input_data: array,
+                        min_match: int, max_match: int,
+                        max_offset: Optional[int] = None,
+                        memory_budget: Optional[int] = None) -> \
+        ExhaustiveMatchFinder:
+    finder_class = match_finder_class(match_finder_name)
+    if memory_budget is None:
+        return finder_class(input_data, min_match, max_match, max_offset)
+    if not finder_class.SUPPORTS_MEMORY_BUDGET:
+        raise ValueError("Match finder " + match_finder_name +
+                         " doesn't support memory budget")
+    return finder_class(input_data, min_match, max_match, max_offset,
+                        memory_budget)
+
+
+def check_jobs_supported(match_finder_name: str, jobs: int) -> None:
+    # other match finders would rebuild their whole state in every process
+    if jobs > 1 and \
+            not match_finder_class(match_finder_name).SUPPORTS_RANDOM_START:
+        raise ValueError("Match finder " + match_finder_name +
+                         " doesn't support parallel jobs")
+
+
+@contextlib.contextmanager
+def map_input_file(input_file_name: str) -> Iterator[mmap.mmap]:
+    with open(input_file_name, "rb") as input_file:
+        input_data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield input_data
+    finally:
+        try:
+            input_data.close()
+        except BufferError:
+            # views held by match finder still use the mapping, it will be
+            # released together with them
+            pass
+
+
+def filter_essential_matches(position: int, current_offsets: List[int],
+                             current_max_match: int,
+                             inherited_offsets: List[int],
+                             inherited_max_match: int, min_match: int,
+                             collector: MatchCollector) -> None:
+    discarded_matches_count = 0
+    for match_length in range(min_match, current_max_match + 1):
+        current_is_inherited: bool = \
+            match_length <= inherited_max_match and \
+            inherited_offsets[match_length] == current_offsets[match_length]
+        longer_has_same_offset: bool = \
+            match_length < current_max_match and \
+            current_offsets[match_length] == current_offsets[match_length + 1]
+        if (not current_is_inherited) and (not longer_has_same_offset):
+            offset = current_offsets[match_length]
+            assert 1 <= offset <= position
+            collector.on_accepted(position, match_length, offset)
+        else:
+            discarded_matches_count += 1
+    if discarded_matches_count > 0:
+        collector.on_discarded(discarded_matches_count)
+
+
+def inherit_offsets(current_offsets: List[int], current_max_match: int,
+                    inherited_offsets: List[int]) -> int:
+    for inherited_match_length in range(1, current_max_match):
+        inherited_offsets[inherited_match_length] = \
+            current_offsets[inherited_match_length + 1]
+    return current_max_match - 1
+
+
+class EssentialMatchesOutput:
+    # header, matches writer, optional position index, collector and
+    # progress reporter of a command writing essential matches
+    def __init__(self, command: str, essential_matches_file: BinaryIO,
+                 input_size: Optional[int], min_match: int, max_match: int,
+                 progress_period: Optional[int], compact: bool = False,
+                 max_offset: Optional[int] = None,
+                 index_file: Optional[BinaryIO] = None,
+                 index_block_size: int = DEFAULT_INDEX_BLOCK_SIZE,
+                 telemetry_report: Optional[Telemetry] = None):
+        # unknown input size is stored as 0, header is rewritten later then
+        self.header = Header.for_essential_matches(
+            input_size or 0, min_match, max_match, compact, max_offset)
+        self.header.validate()
+        self.header.to_file(essential_matches_file)
+        self.writer = create_matches_writer(essential_matches_file,
+                                            self.header)
+        assert index_file is None or not compact, \
+            "position index requires fixed size match records"
+        self.index_file = index_file
+        self.position_index = \
+            PositionIndex(input_size, index_block_size) \
+            if index_file is not None else None
+        self.collector = StandardMatchCollector(self.writer,
+                                                self.position_index)
+        self.reporter = ProgressReporter(
+            command, input_size, progress_period, telemetry_report,
+            lambda: {"essential_matches": self.writer.matches_written,
+                     "discarded_matches":
+                     self.collector.discarded_matches_count})
+
+    def finish(self) -> None:
+        # must be called after collector and reporter are finished
+        if self.position_index is not None:
+            self.position_index.to_file(self.index_file)
+        print("Essential matches: " +
+              f"{self.writer.matches_written:,}".replace(",", " ") +
+              ", discarded matches: " +
+              f"{self.collector.discarded_matches_count:,}"
+              .replace(",", " "))
+
+
+def find_essential_matches(match_finder_name: str, input_data: array,
+                           min_match: int, max_match: int,
+                           collector: MatchCollector,
+                           progress_period: Optional[int] = None,
+                           max_offset: Optional[int] = None,
+                           reporter: Optional[ProgressReporter] = None,
+                           memory_budget: Optional[int] = None) -> None:
+    assert 1 <= min_match <= max_match <= 120
+    # variables and match finder
+    inherited_offsets = [0] * (max_match + 1)
+    current_offsets = [0] * (max_match + 1)
+    inherited_max_match = 0
+    if reporter is None:
+        reporter = ProgressReporter("find-matches", len(input_data),
+                                    progress_period)
+    next_checkpoint = reporter.next_checkpoint(0)
+    match_finder = create_match_finder(match_finder_name, input_data,
+                                       min_match, max_match, max_offset,
+                                       memory_budget)
     # main loop
-    for position in range(input_file_size):
+    for position in range(len(input_data)):
         # collecting matches for current position
         current_max_match = \
             match_finder.collect_matches_for_next_position(current_offsets)
         # filtering and outputting matches
-        for match_length in range(min_match, current_max_match + 1):
-            current_is_inherited: bool = \
-                match_length <= inherited_max_match and \
-                inherited_offsets[match_length] == current_offsets[match_length]
-            longer_has_same_offset: bool = \
-                match_length < current_max_match and \
-                current_offsets[match_length] == \
-                current_offsets[match_length + 1]
-            if (not current_is_inherited) and (not longer_has_same_offset):
-                optimal_match = Match.from_position_length_offset(
-                    position, match_length, current_offsets[match_length])
-                optimal_match.validate(min_match, max_match)
-                optimal_match.to_file(essential_matches_file)
+        collector.on_position(position)
+        filter_essential_matches(
+            position, current_offsets, current_max_match,
+            inherited_offsets, inherited_max_match, min_match, collector)
         # inheriting matches
-        for inherited_match_length in range(1, current_max_match):
-            inherited_offsets[inherited_match_length] = \
-                current_offsets[inherited_match_length + 1]
-        inherited_max_match = current_max_match - 1
+        inherited_max_match = inherit_offsets(
+            current_offsets, current_max_match, inherited_offsets)
         # display progress status
-        if position + 1 == next_progress_checkpoint:
-            print("Progress status: processed " +
-                  f"{position + 1:,}".replace(",", " ") + " positions")
-            next_progress_checkpoint += progress_period
+        if position + 1 == next_checkpoint:
+            next_checkpoint = reporter.on_progress(position + 1)
+    collector.finish()
+    reporter.finish()
+
+
+def find_all_essential_matches(
+        match_finder_name: str, min_match: int, max_match: int,
+        input_file: BinaryIO, essential_matches_file: BinaryIO,
+        progress_period: Optional[int],
+        index_file: Optional[BinaryIO] = None,
+        index_block_size: int = DEFAULT_INDEX_BLOCK_SIZE,
+        compact: bool = False, jobs: int = 1,
+        max_offset: Optional[int] = None,
+        telemetry_report: Optional[Telemetry] = None,
+        memory_budget: Optional[int] = None) -> None:
+    assert jobs >= 1
+    check_jobs_supported(match_finder_name, jobs)
+    # read input file, within memory budget it's memory mapped instead
+    input_file_size = os.path.getsize(input_file.name)
+    map_input = memory_budget is not None and input_file_size > 0
+    if jobs == 1 and not map_input:
+        input_data = array("B")
+        input_data.fromfile(input_file, input_file_size)
+        assert len(input_data) == input_file_size
+    # start writing essential matches file
+    output = EssentialMatchesOutput(
+        "find-matches", essential_matches_file, input_file_size, min_match,
+        max_match, progress_period, compact, max_offset, index_file,
+        index_block_size, telemetry_report)
+    collector = output.collector
+    reporter = output.reporter
+    if jobs > 1:
+        # every process gets its share of memory budget
+        find_essential_matches_in_parallel(
+            match_finder_name, input_file.name, input_file_size, min_match,
+            max_match, collector, reporter, max_offset, jobs,
+            memory_budget // jobs if memory_budget is not None else None)
+    elif map_input:
+        with map_input_file(input_file.name) as input_data:
+            find_essential_matches(match_finder_name, input_data, min_match,
+                                   max_match, collector, progress_period,
+                                   max_offset, reporter, memory_budget)
+    else:
+        find_essential_matches(match_finder_name, input_data, min_match,
+                               max_match, collector, progress_period,
+                               max_offset, reporter)
+    output.finish()
     print("Done")
+
+
+# (first position offsets, first position max match, essential matches for
+# further positions as columns, discarded matches count, inherited offsets,
+# inherited max match, telemetry counters if requested)
+RangeMatches = Tuple[List[int], int, MatchesColumns, int, List[int], int,
+                     Optional[Dict[str, int]]]
+
+
+def find_essential_matches_in_range(match_finder_name: str,
+                                    input_file_name: str,
+                                    min_match: int, max_match: int,
+                                    max_offset: Optional[int],
+                                    start_position: int,
+                                    end_position: int,
+                                    count_events: bool,
+                                    memory_budget: Optional[int],
+                                    validation_period: int) -> \
+        RangeMatches:
+    # essential matches at first position depend on inherited offsets from
+    # previous range, so they are filtered in the parent process
+    assert start_position < end_position
+    if count_events:
+        # forked worker could inherit counts from parent, so start afresh
+        telemetry.counters = Counter()
+    validation.period = validation_period
+    collector = ColumnarMatchCollector()
+    with map_input_file(input_file_name) as input_data:
+        match_finder = create_match_finder(match_finder_name, input_data,
+                                           min_match, max_match, max_offset,
+                                           memory_budget)
+        match_finder.skip_to_position(start_position)
+        current_offsets = [0] * (max_match + 1)
+        inherited_offsets = [0] * (max_match + 1)
+        first_max_match = \
+            match_finder.collect_matches_for_next_position(current_offsets)
+        first_offsets = current_offsets[:first_max_match + 1]
+        inherited_max_match = inherit_offsets(
+            current_offsets, first_max_match, inherited_offsets)
+        for position in range(start_position + 1, end_position):
+            current_max_match = \
+                match_finder.collect_matches_for_next_position(current_offsets)
+            filter_essential_matches(
+                position, current_offsets, current_max_match,
+                inherited_offsets, inherited_max_match, min_match, collector)
+            inherited_max_match = inherit_offsets(
+                current_offsets, current_max_match, inherited_offsets)
+        del match_finder
+    return first_offsets, first_max_match, collector.columns(), \
+        collector.discarded_matches_count, inherited_offsets, \
+        inherited_max_match, \
+        dict(telemetry.counters) if count_events else None
+
+
+def find_essential_matches_in_range_star(arguments: tuple) -> RangeMatches:
+    return find_essential_matches_in_range(*arguments)
+
+
+def find_essential_matches_in_parallel(
+        match_finder_name: str, input_file_name: str, input_file_size: int,
+        min_match: int, max_match: int, collector: MatchCollector,
+        reporter: ProgressReporter, max_offset: Optional[int],
+        jobs: int, memory_budget: Optional[int] = None) -> None:
+    # split positions into ranges
+    ranges_count = jobs * RANGES_PER_JOB
+    boundaries = sorted(set(input_file_size * index // ranges_count
+                            for index in range(ranges_count + 1)))
+    positions_ranges = list(zip(boundaries[:-1], boundaries[1:]))
+    inherited_offsets = [0] * (max_match + 1)
+    inherited_max_match = 0
+    count_events = telemetry.counters is not None
+    # ranges are processed concurrently, but results are collected in order
+    # and the essential match filter is recomputed at each seam
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.imap(
+            find_essential_matches_in_range_star,
+            [(match_finder_name, input_file_name, min_match, max_match,
+              max_offset, start_position, end_position, count_events,
+              memory_budget, validation.period)
+             for start_position, end_position in positions_ranges])
+        for (start_position, end_position), (
+                first_offsets, first_max_match,
+                (positions, lengths, offsets), discarded_matches_count,
+                range_inherited_offsets, range_inherited_max_match,
+                range_counters) in zip(positions_ranges, results):
+            collector.on_position(start_position)
+            filter_essential_matches(
+                start_position, first_offsets, first_max_match,
+                inherited_offsets, inherited_max_match, min_match, collector)
+            collector.on_accepted_batch(start_position + 1, end_position,
+                                        positions, lengths, offsets)
+            if discarded_matches_count > 0:
+                collector.on_discarded(discarded_matches_count)
+            inherited_offsets = range_inherited_offsets
+            inherited_max_match = range_inherited_max_match
+            if range_counters is not None:
+                telemetry.counters.update(range_counters)
+            # display progress status
+            reporter.on_progress(end_position)
+    collector.finish()
+    reporter.finish()
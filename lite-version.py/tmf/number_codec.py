@@ -16,23 +16,21 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 #
-from array import array
 from typing import BinaryIO
 
 
+def read_exactly(input_file: BinaryIO, num_bytes: int) -> bytes:
+    buffer = input_file.read(num_bytes)
+    if len(buffer) != num_bytes:
+        raise EOFError("read() didn't return enough bytes")
+    return buffer
+
+
 def read_big_endian_number(input_file: BinaryIO, num_bytes: int) -> int:
-    number = 0
-    buffer = array("B")
-    buffer.fromfile(input_file, num_bytes)
-    for byte in buffer:
-        number <<= 8
-        number |= byte
-    return number
+    return int.from_bytes(read_exactly(input_file, num_bytes), "big")
 
 
 def write_big_endian_number(number: int, output_file: BinaryIO,
                             num_bytes: int) -> None:
-    buffer = array("B")
-    for byte_index in range(num_bytes):
-        buffer.append((number >> (8 * (num_bytes - 1 - byte_index))) & 255)
-    buffer.tofile(output_file)
+    number &= (1 << (8 * num_bytes)) - 1
+    output_file.write(number.to_bytes(num_bytes, "big"))
@@ -0,0 +1,132 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import os
+from array import array
+from typing import BinaryIO, List, Optional
+
+from tmf.header import Header
+from tmf.interpolator import InterpolationState
+from tmf.match_codec import create_matches_writer
+from tmf.match_collector import PositionMatchCollector
+from tmf.match_finder import EssentialMatchesOutput, create_match_finder, \
+    filter_essential_matches, inherit_offsets
+from tmf.position_index import DEFAULT_INDEX_BLOCK_SIZE
+from tmf.telemetry import Telemetry
+
+
+def run_pipeline(match_finder_name: str, min_match: int, max_match: int,
+                 input_file: BinaryIO, essential_matches_file: BinaryIO,
+                 progress_period: Optional[int],
+                 interpolated_matches_file: Optional[BinaryIO] = None,
+                 verifier_name: Optional[str] = None,
+                 index_file: Optional[BinaryIO] = None,
+                 index_block_size: int = DEFAULT_INDEX_BLOCK_SIZE,
+                 compact: bool = False, max_offset: Optional[int] = None,
+                 telemetry_report: Optional[Telemetry] = None) -> None:
+    # finds essential matches, interpolates them back and checks the result
+    # against offsets found by match finder, all in one pass over input
+    assert 1 <= min_match <= max_match <= 120
+    # read input file
+    input_file_size = os.path.getsize(input_file.name)
+    input_data = array("B")
+    input_data.fromfile(input_file, input_file_size)
+    assert len(input_data) == input_file_size
+    # start writing essential matches file
+    output = EssentialMatchesOutput(
+        "pipeline", essential_matches_file, input_file_size, min_match,
+        max_match, progress_period, compact, max_offset, index_file,
+        index_block_size, telemetry_report)
+    collector = PositionMatchCollector(output.collector)
+    # optionally start writing interpolated matches file
+    interpolated_matches_writer = None
+    if interpolated_matches_file is not None:
+        interpolated_matches_file_header = Header.for_interpolated_matches(
+            input_file_size, min_match, max_match, compact, max_offset)
+        interpolated_matches_file_header.validate()
+        interpolated_matches_file_header.to_file(interpolated_matches_file)
+        interpolated_matches_writer = create_matches_writer(
+            interpolated_matches_file, interpolated_matches_file_header)
+    # variables and match finders
+    inherited_offsets = [0] * (max_match + 1)
+    current_offsets = [0] * (max_match + 1)
+    inherited_max_match = 0
+    interpolation_state = InterpolationState(min_match, max_match, max_offset)
+    interpolated_offsets = interpolation_state.current_offsets
+    match_finder = create_match_finder(match_finder_name, input_data,
+                                       min_match, max_match, max_offset)
+    verifier = create_match_finder(verifier_name, input_data, min_match,
+                                   max_match, max_offset) \
+        if verifier_name is not None else None
+    verified_offsets = [0] * (max_match + 1)
+    reporter = output.reporter
+    next_checkpoint = reporter.next_checkpoint(0)
+    # main loop
+    for position in range(input_file_size):
+        # collecting matches for current position
+        current_max_match = \
+            match_finder.collect_matches_for_next_position(current_offsets)
+        # filtering and outputting matches
+        collector.on_position(position)
+        filter_essential_matches(
+            position, current_offsets, current_max_match,
+            inherited_offsets, inherited_max_match, min_match, collector)
+        # interpolating essential matches and checking them
+        interpolated_max_match = \
+            interpolation_state.next_position(collector.current_lengths,
+                                              collector.current_offsets)
+        # this comparison is the verification done by pipeline, so unlike
+        # sanity checks it doesn't depend on validation level
+        assert same_matches(min_match, current_offsets, current_max_match,
+                            interpolated_offsets, interpolated_max_match), \
+            "interpolated matches differ from found ones at position " + \
+            str(position)
+        if verifier is not None:
+            verified_max_match = \
+                verifier.collect_matches_for_next_position(verified_offsets)
+            assert same_matches(min_match, current_offsets, current_max_match,
+                                verified_offsets, verified_max_match), \
+                "matches found by " + verifier_name + \
+                " differ at position " + str(position)
+        if interpolated_matches_writer is not None and \
+                current_max_match >= min_match:
+            interpolated_matches_writer.write_run(
+                position, min_match,
+                current_offsets[min_match:current_max_match + 1])
+        # inheriting matches
+        inherited_max_match = inherit_offsets(
+            current_offsets, current_max_match, inherited_offsets)
+        # display progress status
+        if position + 1 == next_checkpoint:
+            next_checkpoint = reporter.on_progress(position + 1)
+    collector.finish()
+    if interpolated_matches_writer is not None:
+        interpolated_matches_writer.flush()
+    reporter.finish()
+    output.finish()
+    print("Verification OK")
+
+
+def same_matches(min_match: int, offsets: List[int], max_match: int,
+                 other_offsets: List[int], other_max_match: int) -> bool:
+    # max match below min match means no matches at all
+    max_match = max(max_match, min_match - 1)
+    other_max_match = max(other_max_match, min_match - 1)
+    return max_match == other_max_match and \
+        offsets[min_match:max_match + 1] == \
+        other_offsets[min_match:max_match + 1]
@@ -0,0 +1,139 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import struct
+import sys
+from array import array
+from typing import BinaryIO
+
+from tmf import number_codec
+from tmf.header import Header
+from tmf.match import Match
+from tmf.match_codec import (WORD_TYPECODE, MatchesColumns, MatchesReader,
+                             count_matches)
+
+DEFAULT_INDEX_BLOCK_SIZE = 1 << 12
+
+
+class PositionIndex:
+    HEADER_SIZE_ON_DISK: int = 8 + 4 + 4
+    HEADER_STRUCT = struct.Struct(">QII")
+    ENTRY_SIZE_ON_DISK: int = 8
+
+    MAGIC_NUMBER = 2346246323452357346
+
+    def __init__(self, input_size: int, block_size: int):
+        self.input_size = input_size
+        self.block_size = block_size
+        # record_indices[block] is the index of the first match record with
+        # position >= block * block_size, the last entry is the matches count
+        self.record_indices = array("Q")
+
+    def validate(self) -> None:
+        assert 0 <= self.input_size < (1 << 31)
+        assert 1 <= self.block_size < (1 << 31)
+        assert len(self.record_indices) == self.blocks_count() + 1
+        for block in range(self.blocks_count()):
+            assert self.record_indices[block] <= self.record_indices[block + 1]
+
+    def blocks_count(self) -> int:
+        return (self.input_size + self.block_size - 1) // self.block_size
+
+    def on_position(self, position: int, records_count: int) -> None:
+        # must be called before writing matches for each position
+        if position % self.block_size == 0:
+            assert len(self.record_indices) == position // self.block_size
+            self.record_indices.append(records_count)
+
+    def finish(self, records_count: int) -> None:
+        assert len(self.record_indices) == self.blocks_count()
+        self.record_indices.append(records_count)
+
+    def records_range(self, start_position: int,
+                      end_position: int) -> range:
+        # superset of records with positions in [start_position, end_position)
+        assert 0 <= start_position <= end_position <= self.input_size
+        if start_position == end_position:
+            return range(0)
+        first_block = start_position // self.block_size
+        last_block = (end_position - 1) // self.block_size
+        return range(self.record_indices[first_block],
+                     self.record_indices[last_block + 1])
+
+    @staticmethod
+    def index_file_name(matches_file_name: str) -> str:
+        return matches_file_name + ".idx"
+
+    @staticmethod
+    def from_file(index_file: BinaryIO):
+        magic_number, input_size, block_size = \
+            PositionIndex.HEADER_STRUCT.unpack(number_codec.read_exactly(
+                index_file, PositionIndex.HEADER_SIZE_ON_DISK))
+        assert magic_number == PositionIndex.MAGIC_NUMBER
+        result = PositionIndex(input_size, block_size)
+        entries_count = result.blocks_count() + 1
+        result.record_indices.frombytes(number_codec.read_exactly(
+            index_file, entries_count * PositionIndex.ENTRY_SIZE_ON_DISK))
+        if sys.byteorder == "little":
+            result.record_indices.byteswap()
+        result.validate()
+        return result
+
+    def to_file(self, output_file: BinaryIO) -> None:
+        self.validate()
+        output_file.write(PositionIndex.HEADER_STRUCT.pack(
+            PositionIndex.MAGIC_NUMBER, self.input_size, self.block_size))
+        entries = array("Q", self.record_indices)
+        if sys.byteorder == "little":
+            entries.byteswap()
+        output_file.write(entries)
+
+
+def read_matches_for_positions(matches_file: BinaryIO,
+                               position_index: PositionIndex,
+                               start_position: int,
+                               end_position: int) -> MatchesColumns:
+    matches_file.seek(0)
+    header = Header.from_file(matches_file)
+    header.validate()
+    assert not header.is_compact()
+    assert header.input_size == position_index.input_size
+    records_range = position_index.records_range(start_position, end_position)
+    assert records_range.stop <= count_matches(matches_file, header)
+    matches_file.seek(header.size_on_disk() +
+                      records_range.start * Match.SIZE_ON_DISK)
+    matches_reader = MatchesReader(matches_file, len(records_range))
+    positions = array(WORD_TYPECODE)
+    lengths = array(WORD_TYPECODE)
+    offsets = array(WORD_TYPECODE)
+    while matches_reader.has_next():
+        position, length, offset = matches_reader.read()
+        if start_position <= position < end_position:
+            positions.append(position)
+            lengths.append(length)
+            offsets.append(offset)
+    return positions, lengths, offsets
+
+
+def show_matches(matches_file: BinaryIO, index_file: BinaryIO,
+                 start_position: int, end_position: int) -> None:
+    position_index = PositionIndex.from_file(index_file)
+    positions, lengths, offsets = read_matches_for_positions(
+        matches_file, position_index, start_position, end_position)
+    for position, length, offset in zip(positions, lengths, offsets):
+        print(f"position = {position}, length = {length}, offset = {offset}")
@@ -0,0 +1,76 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+from typing import BinaryIO, Optional
+
+from tmf.interpolator import interpolate_offsets, open_essential_matches
+from tmf.match_finder import EssentialMatchesOutput, \
+    filter_essential_matches, inherit_offsets
+from tmf.position_index import DEFAULT_INDEX_BLOCK_SIZE
+from tmf.telemetry import Telemetry
+
+
+def reslice(essential_matches_file: BinaryIO,
+            resliced_matches_file: BinaryIO, min_match: int, max_match: int,
+            progress_period: Optional[int], use_memory_map: bool = False,
+            index_file: Optional[BinaryIO] = None,
+            index_block_size: int = DEFAULT_INDEX_BLOCK_SIZE,
+            compact: bool = False,
+            telemetry_report: Optional[Telemetry] = None) -> None:
+    # start reading essential matches file
+    essential_matches_header, essential_matches_reader = \
+        open_essential_matches(essential_matches_file, use_memory_map)
+    input_size = essential_matches_header.input_size
+    assert essential_matches_header.min_match <= min_match <= max_match <= \
+        essential_matches_header.max_match, \
+        "resliced match lengths must be within those of essential matches"
+    # start writing resliced essential matches file
+    output = EssentialMatchesOutput(
+        "reslice", resliced_matches_file, input_size, min_match, max_match,
+        progress_period, compact, essential_matches_header.max_offset,
+        index_file, index_block_size, telemetry_report)
+    collector = output.collector
+    reporter = output.reporter
+    next_checkpoint = reporter.next_checkpoint(0)
+    # variables
+    inherited_offsets = [0] * (max_match + 1)
+    inherited_max_match = 0
+    # process matches
+    for position, current_offsets, current_max_match in interpolate_offsets(
+            essential_matches_reader, input_size,
+            essential_matches_header.min_match,
+            essential_matches_header.max_match,
+            essential_matches_header.max_offset):
+        # optimal offset for a match length doesn't depend on match length
+        # limits, so offsets for narrower limits are a part of wider ones
+        current_max_match = min(current_max_match, max_match)
+        # filtering and outputting matches
+        collector.on_position(position)
+        filter_essential_matches(
+            position, current_offsets, current_max_match,
+            inherited_offsets, inherited_max_match, min_match, collector)
+        # inheriting matches
+        inherited_max_match = inherit_offsets(
+            current_offsets, current_max_match, inherited_offsets)
+        # display progress status
+        if position + 1 == next_checkpoint:
+            next_checkpoint = reporter.on_progress(position + 1)
+    collector.finish()
+    reporter.finish()
+    output.finish()
+    print("Done")
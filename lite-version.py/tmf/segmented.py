@@ -0,0 +1,327 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import os
+from array import array
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from tmf.telemetry import Telemetry
+
+DEFAULT_SEGMENT_SIZE = 1 << 14
+
+READ_CHUNK_SIZE = 1 << 16
+
+# (max length, source) pairs sorted by max length, source is the nearest one
+# for match lengths above previous max length up to this max length
+Staircase = List[Tuple[int, int]]
+
+
+def common_prefix_length(first: bytes, second: bytes) -> int:
+    # binary search, so that slices are compared at native speed
+    low = 0
+    high = min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[low:middle] == second[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def merge_staircases(first: Staircase, second: Staircase) -> Staircase:
+    # the nearest source of both for every match length
+    merged = []
+    first_index = 0
+    second_index = 0
+    while first_index < len(first) or second_index < len(second):
+        max_length = min(
+            first[first_index][0] if first_index < len(first) else 255,
+            second[second_index][0] if second_index < len(second) else 255)
+        source = max(
+            first[first_index][1] if first_index < len(first) else -1,
+            second[second_index][1] if second_index < len(second) else -1)
+        if merged and merged[-1][1] == source:
+            merged[-1] = (max_length, source)
+        else:
+            merged.append((max_length, source))
+        if first_index < len(first) and first[first_index][0] == max_length:
+            first_index += 1
+        if second_index < len(second) and \
+                second[second_index][0] == max_length:
+            second_index += 1
+    return merged
+
+
+class SegmentedMatchFinderEngine:
+    # input is processed in consecutive segments, matches within segment are
+    # found by radix sort match finder, matches with sources in earlier
+    # segments are found while merging sorted segment suffixes into main
+    # trie, see doc/TREES.md
+    #
+    # main trie is stored in leaf order: suffix index of every leaf and depth
+    # of the deepest node shared with previous leaf (zero for the first one),
+    # suffixes are compared by their first max_match bytes and only the
+    # latest suffix is kept for equal prefixes, suffixes out of window are
+    # pruned during merge
+    def __init__(self, min_match: int, max_match: int,
+                 max_offset: Optional[int] = None,
+                 segment_size: int = DEFAULT_SEGMENT_SIZE):
+        assert 1 <= min_match <= max_match <= 120
+        assert max_offset is None or max_offset >= 1
+        assert segment_size >= 1
+        self.min_match = min_match
+        self.max_match = max_match
+        self.max_offset = max_offset
+        self.segment_size = segment_size
+        # input from history_start, covering main trie suffixes, current
+        # segment and lookahead
+        self.history = bytearray()
+        self.history_start = 0
+        self.segment_start = 0
+        self.leaf_suffixes = array("q")
+        self.leaf_depths = array("B")
+
+    def offsets(self, input_file: BinaryIO) -> \
+            Iterator[Tuple[int, List[int], int]]:
+        # yields (position, offsets, max match) for every position, offsets
+        # buffer is reused for all positions and must not be modified by
+        # consumer
+        input_finished = False
+        while True:
+            segment_end = self.segment_start + self.segment_size
+            # lookahead lets matches extend beyond segment end
+            while not input_finished and \
+                    self.history_start + len(self.history) < \
+                    segment_end + self.max_match - 1:
+                chunk = input_file.read(READ_CHUNK_SIZE)
+                if chunk:
+                    self.history += chunk
+                else:
+                    input_finished = True
+            if input_finished:
+                segment_end = min(segment_end,
+                                  self.history_start + len(self.history))
+            if segment_end <= self.segment_start:
+                return
+            yield from self.process_segment(segment_end)
+
+    def suffix_key(self, suffix: int) -> bytes:
+        start = suffix - self.history_start
+        return self.history[start:start + self.max_match]
+
+    def process_segment(self, segment_end: int) -> \
+            Iterator[Tuple[int, List[int], int]]:
+        from tmf.match_finder import TarsaMatchFinder
+        segment_start = self.segment_start
+        min_match = self.min_match
+        max_offset = self.max_offset
+        segment_data = array("B", self.history[
+            segment_start - self.history_start:
+            segment_end - self.history_start + self.max_match - 1])
+        segment_finder = TarsaMatchFinder(segment_data, min_match,
+                                          self.max_match, max_offset)
+        staircases = self.merge_segment(segment_end)
+        offsets = [0] * (self.max_match + 1)
+        for position in range(segment_start, segment_end):
+            current_max_match = max(
+                segment_finder.collect_matches_for_next_position(offsets),
+                min_match - 1)
+            # sources in earlier segments are farther than any in segment
+            for max_length, source in staircases[position - segment_start]:
+                offset = position - source
+                if max_offset is not None and offset > max_offset:
+                    break
+                while current_max_match < max_length:
+                    current_max_match += 1
+                    offsets[current_max_match] = offset
+            for match_length in range(min(min_match, current_max_match + 1)):
+                offsets[match_length] = 0
+            yield position, offsets, \
+                current_max_match if current_max_match >= min_match else 0
+        self.segment_start = segment_end
+        # forget input which can't be a source anymore
+        if max_offset is not None:
+            new_history_start = max(self.history_start,
+                                    segment_end - max_offset)
+            del self.history[:new_history_start - self.history_start]
+            self.history_start = new_history_start
+
+    def surviving_leaves(self, oldest_source: int) -> \
+            Iterator[Tuple[int, int]]:
+        # yields (suffix, depth shared with previous surviving leaf)
+        depth = 0
+        for leaf_suffix, leaf_depth in zip(self.leaf_suffixes,
+                                           self.leaf_depths):
+            depth = min(depth, leaf_depth)
+            if leaf_suffix >= oldest_source:
+                yield leaf_suffix, depth
+                depth = self.max_match + 1
+
+    def merge_segment(self, segment_end: int) -> List[Staircase]:
+        # returns nearest sources in earlier segments for every position in
+        # segment and replaces main trie with merged one
+        segment_start = self.segment_start
+        suffix_key = self.suffix_key
+        oldest_source = 0 if self.max_offset is None else \
+            segment_start - self.max_offset
+        segment_suffixes = sorted(range(segment_start, segment_end),
+                                  key=suffix_key)
+        # merge, older suffix goes first if prefixes are equal
+        merged_suffixes = array("q")
+        merged_depths = array("B")
+        previous_key = b""
+        previous_is_leaf = False
+        leaves = self.surviving_leaves(oldest_source)
+        next_leaf = next(leaves, None)
+        next_leaf_key = suffix_key(next_leaf[0]) if next_leaf else None
+        for segment_suffix in segment_suffixes:
+            segment_key = suffix_key(segment_suffix)
+            while next_leaf is not None and next_leaf_key <= segment_key:
+                merged_suffixes.append(next_leaf[0])
+                merged_depths.append(
+                    next_leaf[1] if previous_is_leaf else
+                    common_prefix_length(previous_key, next_leaf_key))
+                previous_key = next_leaf_key
+                previous_is_leaf = True
+                next_leaf = next(leaves, None)
+                next_leaf_key = suffix_key(next_leaf[0]) if next_leaf else None
+            merged_suffixes.append(segment_suffix)
+            merged_depths.append(
+                common_prefix_length(previous_key, segment_key))
+            previous_key = segment_key
+            previous_is_leaf = False
+        while next_leaf is not None:
+            merged_suffixes.append(next_leaf[0])
+            merged_depths.append(
+                next_leaf[1] if previous_is_leaf else
+                common_prefix_length(previous_key, next_leaf_key))
+            previous_key = next_leaf_key
+            previous_is_leaf = True
+            next_leaf = next(leaves, None)
+            next_leaf_key = suffix_key(next_leaf[0]) if next_leaf else None
+        # nearest leaves before and after every segment suffix in leaf order
+        merged_count = len(merged_suffixes)
+        staircases: List[Staircase] = [[]] * (segment_end - segment_start)
+        for ordered_indices, depth_offset in [
+                (range(merged_count), 0),
+                (range(merged_count - 1, -1, -1), 1)]:
+            stack_depths: List[int] = []
+            stack_sources: List[int] = []
+            for index in ordered_indices:
+                depth_index = index + depth_offset
+                depth = merged_depths[depth_index] \
+                    if depth_index < merged_count else 0
+                source = -1
+                while stack_depths and stack_depths[-1] > depth:
+                    stack_depths.pop()
+                    source = max(source, stack_sources.pop())
+                if source >= 0 and depth >= self.min_match:
+                    if stack_depths and stack_depths[-1] == depth:
+                        stack_sources[-1] = max(stack_sources[-1], source)
+                    else:
+                        stack_depths.append(depth)
+                        stack_sources.append(source)
+                suffix = merged_suffixes[index]
+                if suffix < segment_start:
+                    stack_depths.append(self.max_match + 1)
+                    stack_sources.append(suffix)
+                else:
+                    staircase = []
+                    source = -1
+                    for stack_index in range(len(stack_depths) - 1, -1, -1):
+                        source = max(source, stack_sources[stack_index])
+                        staircase.append((stack_depths[stack_index], source))
+                    staircase.reverse()
+                    staircases[suffix - segment_start] = merge_staircases(
+                        staircases[suffix - segment_start], staircase)
+        # new main trie, only the latest of suffixes with equal prefixes is
+        # kept, those are adjacent
+        history_end = self.history_start + len(self.history)
+        leaf_suffixes = array("q")
+        leaf_depths = array("B")
+        depth = 0
+        for index in range(merged_count):
+            depth = min(depth, merged_depths[index])
+            suffix = merged_suffixes[index]
+            key_length = min(self.max_match, history_end - suffix)
+            if index + 1 < merged_count and \
+                    merged_depths[index + 1] == key_length and \
+                    min(self.max_match,
+                        history_end - merged_suffixes[index + 1]) == \
+                    key_length:
+                continue
+            leaf_suffixes.append(suffix)
+            leaf_depths.append(depth)
+            depth = self.max_match + 1
+        self.leaf_suffixes = leaf_suffixes
+        self.leaf_depths = leaf_depths
+        return staircases
+
+
+def find_essential_matches_in_stream(
+        min_match: int, max_match: int, input_file: BinaryIO,
+        essential_matches_file: BinaryIO, progress_period: Optional[int],
+        compact: bool = False, max_offset: Optional[int] = None,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        telemetry_report: Optional[Telemetry] = None) -> None:
+    from tmf.match_finder import EssentialMatchesOutput, \
+        filter_essential_matches, inherit_offsets
+    # input size is not known until the end, so header is rewritten then
+    output = EssentialMatchesOutput(
+        "stream-matches", essential_matches_file, None, min_match, max_match,
+        progress_period, compact, max_offset,
+        telemetry_report=telemetry_report)
+    collector = output.collector
+    reporter = output.reporter
+    next_checkpoint = reporter.next_checkpoint(0)
+    # variables and match finder
+    inherited_offsets = [0] * (max_match + 1)
+    inherited_max_match = 0
+    input_size = 0
+    engine = SegmentedMatchFinderEngine(min_match, max_match, max_offset,
+                                        segment_size)
+    # main loop
+    for position, current_offsets, current_max_match in \
+            engine.offsets(input_file):
+        # filtering and outputting matches
+        collector.on_position(position)
+        filter_essential_matches(
+            position, current_offsets, current_max_match,
+            inherited_offsets, inherited_max_match, min_match, collector)
+        # inheriting matches
+        inherited_max_match = inherit_offsets(
+            current_offsets, current_max_match, inherited_offsets)
+        input_size = position + 1
+        # matches for finished segment are written out immediately
+        if input_size % segment_size == 0:
+            output.writer.flush()
+            essential_matches_file.flush()
+        # display progress status
+        if input_size == next_checkpoint:
+            next_checkpoint = reporter.on_progress(input_size)
+    collector.finish()
+    reporter.total_positions = input_size
+    reporter.finish()
+    output.header.input_size = input_size
+    output.header.validate()
+    essential_matches_file.seek(0)
+    output.header.to_file(essential_matches_file)
+    essential_matches_file.seek(0, os.SEEK_END)
+    output.finish()
+    print("Done")
@@ -0,0 +1,134 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import heapq
+import mmap
+import tempfile
+from array import array
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+# rough amount of memory used by match buffered before spill, including
+# temporary arrays created while sorting, measured peak is 52 bytes
+BUFFERED_MATCH_MEMORY = 56
+
+# number of matches read at once from every run during merge
+RUN_BLOCK_SIZE = 1 << 12
+
+# number of words written at once when filling temporary file
+FILL_CHUNK_SIZE = 1 << 16
+
+
+class MatchesSpill:
+    # matches added in arbitrary order are buffered while they fit in memory
+    # budget, then sorted by position and spilled to temporary file as
+    # a run, all runs are finally merged into a sequence sorted by position
+    def __init__(self, memory_budget: int):
+        assert memory_budget >= 1
+        self.buffer_capacity = \
+            max(RUN_BLOCK_SIZE, memory_budget // BUFFERED_MATCH_MEMORY)
+        self.positions = array("Q")
+        self.lengths_and_offsets = array("Q")
+        self.run_files: List[BinaryIO] = []
+        self.matches_count = 0
+
+    def add(self, position: int, length_and_offset: int) -> None:
+        self.positions.append(position)
+        self.lengths_and_offsets.append(length_and_offset)
+        self.matches_count += 1
+        if len(self.positions) >= self.buffer_capacity:
+            self.spill()
+
+    def sorted_buffer(self):
+        # rows of position and packed length and offset, sorted without
+        # creating objects per match
+        import numpy
+        positions = numpy.frombuffer(self.positions, dtype=numpy.uint64)
+        lengths_and_offsets = numpy.frombuffer(self.lengths_and_offsets,
+                                               dtype=numpy.uint64)
+        order = numpy.lexsort((lengths_and_offsets, positions))
+        records = numpy.empty((len(order), 2), dtype=numpy.uint64)
+        numpy.take(positions, order, out=records[:, 0], mode="clip")
+        numpy.take(lengths_and_offsets, order, out=records[:, 1],
+                   mode="clip")
+        del positions, lengths_and_offsets, order
+        self.positions = array("Q")
+        self.lengths_and_offsets = array("Q")
+        return records
+
+    def spill(self) -> None:
+        run_file = tempfile.TemporaryFile()
+        self.sorted_buffer().tofile(run_file)
+        self.run_files.append(run_file)
+
+    def merged(self) -> Iterator[Tuple[int, int]]:
+        # yields (position, packed length and offset) sorted by position and
+        # then by length, can be called only once
+        if not self.run_files:
+            records = self.sorted_buffer()
+            for block_start in range(0, len(records), RUN_BLOCK_SIZE):
+                block = array("Q", records[
+                    block_start:block_start + RUN_BLOCK_SIZE].tobytes())
+                for index in range(0, len(block), 2):
+                    yield block[index], block[index + 1]
+            return
+        if len(self.positions) > 0:
+            self.spill()
+        try:
+            yield from heapq.merge(*[read_run(run_file)
+                                     for run_file in self.run_files])
+        finally:
+            for run_file in self.run_files:
+                run_file.close()
+            self.run_files = []
+
+
+def read_run(run_file: BinaryIO) -> Iterator[Tuple[int, int]]:
+    run_file.seek(0)
+    while True:
+        records = array("Q")
+        records.frombytes(run_file.read(2 * records.itemsize *
+                                        RUN_BLOCK_SIZE))
+        if len(records) == 0:
+            return
+        for index in range(0, len(records), 2):
+            yield records[index], records[index + 1]
+
+
+def allocate_words(count: int, fill: int, memory_budget: Optional[int]) -> \
+        Union[array, memoryview]:
+    # signed 32-bit words, kept in temporary file mapped to memory if they
+    # take more than half of memory budget
+    if memory_budget is None or \
+            count * array("i").itemsize <= memory_budget // 2:
+        return array("i", [fill]) * count
+    return allocate_mapped_words(count, fill)
+
+
+def allocate_mapped_words(count: int, fill: int,
+                          typecode: str = "i") -> memoryview:
+    # array items kept in temporary file mapped to memory
+    words = array(typecode, [fill])
+    with tempfile.TemporaryFile() as words_file:
+        chunk = (words * FILL_CHUNK_SIZE).tobytes()
+        for chunk_start in range(0, count, FILL_CHUNK_SIZE):
+            chunk_size = min(FILL_CHUNK_SIZE, count - chunk_start)
+            words_file.write(chunk[:chunk_size * words.itemsize])
+        words_file.flush()
+        words_map = mmap.mmap(words_file.fileno(), count * words.itemsize)
+    # view keeps the mapping alive, file descriptor is no longer needed
+    return memoryview(words_map).cast(typecode)
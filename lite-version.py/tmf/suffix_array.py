@@ -0,0 +1,135 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+from typing import List, Tuple
+
+import numpy
+
+
+def build_suffix_array(input_data: numpy.ndarray, prefix_limit: int) -> \
+        Tuple[numpy.ndarray, List[numpy.ndarray]]:
+    # prefix doubling, suffixes are sorted only by their first prefix_limit
+    # bytes (rounded up to power of two), order of ties is unspecified
+    input_size = len(input_data)
+    prefix_ranks = [input_data.astype(numpy.int32)]
+    suffix_array = numpy.argsort(prefix_ranks[0], kind="stable")
+    prefix_length = 1
+    while prefix_length < prefix_limit and input_size > 0:
+        ranks = prefix_ranks[-1]
+        following_ranks = numpy.full(input_size, -1, dtype=numpy.int32)
+        following_ranks[:input_size - prefix_length] = ranks[prefix_length:]
+        suffix_array = numpy.lexsort((following_ranks, ranks))
+        sorted_ranks = ranks[suffix_array]
+        sorted_following_ranks = following_ranks[suffix_array]
+        rank_changes = numpy.ones(input_size, dtype=numpy.int32)
+        rank_changes[0] = 0
+        rank_changes[1:] = \
+            (sorted_ranks[1:] != sorted_ranks[:-1]) | \
+            (sorted_following_ranks[1:] != sorted_following_ranks[:-1])
+        new_ranks = numpy.empty(input_size, dtype=numpy.int32)
+        new_ranks[suffix_array] = numpy.cumsum(rank_changes, dtype=numpy.int32)
+        prefix_ranks.append(new_ranks)
+        prefix_length *= 2
+        if rank_changes.sum() == input_size - 1:
+            break
+    return suffix_array, prefix_ranks
+
+
+def build_lcp_array(suffix_array: numpy.ndarray,
+                    prefix_ranks: List[numpy.ndarray],
+                    lcp_limit: int) -> numpy.ndarray:
+    # lcp_array[i] is the length (capped at lcp_limit) of the longest common
+    # prefix of suffixes suffix_array[i - 1] and suffix_array[i]; instead of
+    # sequential Kasai scan all adjacent pairs are extended in lockstep by
+    # comparing ranks of decreasing power of two prefixes
+    input_size = len(suffix_array)
+    lcp_array = numpy.zeros(input_size, dtype=numpy.int32)
+    if input_size < 2:
+        return lcp_array
+    earlier = suffix_array[:-1].astype(numpy.int64)
+    later = suffix_array[1:].astype(numpy.int64)
+    lcp = numpy.zeros(input_size - 1, dtype=numpy.int64)
+    for level in reversed(range(len(prefix_ranks))):
+        ranks = prefix_ranks[level]
+        earlier_start = earlier + lcp
+        later_start = later + lcp
+        in_range = (earlier_start < input_size) & (later_start < input_size)
+        extended = numpy.zeros(input_size - 1, dtype=bool)
+        extended[in_range] = ranks[earlier_start[in_range]] == \
+            ranks[later_start[in_range]]
+        lcp[extended] += 1 << level
+    lcp_array[1:] = numpy.minimum(lcp, lcp_limit)
+    return lcp_array
+
+
+def find_optimal_offsets(suffix_array: numpy.ndarray,
+                         lcp_array: numpy.ndarray,
+                         match_length: int) -> numpy.ndarray:
+    # offsets[p] is the offset of optimal match of match_length bytes at
+    # position p or 0 if there is no such match
+    input_size = len(suffix_array)
+    # suffixes sharing match_length bytes form runs in suffix array
+    linked = numpy.zeros(input_size + 1, dtype=bool)
+    linked[:input_size] = lcp_array >= match_length
+    members = numpy.nonzero(linked[:-1] | linked[1:])[0]
+    offsets = numpy.zeros(input_size, dtype=numpy.int32)
+    if len(members) > 0:
+        run_ids = numpy.cumsum(~linked[members])
+        member_positions = suffix_array[members]
+        order = numpy.lexsort((member_positions, run_ids))
+        sorted_positions = member_positions[order]
+        sorted_run_ids = run_ids[order]
+        # optimal source is the nearest preceding position in the same run
+        same_run = sorted_run_ids[1:] == sorted_run_ids[:-1]
+        targets = sorted_positions[1:][same_run]
+        offsets[targets] = targets - sorted_positions[:-1][same_run]
+    return offsets
+
+
+def find_essential_matches(input_data: numpy.ndarray, min_match: int,
+                           max_match: int) -> \
+        Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    # returns columns (positions, lengths, offsets) sorted by position and
+    # then by length
+    input_size = len(input_data)
+    suffix_array, prefix_ranks = build_suffix_array(input_data, max_match)
+    lcp_array = build_lcp_array(suffix_array, prefix_ranks, max_match)
+    del prefix_ranks
+    positions_parts = []
+    lengths_parts = []
+    offsets_parts = []
+    longer_offsets = numpy.zeros(input_size, dtype=numpy.int32)
+    for match_length in range(max_match, min_match - 1, -1):
+        offsets = find_optimal_offsets(suffix_array, lcp_array, match_length)
+        # essential filter, see find_all_essential_matches
+        inherited_offsets = numpy.zeros(input_size, dtype=numpy.int32)
+        inherited_offsets[1:] = longer_offsets[:-1]
+        essential_positions = numpy.nonzero(
+            (offsets > 0) & (offsets != inherited_offsets) &
+            (offsets != longer_offsets))[0]
+        positions_parts.append(essential_positions)
+        lengths_parts.append(
+            numpy.full(len(essential_positions), match_length,
+                       dtype=numpy.int32))
+        offsets_parts.append(offsets[essential_positions])
+        longer_offsets = offsets
+    positions = numpy.concatenate(positions_parts)
+    lengths = numpy.concatenate(lengths_parts)
+    offsets = numpy.concatenate(offsets_parts)
+    order = numpy.lexsort((lengths, positions))
+    return positions[order], lengths[order], offsets[order]
@@ -0,0 +1,147 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+import contextlib
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, Optional, TextIO
+
+from tmf import validation
+
+DEFAULT_TELEMETRY_INTERVAL = 10.0
+
+# hot paths update these only when telemetry is enabled, i.e. not None
+counters: Optional[Counter] = None
+
+
+class Telemetry:
+    # emits JSON lines with progress, timings and counters
+    def __init__(self, output_file: TextIO,
+                 interval: float = DEFAULT_TELEMETRY_INTERVAL):
+        global counters
+        assert interval > 0
+        self.output_file = output_file
+        self.interval = interval
+        counters = Counter()
+
+    def close(self) -> None:
+        global counters
+        counters = None
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        if counters is not None:
+            record["counters"] = dict(counters)
+        if tracemalloc.is_tracing():
+            record["traced_memory"], record["traced_memory_peak"] = \
+                tracemalloc.get_traced_memory()
+        self.output_file.write(json.dumps(record) + "\n")
+        self.output_file.flush()
+
+
+class ProgressReporter:
+    # number of positions between clock reads
+    CHECK_PERIOD = 1 << 12
+
+    def __init__(self, stage: str, total_positions: Optional[int],
+                 progress_period: Optional[int],
+                 telemetry: Optional[Telemetry] = None,
+                 metrics: Optional[Callable[[], Dict[str, Any]]] = None):
+        assert progress_period is None or progress_period >= 1
+        self.stage = stage
+        self.total_positions = total_positions
+        self.progress_period = progress_period
+        self.telemetry = telemetry
+        self.metrics = metrics
+        self.next_progress_checkpoint = progress_period
+        self.start_wall_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        self.next_report_time = self.start_wall_time + \
+            (telemetry.interval if telemetry is not None else 0)
+        if telemetry is not None:
+            telemetry.emit(self.record("start", 0))
+
+    def next_checkpoint(self, processed: int) -> int:
+        # processed positions count for which on_progress must be called
+        # next, it's unreachable if nothing is to be reported
+        candidates = []
+        if self.next_progress_checkpoint is not None:
+            candidates.append(self.next_progress_checkpoint)
+        if self.telemetry is not None:
+            candidates.append(processed + ProgressReporter.CHECK_PERIOD)
+        return min(candidates) if candidates else -1
+
+    def on_progress(self, processed: int) -> int:
+        while self.next_progress_checkpoint is not None and \
+                self.next_progress_checkpoint <= processed:
+            print("Progress status: processed " +
+                  f"{self.next_progress_checkpoint:,}".replace(",", " ") +
+                  " positions")
+            self.next_progress_checkpoint += self.progress_period
+        if self.telemetry is not None and \
+                time.perf_counter() >= self.next_report_time:
+            self.telemetry.emit(self.record("progress", processed))
+            self.next_report_time = \
+                time.perf_counter() + self.telemetry.interval
+        return self.next_checkpoint(processed)
+
+    def finish(self) -> None:
+        print("Validation: " + validation.describe())
+        if self.telemetry is not None:
+            self.telemetry.emit(self.record("finish", self.total_positions))
+
+    def record(self, event: str, processed: int) -> Dict[str, Any]:
+        wall_seconds = time.perf_counter() - self.start_wall_time
+        speed = processed / wall_seconds if wall_seconds > 0 else None
+        record = {
+            "event": event, "stage": self.stage,
+            "positions": processed, "total_positions": self.total_positions,
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": time.process_time() - self.start_cpu_time,
+            "positions_per_second": speed,
+            "eta_seconds": (self.total_positions - processed) / speed
+            if speed and self.total_positions is not None else None,
+            "validation": validation.describe()}
+        if self.metrics is not None:
+            record.update(self.metrics())
+        return record
+
+
+@contextlib.contextmanager
+def profiled(profile_file_name: Optional[str] = None,
+             trace_memory: bool = False) -> Iterator[None]:
+    # optional cProfile statistics dump and tracemalloc tracing
+    profile = cProfile.Profile() if profile_file_name is not None else None
+    if trace_memory:
+        tracemalloc.start()
+    if profile is not None:
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(profile_file_name)
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("Peak traced memory: " + f"{peak:,}".replace(",", " ") +
+                  " bytes", file=sys.stderr)
@@ -0,0 +1,48 @@
+# Copyright (C) 2020 Piotr Tarsa ( http://github.com/tarsa )
+#
+# This software is provided 'as-is', without any express or implied
+# warranty.  In no event will the author be held liable for any damages
+# arising from the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software
+#    in a product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 3. This notice may not be removed or altered from any source distribution.
+#
+VALIDATION_LEVELS = ["off", "sampled", "full"]
+DEFAULT_VALIDATION_PERIOD = 1 << 10
+
+# costly per position sanity checks in hot paths are done only for positions
+# divisible by period, zero disables them, checks of headers and of numbers
+# of matches are always done
+period: int = 1
+
+
+def set_level(level: str,
+              sample_period: int = DEFAULT_VALIDATION_PERIOD) -> None:
+    global period
+    assert level in VALIDATION_LEVELS, "unknown validation level " + level
+    assert sample_period >= 1, "validation period must be positive"
+    period = 0 if level == "off" else \
+        sample_period if level == "sampled" else 1
+
+
+def describe() -> str:
+    if period == 0:
+        return "off"
+    elif period == 1:
+        return "full"
+    else:
+        return "sampled at 1 in " + f"{period:,}".replace(",", " ") + \
+            " positions"
+
+
+def checked(position: int) -> bool:
+    return period != 0 and position % period == 0
@@ -16,61 +16,196 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 #
+import multiprocessing
 import os
 from array import array
-from typing import BinaryIO, Optional
+from typing import BinaryIO, List, Optional, Tuple
 
+from tmf import validation
 from tmf.header import Header
 from tmf.match import Match
-from tmf.match_finder import BruteForceMatchFinder, FatHashMapMatchFinder
+from tmf.match_codec import WORD_TYPECODE, MatchesReader, count_matches, \
+    find_first_matches_at_positions, open_matches_reader
+from tmf.match_finder import RANGES_PER_JOB, ExhaustiveMatchFinder, \
+    check_jobs_supported, create_match_finder, map_input_file
+from tmf.telemetry import ProgressReporter, Telemetry
 
 
 def verify(match_finder_name: str,
            input_file: BinaryIO, interpolated_matches_file: BinaryIO,
-           progress_period: Optional[int]) -> None:
+           progress_period: Optional[int],
+           use_memory_map: bool = False, jobs: int = 1,
+           telemetry_report: Optional[Telemetry] = None) -> None:
+    assert jobs >= 1
+    check_jobs_supported(match_finder_name, jobs)
+    if jobs > 1:
+        verify_in_parallel(match_finder_name, input_file,
+                           interpolated_matches_file, progress_period, jobs,
+                           telemetry_report)
+        return
     # read input file
     input_file_size = os.path.getsize(input_file.name)
     input_data = array("B")
     input_data.fromfile(input_file, input_file_size)
     assert len(input_data) == input_file_size
     # read and validate interpolated matches file header
-    header = Header.from_file(interpolated_matches_file)
-    header.validate()
+    if use_memory_map:
+        from tmf.match_file import MatchFile
+        interpolated_matches = MatchFile(interpolated_matches_file)
+        header = interpolated_matches.header
+        interpolated_matches_reader = interpolated_matches.reader()
+    else:
+        header, interpolated_matches_reader = \
+            open_matches_reader(interpolated_matches_file)
     assert header.is_for_interpolated_matches()
     assert len(input_data) == header.input_size
-    # variables and match finder
-    current_offsets = [0] * (header.max_match + 1)
-    if match_finder_name == "bfmf":
-        match_finder = BruteForceMatchFinder(input_data, header.min_match,
-                                             header.max_match)
-    elif match_finder_name == "hmmf":
-        match_finder = FatHashMapMatchFinder(input_data, header.min_match,
-                                             header.max_match)
-    else:
-        raise ValueError("Unknown match finder: " + match_finder_name)
-    assert progress_period is None or progress_period >= 1
-    next_progress_checkpoint = progress_period
     # match verification logic
-    matches_read = 0
+    match_finder = create_match_finder(match_finder_name, input_data,
+                                       header.min_match, header.max_match,
+                                       header.max_offset)
+    reporter = ProgressReporter("verify", input_file_size, progress_period,
+                                telemetry_report)
+    verify_positions(match_finder, interpolated_matches_reader, 0,
+                     input_file_size, reporter)
+    assert not interpolated_matches_reader.has_next(), \
+        "no further data expected in interpolated matches file"
+    reporter.finish()
+    print("Verification OK")
+
+
+def verify_positions(match_finder: ExhaustiveMatchFinder,
+                     interpolated_matches_reader: MatchesReader,
+                     start_position: int, end_position: int,
+                     reporter: Optional[ProgressReporter],
+                     matches_read_before: int = 0) -> int:
+    min_match = match_finder.min_match
+    max_match = match_finder.max_match
+    current_offsets = [0] * (max_match + 1)
+    match_finder.skip_to_position(start_position)
+    next_checkpoint = reporter.next_checkpoint(start_position) \
+        if reporter is not None else None
+    matches_read = matches_read_before
+    # lengths of expected matches are the same at every position
+    expected_lengths = array(WORD_TYPECODE, range(max_match + 1))
     try:
-        for position in range(input_file_size):
+        for position in range(start_position, end_position):
             current_max_match = \
                 match_finder.collect_matches_for_next_position(current_offsets)
-            for match_length in range(header.min_match, current_max_match + 1):
-                input_match = Match.from_file(interpolated_matches_file)
-                input_match.validate(header.min_match, header.max_match)
-                assert input_match.position == position
-                assert input_match.length == match_length
-                assert input_match.offset == current_offsets[match_length]
-                matches_read += 1
+            start, end = interpolated_matches_reader.read_run(position)
+            lengths = interpolated_matches_reader.lengths
+            offsets = interpolated_matches_reader.offsets
+            expected_count = max(current_max_match - min_match + 1, 0)
+            if end - start != expected_count or \
+                    lengths[start:end] != \
+                    expected_lengths[min_match:min_match + expected_count] or \
+                    offsets[start:end].tolist() != \
+                    current_offsets[min_match:min_match + expected_count]:
+                # locating first mismatching match
+                for index in range(start, start + expected_count):
+                    assert index < end, "missing match at position " + \
+                        str(position)
+                    assert lengths[index] == index - start + min_match
+                    assert offsets[index] == \
+                        current_offsets[lengths[index]]
+                    matches_read += 1
+                raise AssertionError("unexpected match at position " +
+                                     str(position))
+            matches_read += expected_count
             # display progress status
-            if position + 1 == next_progress_checkpoint:
-                print("Progress status: processed " +
-                      f"{position + 1:,}".replace(",", " ") + " positions")
-                next_progress_checkpoint += progress_period
+            if position + 1 == next_checkpoint:
+                next_checkpoint = reporter.on_progress(position + 1)
     except Exception as e:
         raise ValueError("problem after reading " + str(matches_read) +
                          " matches") from e
-    assert input_file.read(1) == b"", \
-        "no further data expected in interpolated matches file"
+    return matches_read
+
+
+# (start position, end position, start match index, end match index)
+PositionsRange = Tuple[int, int, int, int]
+
+
+def split_into_ranges(interpolated_matches_file: BinaryIO, header: Header,
+                      matches_count: int,
+                      ranges_count: int) -> List[PositionsRange]:
+    input_size = header.input_size
+    boundaries = sorted(set(input_size * index // ranges_count
+                            for index in range(ranges_count + 1)))
+    indices = find_first_matches_at_positions(
+        interpolated_matches_file, header, matches_count, boundaries)
+    return [(boundaries[index], boundaries[index + 1],
+             indices[index], indices[index + 1])
+            for index in range(len(boundaries) - 1)]
+
+
+def verify_range(match_finder_name: str, input_file_name: str,
+                 interpolated_matches_file_name: str, header: Header,
+                 positions_range: PositionsRange,
+                 validation_period: int) -> Optional[str]:
+    start_position, end_position, start_index, end_index = positions_range
+    validation.period = validation_period
+    with map_input_file(input_file_name) as input_data, \
+            open(interpolated_matches_file_name, "rb") as \
+            interpolated_matches_file:
+        interpolated_matches_file.seek(
+            header.size_on_disk() + Match.SIZE_ON_DISK * start_index)
+        interpolated_matches_reader = MatchesReader(
+            interpolated_matches_file, end_index - start_index)
+        try:
+            match_finder = create_match_finder(
+                match_finder_name, input_data, header.min_match,
+                header.max_match, header.max_offset)
+            verify_positions(match_finder, interpolated_matches_reader,
+                             start_position, end_position, None, start_index)
+            assert not interpolated_matches_reader.has_next(), \
+                "matches outside of verified positions range"
+        except Exception as e:
+            # tracebacks don't survive pickling, so pass description instead
+            return str(e) + (": " + repr(e.__cause__)
+                             if e.__cause__ is not None else "")
+    return None
+
+
+def verify_range_star(arguments: tuple) -> Optional[str]:
+    return verify_range(*arguments)
+
+
+def verify_in_parallel(match_finder_name: str,
+                       input_file: BinaryIO,
+                       interpolated_matches_file: BinaryIO,
+                       progress_period: Optional[int], jobs: int,
+                       telemetry_report: Optional[Telemetry] = None) -> None:
+    # read and validate interpolated matches file header
+    interpolated_matches_file.seek(0)
+    header = Header.from_file(interpolated_matches_file)
+    header.validate()
+    assert header.is_for_interpolated_matches()
+    assert not header.is_compact(), \
+        "parallel verification requires fixed size match records"
+    input_file_size = os.path.getsize(input_file.name)
+    assert input_file_size == header.input_size
+    matches_count = count_matches(interpolated_matches_file, header)
+    # split positions into ranges
+    positions_ranges = split_into_ranges(
+        interpolated_matches_file, header, matches_count,
+        jobs * RANGES_PER_JOB)
+    reporter = ProgressReporter("verify", input_file_size, progress_period,
+                                telemetry_report)
+    # ranges are verified concurrently, but results are collected in order,
+    # so the first reported problem is the one with lowest position
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.imap(
+            verify_range_star,
+            [(match_finder_name, input_file.name,
+              interpolated_matches_file.name, header, positions_range,
+              validation.period)
+             for positions_range in positions_ranges])
+        for (start_position, end_position, _, _), error in \
+                zip(positions_ranges, results):
+            if error is not None:
+                pool.terminate()
+                raise ValueError("problem in positions range starting at " +
+                                 str(start_position) + ": " + error)
+            # display progress status
+            reporter.on_progress(end_position)
+    reporter.finish()
     print("Verification OK")